@@ -54,13 +54,31 @@ export interface BedrockModel {
   cost: {
     input_1k_price: number;
     output_1k_price: number;
+    /**
+     * Price of 1,000 prompt-cache read tokens. Defaults to input_1k_price
+     */
+    cache_read_1k_price?: number;
+    /**
+     * Price of 1,000 prompt-cache write tokens. Defaults to input_1k_price
+     */
+    cache_write_1k_price?: number;
   };
   default?: boolean;
   maxTokens: number;
+  /**
+   * Context window of the model in tokens. When set, requests that would not fit are
+   * trimmed (oldest turns first) before being sent
+   */
+  contextWindow?: number;
   vision?: boolean;
   document?: boolean;
   tool?: boolean;
   streaming?: boolean;
+  /**
+   * Send attachments larger than ATTACHMENT_S3_THRESHOLD_MB by S3 reference (s3Location)
+   * instead of inline bytes. Only for models supporting S3 locations in Converse
+   */
+  s3Attachments?: boolean;
   /**
    * Reasoning/thinking capability configuration.
    *
@@ -88,6 +106,11 @@ export interface SystemConfig {
   max_content_size_mb_parameter: string;
   default_aws_region: string;
   prefix: string;
+  /**
+   * Minimum and maximum number of ECS tasks of the autoscaling policies. Default to 2 and 10
+   */
+  min_tasks?: number;
+  max_tasks?: number;
   bedrock_models: BedrockModels;
 }
 
@@ -128,3 +151,7 @@ export function getConfig(): SystemConfig {
 }
 
 export const config: SystemConfig = getConfig();
+
+// CloudWatch namespace of the custom metrics published by the application,
+// passed to the containers and used by the scaling policies
+export const METRICS_NAMESPACE = "FoundationalLlmChat";
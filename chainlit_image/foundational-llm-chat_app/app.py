@@ -1,59 +1,244 @@
 """
 Main application for Foundational LLM Chat.
 """
-import chainlit as cl
-from typing import Dict, List, Any, Optional
-import boto3
-from botocore.config import Config
-from botocore.exceptions import ClientError
-from chainlit.input_widget import Switch, Slider, TextInput, Select
+import asyncio
 import sys
 import os
 import logging
 import json
-import re
-from mcp import ClientSession
+import time
+from typing import Dict, List, Any, Optional, TYPE_CHECKING
 
 # Add the current directory to the Python path
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-# Import system strings
-from system_strings import suported_file_string
+# Measure startup so new tasks can be tuned to pass health checks quickly
+from utils.startup_timer import StartupTimer
+startup_timer = StartupTimer()
 
-# Import configuration
-from config.app_config import AppConfig
+with startup_timer.phase("chainlit"):
+    import chainlit as cl
+    from chainlit.input_widget import Switch, Slider, TextInput, Select, MultiSelect
+    from botocore.exceptions import ClientError
+    from chainlit.server import app as server_app
+    from fastapi.responses import JSONResponse
 
-# Import services
-from services.thinking_service import ThinkingService
-from services.content_service import ContentService
+if TYPE_CHECKING:
+    from mcp import ClientSession
 
-# Import utilities
-from utils.message_utils import (
-    create_content, create_image_content, create_doc_content, 
-    extract_and_process_prompt
-)
+with startup_timer.phase("app_modules"):
+    # Import system strings
+    from system_strings import suported_file_string
+
+    # Import configuration
+    from config.app_config import AppConfig
+
+    # Import services
+    from services.thinking_service import ThinkingService, ThrottledStreamWriter
+    from services.content_service import ContentService
+    from services.bedrock_client_service import create_client_factory
+    from services.metrics_service import MetricsService
+    from services.usage_service import UsageLedger, LogUsageSink, MetricsUsageSink
+    from services.request_service import (
+        compile_capabilities, build_request_template, build_request, default_max_tokens,
+        DEFAULT_REASONING_BUDGET, DEFAULT_REASONING_EFFORT,
+    )
+    from services.token_service import TokenEstimator, get_model_family
+    from services.output_filter_service import create_output_filter
+    from services.compare_service import run_profile, filter_content_for_model, format_summary
+    from services.router_service import RequestRouter, strip_reasoning
+    from services.compaction_service import ConversationCompactor
+    from services.upload_service import UploadTracker
+    from services.load_service import LoadMonitor
+    from services.stall_service import StallDetector
+    from services.tool_result_service import ToolResultFormatter
+    from services.tool_schema_service import ToolSchemaCache
+
+    # Import utilities
+    from utils.message_utils import (
+        create_content, create_image_content, create_doc_content, 
+        extract_and_process_prompt
+    )
+    from utils.conversation_history import ConversationHistory
+    from utils.log_utils import configure_log_events, log_event
 
 # Configure logging
-import logging
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO)
 
-# Load configuration
-aws_config = AppConfig.load_aws_config()
-system_prompt_list = AppConfig.load_system_prompts()
-content_limits = AppConfig.load_content_limits()
-data_layer_config = AppConfig.load_data_layer_config()
-bedrock_models = AppConfig.load_bedrock_models()
+# Load configuration: parsed and validated once, shared by every session
+with startup_timer.phase("config"):
+    aws_config = AppConfig.load_aws_config()
+    system_prompt_list = AppConfig.load_system_prompts()
+    content_limits = AppConfig.load_content_limits()
+    data_layer_config = AppConfig.load_data_layer_config()
+    bedrock_models = AppConfig.load_bedrock_models()
+    model_capabilities = compile_capabilities(bedrock_models)
+    usage_config = AppConfig.load_usage_config()
+    metrics_config = AppConfig.load_metrics_config()
+    output_filter_config = AppConfig.load_output_filter_config()
+    thinking_config = AppConfig.load_thinking_config()
+    compare_config = AppConfig.load_compare_config()
+    router_config = AppConfig.load_router_config()
+    compaction_config = AppConfig.load_compaction_config()
+    attachment_config = AppConfig.load_attachment_config()
+    preprocessing_config = AppConfig.load_preprocessing_config()
+    upload_config = AppConfig.load_upload_config()
+    session_state_config = AppConfig.load_session_state_config()
+    readiness_config = AppConfig.load_readiness_config()
+    stall_config = AppConfig.load_stall_config()
+    log_event_config = AppConfig.load_log_event_config()
+    replay_config = AppConfig.load_replay_config()
+    tool_result_config = AppConfig.load_tool_result_config()
+    tool_schema_config = AppConfig.load_tool_schema_config()
+    openai_api_config = AppConfig.load_openai_api_config()
+    configure_log_events(log_event_config["max_chars"], log_event_config["sample_rates"])
 
 # Initialize services
-content_service = ContentService(
-    max_chars=content_limits["max_chars"],
-    max_size_mb=content_limits["max_content_size_mb"]
-)
+with startup_timer.phase("services"):
+    content_service = ContentService(
+        max_chars=content_limits["max_chars"],
+        max_size_mb=content_limits["max_content_size_mb"]
+    )
+    metrics_service = MetricsService(
+        namespace=metrics_config["namespace"],
+        enabled=metrics_config["enabled"]
+    )
+    usage_ledger = UsageLedger(
+        bedrock_models,
+        sink=MetricsUsageSink(metrics_service) if usage_config["sink"] == "metrics" else LogUsageSink(),
+        flush_interval=usage_config["flush_interval"],
+        daily_budget=usage_config["daily_budget"]
+    )
+    token_estimator = TokenEstimator()
+    # Active streams, queued requests, event loop lag and memory headroom of the task
+    load_monitor = LoadMonitor(
+        max_active_streams=readiness_config["max_active_streams"],
+        max_queued_requests=readiness_config["max_queued_requests"],
+        max_loop_lag_ms=readiness_config["max_loop_lag_ms"],
+        min_memory_headroom_mb=readiness_config["min_memory_headroom_mb"],
+        publish_interval=readiness_config["publish_interval"],
+        metrics_service=metrics_service
+    )
+    # Uploaded files of every session, removed at session end or after a TTL
+    upload_tracker = UploadTracker(
+        quota_mb=upload_config["quota_mb"],
+        ttl=upload_config["ttl"],
+        reap_interval=upload_config["reap_interval"],
+        metrics_service=metrics_service
+    )
+    # MCP tool results bounded per tool, binary results sent as native blocks
+    tool_result_formatter = ToolResultFormatter(
+        max_text_chars=tool_result_config["max_chars"],
+        tool_limits=tool_result_config["tool_limits"],
+        metrics_service=metrics_service
+    )
+    # MCP tool specs and input validators, shared by the sessions connected to the same server
+    tool_schema_cache = ToolSchemaCache(max_entries=tool_schema_config["cache_size"])
+    # Blocking calls stalling the event loop, with a sample of their stacks
+    stall_detector = None
+    if stall_config["enabled"]:
+        stall_detector = StallDetector(
+            threshold_ms=stall_config["threshold_ms"],
+            sample_rate=stall_config["sample_rate"],
+            metrics_service=metrics_service
+        )
+    # Optional routing of simple requests to a fast profile
+    request_router = None
+    if router_config["fast_profile"] in bedrock_models and not bedrock_models[router_config["fast_profile"]].streaming:
+        # Routed requests follow the streaming setting of the chat profile
+        logger.error(f"ROUTER_FAST_PROFILE {router_config['fast_profile']} does not support streaming: routing disabled")
+    elif router_config["fast_profile"] in bedrock_models:
+        request_router = RequestRouter(router_config["fast_profile"], max_chars=router_config["max_chars"])
+    elif router_config["fast_profile"]:
+        logger.error(f"ROUTER_FAST_PROFILE {router_config['fast_profile']} is not a configured profile: routing disabled")
+    # Background compaction of long conversations, created on first use
+    compactor = None
+    if compaction_config["profile"] and compaction_config["profile"] not in bedrock_models:
+        logger.error(f"COMPACTION_PROFILE {compaction_config['profile']} is not a configured profile: compaction disabled")
+        compaction_config["profile"] = None
 
 # Define supported file string
 suported_file_string = "Supported file types: JPEG, PNG, GIF, WEBP, PDF, CSV, XLSX, XLS, DOCX, DOC, TXT, HTML, MD"
 
+# Liveness and load-aware readiness. Chainlit serves its UI on a catch-all
+# route, so these routes are moved in front of it
+
+@server_app.get("/healthz")
+async def healthz():
+    """Liveness: the process answers (used by the load balancer health check)"""
+    return JSONResponse({"status": "ok"})
+
+@server_app.get("/readyz")
+async def readyz():
+    """Readiness: fails with 503 while the task is saturated"""
+    snapshot = load_monitor.snapshot()
+    return JSONResponse(snapshot, status_code=200 if snapshot["ready"] else 503)
+
+# OpenAI-compatible chat completions for machine clients: same profiles, request
+# building, output filters and usage accounting as the chat, authenticated with
+# the token of the UI, without a Chainlit session per request
+if openai_api_config["enabled"]:
+    with startup_timer.phase("openai_api"):
+        from fastapi import Depends, HTTPException, Request
+        from fastapi.responses import StreamingResponse
+        from chainlit.auth import reuseable_oauth, require_login
+        from chainlit.auth.jwt import decode_jwt
+        from services.batch_service import fetch_system_prompts
+        from services.openai_service import ChatCompletionsService, ChatCompletionError
+        chat_completions_service = ChatCompletionsService(
+            bedrock_models,
+            model_capabilities,
+            client_factory=lambda region_name: create_bedrock_client(region_name),
+            system_prompt_loader=lambda: fetch_system_prompts(
+                bedrock_models, system_prompt_list, lambda: create_bedrock_client(None, 'bedrock-agent')
+            ),
+            output_filter_factory=lambda has_tools: create_output_filter(has_tools, output_filter_config["redaction_patterns"]),
+            usage_ledger=usage_ledger,
+            load_monitor=load_monitor,
+            max_concurrency=openai_api_config["max_concurrency"]
+        )
+
+    async def api_user(token: Optional[str] = Depends(reuseable_oauth)) -> str:
+        """Identifier of the API caller: the JWT is verified locally, without a data layer round trip"""
+        if not require_login():
+            return "anonymous"
+        try:
+            return decode_jwt(token).identifier
+        except Exception:
+            raise HTTPException(status_code=401, detail="Invalid authentication token")
+
+    @server_app.get("/v1/models")
+    async def list_models(user: str = Depends(api_user)):
+        """The chat profiles, as OpenAI models"""
+        return JSONResponse(chat_completions_service.list_models())
+
+    @server_app.post("/v1/chat/completions")
+    async def chat_completions(request: Request, user: str = Depends(api_user)):
+        """OpenAI-style chat completion, streamed as server-sent events when requested"""
+        try:
+            body = await request.json()
+        except ValueError:
+            body = None
+        try:
+            if not isinstance(body, dict):
+                raise ChatCompletionError("The request body must be a JSON object")
+            if body.get("stream"):
+                return StreamingResponse(
+                    await chat_completions_service.stream(body, user),
+                    media_type="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+                )
+            return JSONResponse(await chat_completions_service.complete(body, user))
+        except ChatCompletionError as e:
+            return JSONResponse(e.body, status_code=e.status)
+
+api_routes = ("/v1/models", "/v1/chat/completions") if openai_api_config["enabled"] else ()
+for route_path in ("/healthz", "/readyz") + api_routes:
+    route = next(route for route in server_app.router.routes if getattr(route, "path", None) == route_path)
+    server_app.router.routes.remove(route)
+    server_app.router.routes.insert(0, route)
+
 @cl.oauth_callback
 def oauth_callback(
     provider_id: str,
@@ -63,18 +248,331 @@ def oauth_callback(
 ) -> Optional[cl.User]:
     return default_user
 
-# TODO: add data persistence when fixed by chainlit
-# import chainlit.data as cl_data
-# from chainlit.data.dynamodb import DynamoDBDataLayer
-# from chainlit.data.storage_clients import S3StorageClient
-# if(data_layer_config["s3_bucket"] and data_layer_config["dynamodb_table"]):
-#     storage_client = S3StorageClient(bucket=data_layer_config["s3_bucket"])
-#     cl_data._data_layer = DynamoDBDataLayer(
-#         table_name=data_layer_config["dynamodb_table"], 
-#         storage_provider=storage_client
-#     )
-
-async def generate_conversation(bedrock_client=None, model_id=None, input_text=None, max_tokens=1000, images=None, docs=None):
+# Data persistence: conversation and element writes are queued and written
+# behind the response (batched DynamoDB writes, multipart S3 uploads)
+data_layer = None
+if data_layer_config["dynamodb_table"] and data_layer_config["s3_bucket"]:
+    with startup_timer.phase("data_layer"):
+        # Imported only when persistence is configured: it pulls in boto3
+        from services.persistence_service import create_data_layer
+        data_layer = create_data_layer(data_layer_config, aws_config["region_name"])
+
+# Session state kept in an external store: conversations survive task
+# replacements and are resumed by whichever task receives the reconnect
+session_state = None
+if session_state_config["backend"] != "none":
+    with startup_timer.phase("session_state"):
+        from services.session_state_service import SessionStateError, create_session_state_manager, state_key
+        session_state = create_session_state_manager(session_state_config, aws_config["region_name"])
+    if session_state is None:
+        logger.error(f"Unknown SESSION_STATE_BACKEND {session_state_config['backend']}: session state kept in memory")
+
+# Session values written to the session state store (MCP connections are
+# re-established by the client on reconnect, so their tools are not stored)
+SESSION_STATE_FIELDS = (
+    "total_cost", "tool_history", "system_prompt", "streaming", "max_tokens", "costs", "precision",
+    "temperature", "thinking_enabled", "reasoning_effort", "reasoning_budget", "interleaved_thinking",
+    "preprocess_documents", "compare_profiles",
+)
+
+# Optional local pre-processing of HTML, CSV, XLSX and Markdown documents
+document_preprocessor = None
+if preprocessing_config["enabled"]:
+    from services.preprocessing_service import DocumentPreprocessor
+    document_preprocessor = DocumentPreprocessor(max_workers=preprocessing_config["workers"])
+
+# Large attachments are sent by S3 reference to the models supporting it
+attachment_transport = None
+if attachment_config["s3_bucket"] and any(model.s3_attachments for model in bedrock_models.values()):
+    with startup_timer.phase("attachment_transport"):
+        from services.attachment_service import create_attachment_transport
+        attachment_transport = create_attachment_transport(attachment_config, aws_config["region_name"])
+    if attachment_transport:
+        token_estimator.reference_size = attachment_transport.size_of
+
+if data_layer:
+    @cl.data_layer
+    def get_data_layer():
+        return data_layer
+
+def get_all_tools():
+    """Bedrock tool specifications of every MCP connection of the session"""
+    mcp_tools = cl.user_session.get("mcp_tools", {})
+    all_tools = []
+    for connection_data in mcp_tools.values():
+        all_tools.extend(connection_data["tools"])
+    return all_tools
+
+def create_response_filter():
+    """Output filter pipeline of a model response (one per response)"""
+    # Models may return empty text with tool calls: suppress it when tools are available
+    mcp_tools = cl.user_session.get("mcp_tools", {})
+    has_tools = any(len(conn_data["tools"]) > 0 for conn_data in mcp_tools.values())
+    return create_output_filter(has_tools, output_filter_config["redaction_patterns"])
+
+def get_request_template():
+    """
+    Get the session request template, building it if needed.
+    The template is invalidated by settings updates and MCP connection changes.
+    """
+    template = cl.user_session.get("request_template")
+    if template is None:
+        template = build_request_template(
+            cl.user_session.get("capabilities"),
+            {
+                "thinking_enabled": cl.user_session.get("thinking_enabled"),
+                "temperature": cl.user_session.get("temperature"),
+                "reasoning_effort": cl.user_session.get("reasoning_effort", "medium"),
+                "reasoning_budget": cl.user_session.get("reasoning_budget"),
+                "interleaved_thinking": cl.user_session.get("interleaved_thinking", False),
+                "max_tokens": cl.user_session.get("max_tokens"),
+                "system_prompt": cl.user_session.get("system_prompt"),
+            },
+            get_all_tools()
+        )
+        cl.user_session.set("request_template", template)
+        logger.debug("Built request template")
+    return template
+
+# Bedrock clients of the chat and the chat completions API (thread-safe creation)
+create_bedrock_client = create_client_factory(aws_config, replay_config)
+
+def warm_bedrock_client(bedrock_client):
+    """
+    Open the client connection (DNS, TLS, credentials) with a non-billable request.
+    The request is expected to be rejected: only the connection matters.
+    """
+    try:
+        bedrock_client.get_async_invoke(
+            invocationArn=f"arn:aws:bedrock:{bedrock_client.meta.region_name}:000000000000:async-invoke/prewarm"
+        )
+    except ClientError:
+        pass
+    except Exception as e:
+        logger.debug(f"Bedrock connection pre-warm failed: {e}")
+
+async def prewarm_session(model_info):
+    """Create and warm the Bedrock client of the session, in the background of the chat start"""
+    start_time = time.perf_counter()
+    try:
+        bedrock_client = await asyncio.to_thread(create_bedrock_client, model_info.region_name)
+        cl.user_session.set("bedrock_runtime", bedrock_client)
+        await asyncio.to_thread(warm_bedrock_client, bedrock_client)
+        logger.debug(f"Pre-warmed Bedrock connection in {(time.perf_counter() - start_time) * 1000:.0f} ms")
+    except Exception as e:
+        logger.error(f"Error creating the Bedrock client: {e}")
+
+async def wait_for_prewarm(model_info):
+    """
+    Wait for the session pre-warm (immediate once it is done). The pre-warm is
+    only an optimization: the client is created here if it failed
+    """
+    prewarm_task = cl.user_session.get("prewarm_task")
+    if prewarm_task:
+        await prewarm_task
+    if cl.user_session.get("bedrock_runtime") is None:
+        bedrock_client = await asyncio.to_thread(create_bedrock_client, model_info.region_name)
+        cl.user_session.set("bedrock_runtime", bedrock_client)
+
+def record_ttft(model_info):
+    """Publish the time to first token of the turn, the first turn of a chat apart"""
+    turn_start = cl.user_session.get("turn_start")
+    if turn_start is None:
+        return
+    # Only once per turn (tool follow-ups are not measured)
+    cl.user_session.set("turn_start", None)
+    first_turn = not cl.user_session.get("first_turn_done")
+    cl.user_session.set("first_turn_done", True)
+    ttft_ms = (time.perf_counter() - turn_start) * 1000
+    logger.debug(f"Time to first token ({'first' if first_turn else 'later'} turn): {ttft_ms:.0f} ms")
+    metrics_service.put_metrics(
+        {"TimeToFirstToken": ttft_ms},
+        dimensions={"Profile": model_info.name, "Turn": "first" if first_turn else "later"},
+        units={"TimeToFirstToken": "Milliseconds"}
+    )
+
+def get_compactor():
+    """Conversation compactor, shared by every session"""
+    global compactor
+    if compactor is None:
+        model_info = bedrock_models[compaction_config["profile"]]
+        compactor = ConversationCompactor(
+            create_bedrock_client(model_info.region_name),
+            model_info.id,
+            threshold_messages=compaction_config["threshold_messages"],
+            keep_messages=compaction_config["keep_messages"]
+        )
+    return compactor
+
+def schedule_compaction():
+    """Summarize the oldest turns of a long conversation in the background, while the user is idle"""
+    if not compaction_config["profile"]:
+        return
+    task = cl.user_session.get("compaction_task")
+    if task and not task.done():
+        return
+    history = cl.user_session.get("message_history")
+    if not get_compactor().should_compact(history):
+        return
+    snapshot = history.snapshot()
+    user = get_user_identifier()
+    
+    async def run():
+        try:
+            result = await get_compactor().compact(snapshot)
+            if result:
+                usage_ledger.record(user, compaction_config["profile"], result.usage)
+                cl.user_session.set("compaction_result", result)
+        except Exception as e:
+            logger.error(f"Conversation compaction failed: {e}")
+    
+    cl.user_session.set("compaction_task", asyncio.create_task(run()))
+
+def schedule_state_save():
+    """Write the changes of the turn to the session state store, behind the response"""
+    if session_state is None or cl.user_session.get("state_save_failed"):
+        return
+    # Keyed by user as well: the session ID is supplied by the client
+    key = state_key(get_user_identifier(), cl.user_session.get("id"))
+    history = cl.user_session.get("message_history").snapshot()
+    fields = {name: cl.user_session.get(name) for name in SESSION_STATE_FIELDS}
+    previous_task = cl.user_session.get("state_save_task")
+    
+    async def run():
+        # Writes of the same session are applied in order
+        if previous_task:
+            await asyncio.gather(previous_task, return_exceptions=True)
+        try:
+            marker = await session_state.save(key, history, fields, cl.user_session.get("state_marker"))
+            cl.user_session.set("state_marker", marker)
+        except SessionStateError as e:
+            # Retrying would fail on every turn: stop saving the session, and drop
+            # the stale state so a reconnect does not resume an older conversation
+            logger.error(f"Session state rejected by the store, no longer saved: {e}")
+            cl.user_session.set("state_save_failed", True)
+            try:
+                await session_state.delete(key)
+            except Exception as e:
+                logger.error(f"Error deleting session state: {e}")
+        except Exception as e:
+            # Transient: the next turn writes the changes since the last saved one
+            logger.error(f"Error saving session state: {e}")
+    
+    cl.user_session.set("state_save_task", asyncio.create_task(run()))
+
+async def hydrate_session():
+    """Restore a conversation started on another task, on the first message after a reconnect"""
+    task = cl.user_session.get("state_load_task")
+    if task is None:
+        return
+    cl.user_session.set("state_load_task", None)
+    try:
+        stored = await task
+    except Exception as e:
+        logger.error(f"Error loading session state: {e}")
+        return
+    if stored is None or len(cl.user_session.get("message_history")):
+        return
+    history, fields, marker = stored
+    cl.user_session.set("message_history", history)
+    for name, value in fields.items():
+        if name in SESSION_STATE_FIELDS:
+            cl.user_session.set(name, value)
+    cl.user_session.set("state_marker", marker)
+    cl.user_session.set("token_cache", {})
+    cl.user_session.set("request_template", None)
+    logger.debug(f"Restored session state: {len(history)} messages")
+
+def apply_compaction():
+    """Swap a finished compaction into the history (never waits for a running one)"""
+    result = cl.user_session.get("compaction_result")
+    if result is None:
+        return
+    cl.user_session.set("compaction_result", None)
+    compacted = ConversationCompactor.apply(cl.user_session.get("message_history"), result)
+    if compacted is None:
+        logger.debug("Discarding stale conversation compaction")
+        return
+    cl.user_session.set("message_history", compacted)
+    # Estimates of the summarized messages are not needed anymore
+    cl.user_session.set("token_cache", {})
+    logger.debug(f"Compacted {result.cut} messages into a summary")
+
+def get_profile_request_template(profile):
+    """
+    Request template of another profile answering on behalf of the chat profile
+    (compare mode, routed requests): no tools, and reasoning only for models where
+    it cannot be disabled.
+    """
+    capabilities = model_capabilities[profile]
+    return build_request_template(
+        capabilities,
+        {
+            "thinking_enabled": capabilities.openai_reasoning,
+            "temperature": cl.user_session.get("temperature"),
+            "reasoning_effort": cl.user_session.get("reasoning_effort", "medium"),
+            "max_tokens": min(int(cl.user_session.get("max_tokens")), capabilities.max_tokens),
+            "system_prompt": cl.user_session.get("system_prompt"),
+        },
+        []
+    )
+
+async def preflight_check(api_params, msg=None, profile=None):
+    """
+    Estimate the request size locally before dispatching it.
+    Trims the oldest turns of the request if it would not fit the context window
+    of the profile (the chat profile by default) and shows the predicted cost on
+    msg when costs are enabled.
+
+    Returns:
+        int: The estimated input tokens of the request.
+    """
+    estimated_input, message_tokens = token_estimator.estimate_request(
+        api_params, cl.user_session.get("token_cache")
+    )
+    max_tokens = api_params["inferenceConfig"]["maxTokens"]
+    profile = profile or cl.user_session.get("chat_profile")
+    context_window = model_capabilities[profile].context_window
+    
+    if context_window and estimated_input + max_tokens > context_window:
+        messages = api_params["messages"]
+        fixed_tokens = estimated_input - sum(message_tokens)
+        trim_index = TokenEstimator.find_trim_index(
+            messages, message_tokens, context_window - max_tokens - fixed_tokens
+        )
+        if trim_index >= len(messages):
+            raise ValueError(
+                f"The request (~{estimated_input} tokens) does not fit the context window of "
+                f"{context_window} tokens with {max_tokens} maximum output tokens. "
+                "Reduce the attachments or the maximum tokens."
+            )
+        # Only the request is trimmed: the session history is left untouched
+        api_params["messages"] = messages[trim_index:]
+        estimated_input -= sum(message_tokens[:trim_index])
+        logger.info(f"Trimmed {trim_index} oldest messages to fit the context window")
+        await cl.Message(
+            content=f"⚠️ The conversation is too long: the {trim_index} oldest messages are not sent to the model."
+        ).send()
+    
+    if msg is not None and cl.user_session.get("costs"):
+        price_table = usage_ledger.price_tables.get(profile)
+        if price_table:
+            precision = cl.user_session.get("precision")
+            input_cost = price_table.cost({"inputTokenCount": estimated_input})
+            max_cost = input_cost + price_table.cost({"outputTokenCount": max_tokens})
+            msg.elements = (msg.elements or []) + [
+                cl.Text(
+                    name="Predicted cost",
+                    content=f"Predicted cost: {input_cost:.{precision}f}$ (input, ~{estimated_input} tokens) "
+                            f"up to {max_cost:.{precision}f}$",
+                    display="inline"
+                )
+            ]
+            await msg.update()
+    
+    return estimated_input
+
+async def generate_conversation(bedrock_client=None, model_id=None, input_text=None, max_tokens=1000, images=None, docs=None, msg=None, routed_profile=None):
     """
     Sends messages to a model.
     Args:
@@ -84,12 +582,12 @@ async def generate_conversation(bedrock_client=None, model_id=None, input_text=N
         max_tokens (int): Maximum tokens to generate.
         images (list): List of images to include.
         docs (list): List of documents to include.
+        msg (cl.Message): Message of the answer, used to show the predicted cost.
+        routed_profile (str): Profile answering instead of the chat profile (request router).
 
     Returns:
         response (JSON): The conversation that the model generated.
     """
-    thinking_enabled = cl.user_session.get("thinking_enabled")
-    
     # Get the message history
     message_history = cl.user_session.get("message_history")
     
@@ -97,146 +595,69 @@ async def generate_conversation(bedrock_client=None, model_id=None, input_text=N
     if input_text is None and not images and not docs:
         # No new input - we're continuing with existing message history (e.g., after tool calls)
         logger.debug("Continuing with existing message history for tool results")
-        api_message_history = message_history.copy()
+        api_message_history = message_history.messages()
     else:
         # We have new input - process it normally
         # Create content for the new user message
+        # Large attachments may be uploaded to S3: encode off the event loop
+        model_config = bedrock_models[routed_profile or cl.user_session.get("chat_profile")]
+        transport = attachment_transport.for_session(cl.user_session.get("id")) if attachment_transport else None
         images_body = []
         if images:
-            logger.debug(f"Creating image content for {len(images)} images")
-            images_body = create_image_content(images)
-            logger.debug(f"Created image content: {images_body}")
+            images_body = await asyncio.to_thread(create_image_content, images, transport, model_config)
+            log_event(logger, logging.DEBUG, "content.images", count=len(images), content=images_body)
             
         docs_body = []
         if docs:
-            logger.debug(f"Creating document content for {len(docs)} documents")
-            docs_body = create_doc_content(docs)
-            logger.debug(f"Created document content: {docs_body}")
+            docs_body = await asyncio.to_thread(create_doc_content, docs, transport, model_config)
+            if document_preprocessor and cl.user_session.get("preprocess_documents"):
+                docs_body, preprocessing_report = await document_preprocessor.process(
+                    docs_body, token_estimator, get_model_family(model_id)
+                )
+                report_preprocessing(preprocessing_report, model_config, msg)
+            log_event(logger, logging.DEBUG, "content.documents", count=len(docs), content=docs_body)
         
         # Create the user message content using the create_content function
         new_user_content = create_content(input_text, images_body, docs_body)
-        logger.debug(f"Final message content: {new_user_content}")
+        log_event(logger, logging.DEBUG, "content.message", content=new_user_content)
         
         # For non-streaming mode with documents, just use the current message
         # This follows AWS example for document handling
+        # Add the new user message to the session history
+        # IMPORTANT: This is the only place where we update the message history
+        message_history.append({"role": "user", "content": new_user_content})
+        
         if not cl.user_session.get("streaming") and (docs or images):
             # Create a single message with the document content
             api_message_history = [{"role": "user", "content": new_user_content}]
             logger.debug("Using single message approach for non-streaming document request (AWS recommended pattern)")
         else:
             # For streaming or text-only messages, use the full conversation history
-            api_message_history = message_history.copy()
-            api_message_history.append({"role": "user", "content": new_user_content})
-        
-        # Add the new user message to the session history
-        # IMPORTANT: This is the only place where we update the message history
-        message_history.append({"role": "user", "content": new_user_content})
+            # (a view over the session history, not a copy)
+            api_message_history = message_history.messages()
     
     # Log message count only (not full content for cleaner logs)
     logger.debug(f"Sending {len(api_message_history)} messages to model")
-
-    # Base inference parameters to use.
-    inference_config = {
-        "maxTokens": max_tokens
-    }
     
-    # Handle temperature based on model type and thinking state
-    if not thinking_enabled:
-        inference_config["temperature"] = float(cl.user_session.get("temperature"))
-        logger.debug(f"Using temperature: {inference_config['temperature']}")
+    if routed_profile:
+        # Routed request: reasoning blocks of the chat profile model cannot be sent to another model
+        api_params = build_request(
+            get_profile_request_template(routed_profile), model_id, strip_reasoning(api_message_history)
+        )
     else:
-        # Get current model info to check reasoning type
-        chat_profile = cl.user_session.get("chat_profile")
-        model_info = bedrock_models[chat_profile] if chat_profile else {}
-        reasoning_config = model_info.get("reasoning", {})
-        
-        # For OpenAI reasoning models, set temperature and top_p to 1
-        if isinstance(reasoning_config, dict) and reasoning_config.get("openai_reasoning_modalities"):
-            inference_config["temperature"] = 1.0
-            inference_config["topP"] = 1.0
-            logger.debug("OpenAI reasoning model: temperature and top_p set to 1.0")
-        else:
-            logger.debug("Standard thinking model: temperature parameter omitted")
-
-    # Additional inference parameters to use.
-    additional_model_fields = {}
+        # Session-level fields (inference config, reasoning, system prompt, tools)
+        # come from the cached request template
+        api_params = build_request(get_request_template(), model_id, api_message_history, max_tokens)
     
-    # Add reasoning capability if enabled
-    if thinking_enabled:
-        # Get current model info to check reasoning type
-        chat_profile = cl.user_session.get("chat_profile")
-        model_info = bedrock_models[chat_profile] if chat_profile else {}
-        reasoning_config = model_info.get("reasoning", {})
-        
-        # Check if model has reasoning always enabled at model level (no API params needed)
-        if isinstance(reasoning_config, dict) and reasoning_config.get("no_reasoning_params"):
-            logger.debug("Model has reasoning always enabled - not sending any reasoning parameters")
-            # Don't add any reasoning parameters to additional_model_fields
-        # Check if this is an OpenAI reasoning model
-        elif isinstance(reasoning_config, dict) and reasoning_config.get("openai_reasoning_modalities"):
-            # Use OpenAI reasoning config format
-            reasoning_effort = cl.user_session.get("reasoning_effort", "medium")
-            additional_model_fields["reasoning_config"] = reasoning_effort
-            logger.debug(f"OpenAI reasoning enabled with effort: {reasoning_effort}")
-        else:
-            # Use standard thinking format for other models
-            reasoning_budget = int(cl.user_session.get("reasoning_budget"))
-            additional_model_fields["thinking"] = {
-                "type": "enabled",
-                "budget_tokens": reasoning_budget
-            }
-            logger.debug(f"Standard thinking enabled with budget: {reasoning_budget} tokens")
-            
-            # Check if interleaved thinking is enabled for Claude models
-            interleaved_thinking = cl.user_session.get("interleaved_thinking", False)
-            if interleaved_thinking and "claude" in model_id.lower():
-                # Get available MCP tools to check if we have tools
-                mcp_tools = cl.user_session.get("mcp_tools", {})
-                has_tools = any(len(conn_data["tools"]) > 0 for conn_data in mcp_tools.values())
-                
-                if has_tools:
-                    additional_model_fields["anthropic_beta"] = ["interleaved-thinking-2025-05-14"]
-                    logger.debug("Interleaved thinking enabled for Claude with tools")
-                else:
-                    logger.debug("Interleaved thinking requested but no tools available")
-    else:
-        logger.debug("Thinking disabled")
-        
-    # Get available MCP tools and format them for Bedrock
-    mcp_tools = cl.user_session.get("mcp_tools", {})
-    all_tools = []
-    for connection_name, connection_data in mcp_tools.items():
-        all_tools.extend(connection_data["tools"])
-    
-    # Prepare tool config for Bedrock
-    tool_config = None
-    if all_tools:
-        tool_config = {"tools": all_tools}
-        logger.debug(f"Using {len(all_tools)} MCP tools")
-    
-    chat_profile = cl.user_session.get("chat_profile")
-    logger.debug(f"Calling {chat_profile} with {len(api_message_history)} messages")
-    
-    # Prepare API call parameters
-    api_params = {
-        "modelId": model_id,
-        "messages": api_message_history,
-        "inferenceConfig": inference_config,
-        "additionalModelRequestFields": additional_model_fields
-    }
-    
-    # Only add system prompt if it's not empty
-    system_prompt = cl.user_session.get("system_prompt")
-    if system_prompt and system_prompt[0].get("text", "").strip():
-        api_params["system"] = system_prompt
-    
-    # Only add toolConfig if it's not None
-    if tool_config is not None:
-        api_params["toolConfig"] = tool_config
+    # Pre-flight check: context limit and predicted cost, without a round trip
+    estimated_input = await preflight_check(api_params, msg, routed_profile)
+    load_monitor.start_streaming()
     
     if cl.user_session.get("streaming"):
         try: 
-            return bedrock_client.converse_stream(**api_params)
+            response = bedrock_client.converse_stream(**api_params)
+            response["inputTokenEstimate"] = estimated_input
+            return response
         except ClientError as err:
             message = err.response["Error"]["Message"]
             logger.error("A client error occurred: %s", message)
@@ -244,32 +665,174 @@ async def generate_conversation(bedrock_client=None, model_id=None, input_text=N
                 format(message))
     else:
         try:
-            return bedrock_client.converse(**api_params)
+            response = bedrock_client.converse(**api_params)
+            response["inputTokenEstimate"] = estimated_input
+            return response
         except ClientError as err:
             message = err.response["Error"]["Message"]
             logger.error("A client error occurred: %s", message)
             print("A client error occured: " +
                 format(message))
     
+def get_preprocessing_controls(initial):
+    """Settings control of the document pre-processing (none if disabled)"""
+    if not document_preprocessor:
+        return []
+    return [
+        Switch(
+            id="preprocess_documents",
+            label="Pre-process documents (HTML, CSV, XLSX, MD) to save tokens",
+            initial=initial
+        )
+    ]
+
+def report_preprocessing(report, model_config, msg=None):
+    """Log and publish the tokens saved by the document pre-processing, and show them on msg"""
+    if not report:
+        return
+    tokens_saved = sum(entry["tokens_before"] - entry["tokens_after"] for entry in report)
+    for entry in report:
+        logger.debug(f"Pre-processed {entry['name']} ({entry['format']}): ~{entry['tokens_before']} -> ~{entry['tokens_after']} tokens")
+    metrics_service.put_metrics(
+        {"PreprocessedDocuments": len(report), "PreprocessingTokensSaved": tokens_saved},
+        dimensions={"Profile": model_config.name},
+        units={"PreprocessedDocuments": "Count", "PreprocessingTokensSaved": "Count"}
+    )
+    if msg is not None:
+        msg.elements = (msg.elements or []) + [
+            cl.Text(
+                name="Document pre-processing",
+                content="\n".join(
+                    f"📄 {entry['name']}: ~{entry['tokens_before'] - entry['tokens_after']} tokens saved "
+                    f"({entry['tokens_before']} → {entry['tokens_after']})"
+                    for entry in report
+                ),
+                display="inline"
+            )
+        ]
+
+def get_compare_controls(initial):
+    """Settings control of the compare mode (none if disabled or with a single profile)"""
+    chat_profile = cl.user_session.get("chat_profile")
+    other_profiles = [profile for profile in bedrock_models if profile != chat_profile]
+    if not compare_config["max_profiles"] or not other_profiles:
+        return []
+    return [
+        MultiSelect(
+            id="compare_profiles",
+            label=f"Compare with profiles (up to {compare_config['max_profiles']}, tools disabled)",
+            values=other_profiles,
+            initial=[profile for profile in initial or [] if profile in other_profiles]
+        )
+    ]
+
+def get_bedrock_client(model_info):
+    """Bedrock runtime client of the region of a model, cached per session"""
+    if model_info.region_name == bedrock_models[cl.user_session.get("chat_profile")].region_name:
+        return cl.user_session.get("bedrock_runtime")
+    clients = cl.user_session.get("bedrock_clients")
+    if clients is None:
+        clients = {}
+        cl.user_session.set("bedrock_clients", clients)
+    if model_info.region_name not in clients:
+        clients[model_info.region_name] = create_bedrock_client(model_info.region_name)
+    return clients[model_info.region_name]
+
+async def compare_profiles(input_text, images, docs, profiles):
+    """
+    Send a message to several profiles concurrently and show their answers side by side.
+
+    Attachments are read and encoded once and shared by every request. Each profile
+    answers the message alone (single turn, without tools); the answer of the chat
+    profile is added to the conversation history.
+    """
+    # Every profile receives the same content: S3 references only if all of them accept them
+    model_config = bedrock_models[profiles[0]]
+    transport_config = model_config if all(bedrock_models[profile].s3_attachments for profile in profiles) else None
+    transport = attachment_transport.for_session(cl.user_session.get("id")) if attachment_transport else None
+    images_body = []
+    if images:
+        images_body = await asyncio.to_thread(create_image_content, images, transport, transport_config)
+    docs_body = []
+    if docs:
+        docs_body = await asyncio.to_thread(create_doc_content, docs, transport, transport_config)
+        if document_preprocessor and cl.user_session.get("preprocess_documents"):
+            docs_body, preprocessing_report = await document_preprocessor.process(
+                docs_body, token_estimator, get_model_family(model_config.id)
+            )
+            report_preprocessing(preprocessing_report, model_config)
+    content = create_content(input_text, images_body, docs_body)
+    load_monitor.start_streaming()
+    streaming = cl.user_session.get("streaming")
+    user = get_user_identifier()
+    
+    async def run(profile, answer):
+        model_info = bedrock_models[profile]
+        capabilities = model_capabilities[profile]
+        api_params = build_request(
+            get_profile_request_template(profile),
+            model_info.id,
+            [{"role": "user", "content": filter_content_for_model(content, model_info)}]
+        )
+        output_filter = create_output_filter(False, output_filter_config["redaction_patterns"])
+        
+        async def on_token(text):
+            text = output_filter.feed(text)
+            if text:
+                await answer.stream_token(text)
+        
+        result = await run_profile(
+            profile,
+            get_bedrock_client(model_info),
+            api_params,
+            streaming and capabilities.supports_streaming,
+            on_token
+        )
+        text = output_filter.flush()
+        if text:
+            await answer.stream_token(text)
+        if result.error:
+            answer.content = f"❌ **Error**: {result.error}"
+        else:
+            result.cost = usage_ledger.record(user, profile, result.usage)
+        await answer.update()
+        return result
+    
+    answers = [cl.Message(content="", author=profile) for profile in profiles]
+    for answer in answers:
+        await answer.send()
+    results = await asyncio.gather(*(run(profile, answer) for profile, answer in zip(profiles, answers)))
+    
+    cl.user_session.set("total_cost", cl.user_session.get("total_cost") + sum(result.cost for result in results))
+    await cl.Message(
+        content=format_summary(results, cl.user_session.get("precision")),
+        author="Comparison"
+    ).send()
+    
+    # The conversation continues with the chat profile. A failed or blank answer
+    # is not kept: Bedrock rejects assistant turns with blank text
+    if results[0].error or not answers[0].content.strip():
+        logger.debug(f"Comparison answer of {profiles[0]} not kept in the conversation")
+    else:
+        message_history = cl.user_session.get("message_history")
+        message_history.append({"role": "user", "content": content})
+        message_history.append({"role": "assistant", "content": [{"text": answers[0].content}]})
+
 @cl.set_chat_profiles
 async def chat_profile():
     profiles = []
-    for key in bedrock_models.keys():
-        is_default = None
-        if "default" in bedrock_models[key]:
-            is_default = bedrock_models[key]["default"]
+    for key, model_config in bedrock_models.items():
         profiles.append(cl.ChatProfile(name=key, 
                                        markdown_description=f"The underlying LLM model is *{key}*.", 
-                                       icon=f"public/{bedrock_models[key].get('id').lower()}.png",
-                                       default = is_default if is_default else False))
+                                       icon=f"public/{model_config.id.lower()}.png",
+                                       default=model_config.default))
     return profiles
 
 @cl.on_settings_update
 async def set_settings(settings):
     # Get current model info to check streaming capability
-    chat_profile = cl.user_session.get("chat_profile")
-    model_info = bedrock_models[chat_profile] if chat_profile else {}
-    streaming_supported = model_info.get("streaming", True)  # Default to True for backward compatibility
+    capabilities = cl.user_session.get("capabilities")
+    streaming_supported = capabilities.supports_streaming
     
     # Store basic settings
     # Handle streaming - only set if the control exists (streaming supported)
@@ -285,8 +848,7 @@ async def set_settings(settings):
     cl.user_session.set("system_prompt", [{"text": settings["system_prompt"]}])
     
     # Handle thinking settings - check if this is an OpenAI reasoning model
-    reasoning_config = model_info.get("reasoning", {})
-    is_openai_reasoning = isinstance(reasoning_config, dict) and reasoning_config.get("openai_reasoning_modalities")
+    is_openai_reasoning = capabilities.openai_reasoning
     
     if is_openai_reasoning:
         # For OpenAI reasoning models, thinking is always enabled
@@ -314,6 +876,18 @@ async def set_settings(settings):
     # Always set a default temperature, even if the control is hidden
     cl.user_session.set("temperature", settings.get("temperature", 1.0))
     
+    # Documents are sent raw unless pre-processing is enabled and not opted out
+    cl.user_session.set("preprocess_documents", settings.get("preprocess_documents", False))
+    
+    # Profiles answering the next messages alongside the chat profile
+    cl.user_session.set(
+        "compare_profiles",
+        list(settings.get("compare_profiles") or [])[:compare_config["max_profiles"]]
+    )
+    
+    # Settings changed: the request template must be rebuilt
+    cl.user_session.set("request_template", None)
+    
     # If thinking is enabled, update UI dynamically
     if thinking_enabled:
         # Build dynamic settings controls
@@ -330,10 +904,6 @@ async def set_settings(settings):
             TextInput(id="system_prompt", label="System Prompt", initial=settings["system_prompt"])
         )
         
-        # Check if this is an OpenAI reasoning model
-        reasoning_config = model_info.get("reasoning", {})
-        is_openai_reasoning = isinstance(reasoning_config, dict) and reasoning_config.get("openai_reasoning_modalities")
-        
         if is_openai_reasoning:
             # For OpenAI models, don't show thinking toggle (always enabled)
             # Add OpenAI reasoning effort control
@@ -363,7 +933,7 @@ async def set_settings(settings):
             )
             
             # Add interleaved thinking toggle for Claude models (beta feature)
-            if "claude" in model_info["id"].lower():
+            if capabilities.supports_interleaved_thinking:
                 dynamic_controls.append(
                     Switch(
                         id="interleaved_thinking", 
@@ -388,54 +958,45 @@ async def set_settings(settings):
                 label="Maximum tokens",
                 initial=settings["max_tokens"],
                 min=1,
-                max=model_info.get("maxTokens", 4096),
+                max=capabilities.max_tokens,
                 step=1024,
             ),
             Switch(id="costs", label="Show costs in the answer", initial=settings["costs"]),
             Slider(id="precision", label="Digit Precision of costs", initial=settings["precision"], min=1, max=10, step=1)
         ])
+        dynamic_controls.extend(get_preprocessing_controls(cl.user_session.get("preprocess_documents")))
+        dynamic_controls.extend(get_compare_controls(cl.user_session.get("compare_profiles")))
         
         await cl.ChatSettings(dynamic_controls).send()
 
 @cl.on_mcp_connect
-async def on_mcp_connect(connection, session: ClientSession):
+async def on_mcp_connect(connection, session: "ClientSession"):
     """Called when an MCP connection is established"""
     logger.debug(f"MCP Connection established: {connection.name}")
     
     try:
         # Discover available tools from the MCP server
         result = await session.list_tools()
-        tools = []
-        
-        for tool in result.tools:
-            # Convert MCP tool schema to Bedrock tool format
-            bedrock_tool = {
-                "toolSpec": {
-                    "name": tool.name,
-                    "description": tool.description,
-                    "inputSchema": {
-                        "json": tool.inputSchema
-                    }
-                }
-            }
-            tools.append(bedrock_tool)
-            logger.debug(f"Discovered tool: {tool.name}")
+        # Bedrock tool specs and input validators, converted once per server and tool definitions
+        tool_set = tool_schema_cache.get(connection, result.tools)
         
         # Store tools in user session
         mcp_tools = cl.user_session.get("mcp_tools", {})
         mcp_tools[connection.name] = {
-            "tools": tools,
+            "tools": tool_set.specs,
+            "tool_set": tool_set,
             "session": session
         }
         cl.user_session.set("mcp_tools", mcp_tools)
+        cl.user_session.set("request_template", None)
         
-        logger.debug(f"Successfully registered {len(tools)} tools from {connection.name}")
+        logger.debug(f"Successfully registered {len(tool_set.specs)} tools from {connection.name}")
         
     except Exception as e:
         logger.error(f"Error connecting to MCP server {connection.name}: {e}")
     
 @cl.on_mcp_disconnect
-async def on_mcp_disconnect(name: str, session: ClientSession):
+async def on_mcp_disconnect(name: str, session: "ClientSession"):
     """Called when an MCP connection is terminated"""
     logger.debug(f"MCP Connection terminated: {name}")
     
@@ -445,12 +1006,13 @@ async def on_mcp_disconnect(name: str, session: ClientSession):
         tool_count = len(mcp_tools[name]["tools"])
         del mcp_tools[name]
         cl.user_session.set("mcp_tools", mcp_tools)
+        cl.user_session.set("request_template", None)
         
         logger.debug(f"MCP connection terminated: {name}, removed {tool_count} tools")
 
 @cl.step(type="tool")
 async def call_mcp_tool(tool_use_id: str, tool_name: str, tool_input: dict):
-    """Execute an MCP tool and return the result"""
+    """Execute an MCP tool and return its result, bounded for the conversation history"""
     current_step = cl.context.current_step
     current_step.name = tool_name
     
@@ -461,12 +1023,14 @@ async def call_mcp_tool(tool_use_id: str, tool_name: str, tool_input: dict):
         mcp_tools = cl.user_session.get("mcp_tools", {})
         mcp_session = None
         connection_name = None
+        tool_set = None
         
         for conn_name, conn_data in mcp_tools.items():
             for tool in conn_data["tools"]:
                 if tool["toolSpec"]["name"] == tool_name:
                     mcp_session = conn_data["session"]
                     connection_name = conn_name
+                    tool_set = conn_data.get("tool_set")
                     break
             if mcp_session:
                 break
@@ -474,41 +1038,45 @@ async def call_mcp_tool(tool_use_id: str, tool_name: str, tool_input: dict):
         if not mcp_session:
             error_msg = f"Tool {tool_name} not found in any MCP connection"
             logger.error(error_msg)
-            current_step.output = json.dumps({"error": error_msg})
-            return current_step.output
+            tool_result = tool_result_formatter.error(tool_name, json.dumps({"error": error_msg}))
+            current_step.output = tool_result.display
+            return tool_result
+        
+        # Invalid inputs go straight back to the model, without a round trip to the server
+        validation_error = tool_set.validate(tool_name, tool_input) if tool_set else None
+        if validation_error:
+            logger.info(f"Rejected input of tool {tool_name}: {validation_error}")
+            tool_result = tool_result_formatter.error(tool_name, json.dumps({
+                "error": f"Invalid input for tool {tool_name}: {validation_error}. "
+                         "Fix the input to match the tool input schema and call the tool again."
+            }))
+            current_step.output = tool_result.display
+            return tool_result
         
         # Call the MCP tool
         logger.debug(f"Executing {tool_name} via {connection_name}")
         result = await mcp_session.call_tool(tool_name, tool_input)
         
-        # Format the result
-        if hasattr(result, 'content') and result.content:
-            # Handle different content types
-            content_parts = []
-            for content in result.content:
-                if hasattr(content, 'text'):
-                    content_parts.append(content.text)
-                elif hasattr(content, 'data'):
-                    content_parts.append(str(content.data))
-                else:
-                    content_parts.append(str(content))
-            
-            result_text = '\n'.join(content_parts)
-            current_step.output = result_text
-            logger.debug(f"Tool {tool_name} executed successfully")
-        else:
-            current_step.output = str(result)
-        
-        return current_step.output
+        # Bound the result: decoding and downscaling binary content runs off the event loop
+        model_info = bedrock_models[cl.user_session.get("chat_profile")]
+        tool_result = await asyncio.to_thread(
+            tool_result_formatter.format, tool_name, result, model_info.vision, model_info.document
+        )
+        current_step.output = tool_result.display
+        logger.debug(f"Tool {tool_name} executed successfully ({tool_result.original_size} bytes)")
+        return tool_result
         
     except Exception as e:
         error_msg = f"Error executing tool {tool_name}: {str(e)}"
         logger.error(error_msg)
-        current_step.output = json.dumps({"error": error_msg})
-        return current_step.output
+        tool_result = tool_result_formatter.error(tool_name, json.dumps({"error": error_msg}))
+        current_step.output = tool_result.display
+        return tool_result
 
 @cl.on_chat_start
 async def start():
+    if stall_detector:
+        stall_detector.ensure_started()
     chat_profile = cl.user_session.get("chat_profile")
     model_info = bedrock_models[chat_profile]
     cl.user_session.set(
@@ -517,11 +1085,16 @@ async def start():
     )
     cl.user_session.set(
         "message_history",
-        []
+        ConversationHistory()
     )
     cl.user_session.set(
-        "message_contents",
-        []
+        "tool_history",
+        False
+    )
+    # Token estimates of the history entries, computed once per message
+    cl.user_session.set(
+        "token_cache",
+        {}
     )
     cl.user_session.set(
         "directory_paths",
@@ -530,31 +1103,34 @@ async def start():
     
     # Store bedrock models for later use
     cl.user_session.set("bedrock_models", bedrock_models)
+    cl.user_session.set("capabilities", model_capabilities[chat_profile])
+    cl.user_session.set("request_template", None)
+    
+    # Create the Bedrock client and open its connection in the background:
+    # the settings panel is not delayed and the first message does not pay for it
+    cl.user_session.set("bedrock_runtime", None)
+    cl.user_session.set("prewarm_task", asyncio.create_task(prewarm_session(model_info)))
+    
+    # A reconnect may land on this task: fetch the stored state in the background,
+    # it is applied on the first message
+    cl.user_session.set(
+        "state_load_task",
+        asyncio.create_task(session_state.load(state_key(get_user_identifier(), cl.user_session.get("id"))))
+        if session_state else None
+    )
     
-    try:
-        bedrock_client_config = Config(**aws_config)
-        if "region" in model_info:
-            if len(model_info["region"]) > 1:
-                bedrock_client_config.region_name = model_info["inference_profile"]["region"]
-            else:
-                bedrock_client_config.region_name = model_info["region"]
-        cl.user_session.set("bedrock_runtime", boto3.client('bedrock-runtime', config=bedrock_client_config))
-    except ClientError as err:
-        message = err.response["Error"]["Message"]
-        logger.error("A client error occurred: %s", message)
-        print("A client error occured: " +
-              format(message))
     # Initialize system prompt
     # Initialize system prompt - start with model-specific or empty
-    system_prompt = model_info.get("system_prompt", "")
+    system_prompt = model_info.system_prompt
     
     # Try to get system prompt from Bedrock Prompt Manager if available
     if chat_profile in system_prompt_list:
         try:
-            bedrock_agent_client_config = Config(**aws_config)
-            bedrock_agent_client = boto3.client('bedrock-agent', config=bedrock_agent_client_config)
+            bedrock_agent_client = await asyncio.to_thread(create_bedrock_client, None, 'bedrock-agent')
             
-            system_prompt_object = bedrock_agent_client.get_prompt(
+            # Fetched off the event loop, concurrently with the pre-warm
+            system_prompt_object = await asyncio.to_thread(
+                bedrock_agent_client.get_prompt,
                 promptIdentifier=system_prompt_list[chat_profile].get("id"),
                 promptVersion=system_prompt_list[chat_profile].get("version")
             )
@@ -579,8 +1155,9 @@ async def start():
     )
     
     # Check if the model supports reasoning and streaming
-    reasoning_supported = model_info.get("reasoning", False)
-    streaming_supported = model_info.get("streaming", True)  # Default to True for backward compatibility
+    capabilities = model_capabilities[chat_profile]
+    reasoning_supported = capabilities.reasoning_enabled
+    streaming_supported = capabilities.supports_streaming
     
     # Build settings controls based on model capabilities
     settings_controls = []
@@ -595,10 +1172,7 @@ async def start():
     # Only add reasoning controls if the model supports it
     if reasoning_supported:
         # Check if this is an OpenAI reasoning model
-        reasoning_config = model_info.get("reasoning", {})
-        is_openai_reasoning = isinstance(reasoning_config, dict) and reasoning_config.get("openai_reasoning_modalities")
-        
-        if is_openai_reasoning:
+        if capabilities.openai_reasoning:
             # For OpenAI reasoning models, thinking is always enabled and cannot be toggled
             thinking_enabled = True
             cl.user_session.set("thinking_enabled", thinking_enabled)
@@ -610,11 +1184,11 @@ async def start():
                     id="reasoning_effort",
                     label="Reasoning Effort",
                     values=["low", "medium", "high"],
-                    initial_index=1  # Default to "medium"
+                    initial_index=["low", "medium", "high"].index(DEFAULT_REASONING_EFFORT)
                 )
             )
             # Set default reasoning effort
-            cl.user_session.set("reasoning_effort", "medium")
+            cl.user_session.set("reasoning_effort", DEFAULT_REASONING_EFFORT)
             
 
         else:
@@ -631,7 +1205,7 @@ async def start():
                 Slider(
                     id="reasoning_budget",
                     label="Reasoning Budget (tokens)",
-                    initial=4096,
+                    initial=DEFAULT_REASONING_BUDGET,
                     min=1024,
                     max=64000,
                     step=64,
@@ -640,7 +1214,7 @@ async def start():
             
             # Add interleaved thinking toggle for Claude models (beta feature)
             # Check if this is a Claude model
-            if "claude" in model_info["id"].lower():
+            if capabilities.supports_interleaved_thinking:
                 settings_controls.append(
                     Switch(
                         id="interleaved_thinking", 
@@ -666,7 +1240,7 @@ async def start():
     else:
         # Set default values for reasoning settings even if not shown
         cl.user_session.set("thinking_enabled", False)
-        cl.user_session.set("reasoning_budget", 4096)
+        cl.user_session.set("reasoning_budget", DEFAULT_REASONING_BUDGET)
         
         # Always show temperature for models without reasoning
         settings_controls.append(
@@ -682,9 +1256,9 @@ async def start():
     
     # Add remaining controls
     # Use model-specific maxTokens from config if available, otherwise default to 4096
-    max_tokens_initial = model_info.get("maxTokens", 4096)
+    max_tokens_initial = capabilities.max_tokens
     # Set initial value to 50% of maxTokens but cap at 8192
-    initial_tokens = min(max_tokens_initial // 2, 8192)
+    initial_tokens = default_max_tokens(capabilities)
     settings_controls.extend([
         Slider(
             id="max_tokens",
@@ -698,11 +1272,16 @@ async def start():
         Switch(id="costs", label="Show costs in the answer", initial=False),
         Slider(id="precision", label="Digit Precision of costs", initial=4, min=1, max=10, step=1)
     ])
+    settings_controls.extend(get_preprocessing_controls(True))
+    settings_controls.extend(get_compare_controls([]))
     
     settings = await cl.ChatSettings(settings_controls).send()
     await set_settings(settings)
+    
+    # The system prompt and the tool registry are known: build the request template now
+    get_request_template()
 
-async def process_model_response(response, msg, model_info):
+async def process_model_response(response, msg, model_info, tool_follow_up=False):
     """Process model response, handling both streaming and tool calls"""
     api_usage = None
     
@@ -716,7 +1295,8 @@ async def process_model_response(response, msg, model_info):
     
     # Handle costs display
     if api_usage:
-        await display_costs(api_usage, model_info)
+        api_usage["inputTokenEstimate"] = response.get("inputTokenEstimate", 0)
+        await display_costs(api_usage, model_info, msg, tool_follow_up)
     
     await msg.update()
     return response
@@ -731,15 +1311,20 @@ async def handle_streaming_response(response, msg, model_info):
     thinking_enabled = cl.user_session.get("thinking_enabled")
     thinking_manager = ThinkingService() if thinking_enabled else None
     thinking_step = None
+    thinking_writer = None
     api_usage = None
     
     # Track tool calls during streaming
     tool_calls = []
     current_tool_call = None
     
+    # Whitespace cleanup and redaction, with state carried across chunks
+    output_filter = create_response_filter()
+    first_delta = True
+    
     for event in stream:
         if 'messageStart' in event:
-            logger.debug(f"Message started with role: {event['messageStart']['role']}")
+            log_event(logger, logging.DEBUG, "stream.message_start", role=event['messageStart']['role'])
 
         elif 'contentBlockStart' in event:
             # Check if this is a tool use block
@@ -750,29 +1335,19 @@ async def handle_streaming_response(response, msg, model_info):
                     'name': tool_use['name'],
                     'input': ''
                 }
-                logger.debug(f"Tool call started: {tool_use['name']}")
+                log_event(logger, logging.DEBUG, "stream.tool_start", name=tool_use['name'], id=tool_use['toolUseId'])
 
         elif 'contentBlockDelta' in event:
             delta = event['contentBlockDelta'].get('delta', {})
+            if first_delta:
+                record_ttft(model_info)
+                first_delta = False
             
             # Handle regular text content
             if 'text' in delta:
-                text_content = delta['text']
-                
-                # Check if tools are available to determine if we should filter empty text
-                mcp_tools = cl.user_session.get("mcp_tools", {})
-                has_tools = any(len(conn_data["tools"]) > 0 for conn_data in mcp_tools.values())
-                
-                # Skip empty text content when tools are enabled (models may return empty text with tool calls)
-                if has_tools and not text_content.strip():
-                    logger.debug("Skipping empty text content in streaming (tools enabled)")
-                    continue
-                
-                # Clean up excessive whitespace while preserving intentional formatting
-                # Only clean up if there are more than 2 consecutive newlines
-                if '\n\n\n' in text_content:
-                    text_content = re.sub(r'\n{3,}', '\n\n', text_content)
-                await msg.stream_token(text_content)
+                text_content = output_filter.feed(delta['text'])
+                if text_content:
+                    await msg.stream_token(text_content)
             
             # Handle tool use input
             elif 'toolUse' in delta and current_tool_call:
@@ -788,14 +1363,16 @@ async def handle_streaming_response(response, msg, model_info):
                         thinking_step = cl.Step(name="Thinking 🤔", type="thinking", parent_id=msg.id)
                         await thinking_step.send()
                         logger.debug(f"Created thinking step (streaming) with parent_id: {msg.id}")
+                        # Render the thinking step at a bounded rate
+                        thinking_writer = ThrottledStreamWriter(thinking_step, thinking_config["update_interval"])
                     
-                    await thinking_step.stream_token(thinking_text)
+                    await thinking_writer.write(thinking_text)
                 
                 # Handle signature in reasoning content
                 if 'signature' in delta['reasoningContent']:
                     signature = delta['reasoningContent']['signature']
                     thinking_manager.set_signature(signature)
-                    logger.debug(f"Received thinking signature: {signature[:20]}...")
+                    log_event(logger, logging.DEBUG, "stream.signature", length=len(signature))
 
         elif 'contentBlockStop' in event:
             # Complete tool call if we were building one
@@ -803,18 +1380,27 @@ async def handle_streaming_response(response, msg, model_info):
                 try:
                     current_tool_call['input'] = json.loads(current_tool_call['input'])
                     tool_calls.append(current_tool_call)
-                    logger.debug(f"Tool call completed: {current_tool_call['name']}")
+                    log_event(
+                        logger, logging.DEBUG, "stream.tool_stop",
+                        name=current_tool_call['name'], input=current_tool_call['input']
+                    )
                 except json.JSONDecodeError:
                     logger.error(f"Failed to parse tool input: {current_tool_call['input']}")
                 current_tool_call = None
             
             # Complete thinking step
             if thinking_step:
+                await thinking_writer.flush()
                 await thinking_step.update()
 
         elif 'messageStop' in event:
             stop_reason = event['messageStop']['stopReason']
-            logger.debug(f"Message stopped with reason: {stop_reason}")
+            log_event(logger, logging.DEBUG, "stream.message_stop", stop_reason=stop_reason)
+            
+            # Emit the text held back by the output filter
+            text_content = output_filter.flush()
+            if text_content:
+                await msg.stream_token(text_content)
             
             # If we have tool calls, execute them
             if tool_calls and stop_reason == 'tool_use':
@@ -826,12 +1412,20 @@ async def handle_streaming_response(response, msg, model_info):
                 api_usage = {
                     "inputTokenCount": metadata['usage']['inputTokens'],
                     "outputTokenCount": metadata['usage']['outputTokens'],
+                    "cacheReadInputTokenCount": metadata['usage'].get('cacheReadInputTokens', 0),
+                    "cacheWriteInputTokenCount": metadata['usage'].get('cacheWriteInputTokens', 0),
+                    "reasoningTokenCount": estimate_reasoning_tokens(thinking_manager),
                     "invocationLatency": "not available in this API call",
                     "firstByteLatency": "not available in this API call"
                 }
             if 'metrics' in event['metadata']:
                 api_usage["invocationLatency"] = metadata['metrics']['latencyMs']
     
+    # In case the stream ended without messageStop
+    text_content = output_filter.flush()
+    if text_content:
+        await msg.stream_token(text_content)
+    
     # Only store message in history if we didn't have tool calls (tool calls handle their own storage)
     if not tool_calls:
         await store_assistant_message(msg.content, thinking_manager, tool_calls_made=False)
@@ -852,24 +1446,20 @@ async def handle_non_streaming_response(response, msg, model_info):
     
     output_message = response['output']['message']
     stop_reason = response.get('stopReason', '')
+    # Without streaming, the first token arrives with the whole answer
+    record_ttft(model_info)
     
     # Process content and extract text/thinking
     text = ""
     tool_calls = []
     thinking_step = None
     
-    # Check if tools are available to determine if we should filter empty text
-    mcp_tools = cl.user_session.get("mcp_tools", {})
-    has_tools = any(len(conn_data["tools"]) > 0 for conn_data in mcp_tools.values())
+    # Same output filter as the streaming responses
+    output_filter = create_response_filter()
     
     for content_item in output_message.get('content', []):
         if 'text' in content_item:
-            text_content = content_item['text']
-            # Skip empty text content when tools are enabled (models may return empty text with tool calls)
-            if has_tools and not text_content.strip():
-                logger.debug("Skipping empty text content (tools enabled)")
-                continue
-            text += text_content
+            text += output_filter.feed(content_item['text'])
         elif 'toolUse' in content_item:
             tool_calls.append(content_item['toolUse'])
         elif thinking_enabled and 'reasoningContent' in content_item:
@@ -897,10 +1487,7 @@ async def handle_non_streaming_response(response, msg, model_info):
         await thinking_step.update()
         logger.debug("Completed thinking step")
     
-    # Update message content with cleaned text
-    # Clean up excessive whitespace while preserving intentional formatting
-    if '\n\n\n' in text:
-        text = re.sub(r'\n{3,}', '\n\n', text)
+    text += output_filter.flush()
     
     # Handle message content based on what the model provided
     if text.strip():
@@ -928,6 +1515,9 @@ async def handle_non_streaming_response(response, msg, model_info):
     api_usage = {
         "inputTokenCount": response["usage"]["inputTokens"],
         "outputTokenCount": response["usage"]["outputTokens"],
+        "cacheReadInputTokenCount": response["usage"].get("cacheReadInputTokens", 0),
+        "cacheWriteInputTokenCount": response["usage"].get("cacheWriteInputTokens", 0),
+        "reasoningTokenCount": estimate_reasoning_tokens(thinking_manager),
         "invocationLatency": response['metrics']['latencyMs'],
         "firstByteLatency": "not available in this API call"
     }
@@ -947,9 +1537,7 @@ async def execute_tool_calls(tool_calls, msg, model_info, thinking_manager=None)
     thinking_enabled = cl.user_session.get("thinking_enabled")
     if thinking_enabled and thinking_manager and thinking_manager.has_thinking():
         # Check if model supports signatures
-        reasoning_config = model_info.get("reasoning", {})
-        is_openai_reasoning = isinstance(reasoning_config, dict) and reasoning_config.get("openai_reasoning_modalities")
-        include_signature = not is_openai_reasoning  # OpenAI models don't support signatures
+        include_signature = cl.user_session.get("capabilities").supports_signatures  # OpenAI models don't support signatures
         
         # Get thinking blocks formatted for API
         api_blocks = thinking_manager.get_api_blocks(include_signature=include_signature)
@@ -968,6 +1556,8 @@ async def execute_tool_calls(tool_calls, msg, model_info, thinking_manager=None)
         "content": assistant_content
     }
     message_history.append(assistant_message)
+    # Tool turns need a model with the same tools: the request router keeps them on the chat profile
+    cl.user_session.set("tool_history", True)
     
     # Execute each tool and collect results
     tool_results = []
@@ -988,7 +1578,7 @@ async def execute_tool_calls(tool_calls, msg, model_info, thinking_manager=None)
         tool_results.append({
             "toolResult": {
                 "toolUseId": tool_use_id,
-                "content": [{"text": str(tool_result)}]
+                "content": tool_result.content
             }
         })
     
@@ -1005,7 +1595,7 @@ async def execute_tool_calls(tool_calls, msg, model_info, thinking_manager=None)
     try:
         follow_up_response = await generate_conversation(
             cl.user_session.get("bedrock_runtime"), 
-            model_info["id"], 
+            model_info.id, 
             None,  # No new input text
             int(cl.user_session.get("max_tokens")), 
             None, None  # No new images/docs
@@ -1022,7 +1612,7 @@ async def execute_tool_calls(tool_calls, msg, model_info, thinking_manager=None)
         await follow_up_msg.send()
         
         # Process the follow-up response with the new message
-        await process_model_response(follow_up_response, follow_up_msg, model_info)
+        await process_model_response(follow_up_response, follow_up_msg, model_info, tool_follow_up=True)
         
     except Exception as e:
         logger.error(f"Tool execution error: {str(e)}")
@@ -1032,10 +1622,8 @@ async def execute_tool_calls(tool_calls, msg, model_info, thinking_manager=None)
 async def store_assistant_message(text, thinking_manager, tool_calls_made=False):
     """Store assistant message in history with proper reasoning handling"""
     message_history = cl.user_session.get("message_history")
-    chat_profile = cl.user_session.get("chat_profile")
-    model_info = bedrock_models[chat_profile] if chat_profile else {}
-    reasoning_config = model_info.get("reasoning", {})
-    is_openai_reasoning = isinstance(reasoning_config, dict) and reasoning_config.get("openai_reasoning_modalities")
+    capabilities = cl.user_session.get("capabilities")
+    is_openai_reasoning = capabilities.openai_reasoning
     
     # Determine if reasoning should be included based on model type and tool calls
     should_include_reasoning = True
@@ -1051,8 +1639,8 @@ async def store_assistant_message(text, thinking_manager, tool_calls_made=False)
     thinking_enabled = cl.user_session.get("thinking_enabled")
     
     if thinking_enabled and thinking_manager and thinking_manager.has_thinking() and should_include_reasoning:
-        # Check if model supports signatures (reuse the model_info we already have)
-        include_signature = not is_openai_reasoning  # OpenAI models don't support signatures
+        # Check if model supports signatures
+        include_signature = capabilities.supports_signatures
         
         # Get thinking blocks formatted for API
         api_blocks = thinking_manager.get_api_blocks(include_signature=include_signature)
@@ -1073,12 +1661,35 @@ async def store_assistant_message(text, thinking_manager, tool_calls_made=False)
         if is_openai_reasoning and not should_include_reasoning:
             logger.debug("OpenAI reasoning model: reasoning content excluded from history (no tool calls)")
 
-async def display_costs(api_usage, model_info):
-    """Display cost information if enabled"""
+def get_user_identifier():
+    """Identifier of the current user, used for usage accounting"""
+    user = cl.user_session.get("user")
+    return getattr(user, "identifier", None) or "anonymous"
+
+def estimate_reasoning_tokens(thinking_manager):
+    """Estimate reasoning tokens (billed as output tokens) from the thinking text"""
+    if not thinking_manager or not thinking_manager.has_thinking():
+        return 0
+    return thinking_manager.thinking_length // 4
+
+async def display_costs(api_usage, model_info, msg, tool_follow_up=False):
+    """Record usage in the ledger and display cost information if enabled"""
     if not api_usage:
         return
     
-    invocation_cost = api_usage["inputTokenCount"]/1000 * model_info["cost"]["input_1k_price"] + api_usage["outputTokenCount"]/1000 * model_info["cost"]["output_1k_price"]
+    # Compare the pre-flight estimate with the actual input tokens
+    token_estimator.calibrate(
+        model_info.id,
+        api_usage.get("inputTokenEstimate", 0),
+        api_usage["inputTokenCount"] + api_usage.get("cacheReadInputTokenCount", 0) + api_usage.get("cacheWriteInputTokenCount", 0)
+    )
+    
+    invocation_cost = usage_ledger.record(
+        get_user_identifier(),
+        model_info.name,
+        api_usage,
+        tool_follow_up=tool_follow_up
+    )
     total_cost = cl.user_session.get("total_cost") + invocation_cost
     cl.user_session.set("total_cost", total_cost)
     
@@ -1088,17 +1699,26 @@ async def display_costs(api_usage, model_info):
         precision = cl.user_session.get("precision")
         s_invocation_cost = f"{invocation_cost:.{precision}f}".rstrip('0') or '0.00'
         s_total_cost = f"{total_cost:.{precision}f}".rstrip('0') or '0.00'
-        elements = [
+        # Attach costs to the answer itself instead of sending an extra message
+        msg.elements = (msg.elements or []) + [
             cl.Text(name="Invocation cost", content=f"Invocation cost: {s_invocation_cost}$", display="inline"),
             cl.Text(name="Chat cost", content=f"Total chat cost: {s_total_cost}$", display="inline")
         ]
-        await cl.Message(content="", elements=elements).send()
 
 @cl.on_message
 async def main(message: cl.Message):
     """
     Entrypoint for handling user messages with MCP tool support.
     """
+    if stall_detector:
+        stall_detector.ensure_started()
+    # Queued until the model request is sent, then counted as an active stream
+    with load_monitor.request():
+        await handle_message(message)
+
+async def handle_message(message: cl.Message):
+    """Answer a user message"""
+    cl.user_session.set("turn_start", time.perf_counter())
     msg = cl.Message(content="")
     await msg.send()  # loading
     await msg.update()
@@ -1106,23 +1726,35 @@ async def main(message: cl.Message):
     model_info = bedrock_models[chat_profile]
     max_tokens = int(cl.user_session.get("max_tokens"))
     
-    # Process message contents
-    images, docs, other_files = content_service.split_message_contents(message, model_info["id"])
+    # Enforce the optional daily budget before dispatching anything to Bedrock
+    if usage_ledger.is_over_budget(get_user_identifier()):
+        await cl.Message(content="❌ **Error**: Your daily usage budget has been reached. Please try again tomorrow.").send()
+        await msg.remove()
+        return
+    
+    # The Bedrock client is created in the background at chat start
+    await wait_for_prewarm(model_info)
+    await hydrate_session()
+    
+    # Process message contents: each file is read and hashed, off the event loop
+    images, docs, other_files = await asyncio.to_thread(content_service.split_message_contents, message, model_info.id)
     
     # Log processed contents only if there are attachments
     if images or docs or other_files:
         logger.debug(f"Processed contents: images={len(images)}, docs={len(docs)}, other_files={len(other_files)}")
     
-    # Store content for later cleanup
-    cl.user_session.set(
-        "message_contents",
-        images+docs
-    )
+    # Track the uploads for later cleanup (every message of the session, not only the last one)
+    session_id = cl.user_session.get("id")
+    if not upload_tracker.track(session_id, images+docs+other_files):
+        await cl.Message(content="❌ **Error**: The server is out of space for uploads. Please try again later.").send()
+        await upload_tracker.release(session_id, images+docs+other_files)
+        await msg.remove()
+        return
     
     # Handle unsupported files
     if len(other_files) > 0:
-        name_string = ", ".join([other["name"] for other in other_files])
-        message_info = f"The files {name_string} is not supported by the model you are using: {model_info['id']}. Not considering it"
+        name_string = ", ".join([other.name for other in other_files])
+        message_info = f"The files {name_string} is not supported by the model you are using: {model_info.id}. Not considering it"
         elements = [
                 cl.Text(name="Warning", content=message_info, display="inline"),
             ]
@@ -1130,12 +1762,12 @@ async def main(message: cl.Message):
         content="",
         elements=elements,
         ).send()
-        content_service.delete_contents(other_files)
+        await upload_tracker.release(session_id, other_files)
     
     # Verify content is valid
     if not content_service.verify_content(message.content, images, docs):
         await cl.Message(content=f"Please provide a valid document or image or text. {suported_file_string}").send()
-        content_service.delete_contents(images+docs)
+        await upload_tracker.release(session_id, images+docs)
         await msg.update()
         return
     
@@ -1143,28 +1775,99 @@ async def main(message: cl.Message):
     if images or docs:
         logger.debug(f"Sending to model: text + {len(images)} images + {len(docs)} docs")
     
+    # Compare mode: the message is answered by several profiles side by side
+    selected_profiles = cl.user_session.get("compare_profiles")
+    if selected_profiles:
+        await msg.remove()
+        try:
+            await compare_profiles(message.content, images, docs, [chat_profile] + selected_profiles)
+        except Exception as e:
+            logger.error(f"Comparison failed: {e}")
+            await cl.Message(content=f"❌ **Unexpected Error**: {str(e)}").send()
+        schedule_state_save()
+        return
+    
+    # Swap in the summary of the oldest turns if a background compaction finished
+    apply_compaction()
+    
     # Add user message to history
-    message_history = cl.user_session.get("message_history")
-    # This will be added in generate_conversation
+    # This will be added in generate_conversation. Keep an O(1) snapshot to
+    # roll back a failed turn, so the history never ends with a dangling user message
+    history_snapshot = cl.user_session.get("message_history").snapshot()
+    
+    # Route simple requests to the fast profile, if configured
+    bedrock_client = cl.user_session.get("bedrock_runtime")
+    routed_profile = None
+    if request_router:
+        decision = request_router.route(
+            chat_profile,
+            message.content,
+            has_attachments=bool(images or docs),
+            has_tools=bool(get_all_tools()) or cl.user_session.get("tool_history"),
+            history_length=len(cl.user_session.get("message_history"))
+        )
+        logger.debug(f"Router decision: {decision.profile} ({decision.reason}) in {decision.overhead_ms:.3f} ms")
+        metrics_service.put_metrics(
+            {"RouterDecisionTime": decision.overhead_ms, "RoutedRequests": int(decision.routed)},
+            dimensions={"Profile": chat_profile},
+            units={"RouterDecisionTime": "Milliseconds", "RoutedRequests": "Count"}
+        )
+        if decision.routed:
+            routed_profile = decision.profile
+            model_info = bedrock_models[routed_profile]
+            max_tokens = min(max_tokens, model_info.max_tokens)
+            bedrock_client = get_bedrock_client(model_info)
+            # Routing is visible in the answer
+            msg.author = routed_profile
+            msg.elements = [
+                cl.Text(
+                    name="Routing",
+                    content=f"⚡ Simple request: answered by {routed_profile} instead of {chat_profile}",
+                    display="inline"
+                )
+            ]
+            await msg.update()
     
     api_usage = None
     try:
-        response = await generate_conversation(cl.user_session.get("bedrock_runtime"), model_info["id"], message.content, max_tokens, images, docs)
+        response = await generate_conversation(bedrock_client, model_info.id, message.content, max_tokens, images, docs, msg, routed_profile)
         
         # Handle streaming and non-streaming responses with tool support
         await process_model_response(response, msg, model_info)
+        
+        # Compact the conversation while the user reads the answer
+        schedule_compaction()
+        schedule_state_save()
 
     except ClientError as err:
         message = err.response["Error"]["Message"]
         logger.error("A client error occurred: %s", message)
+        cl.user_session.set("message_history", history_snapshot)
         await cl.Message(content=f"❌ **Error**: {message}").send()
     except Exception as e:
         logger.error(f"Unexpected error: {e}")
+        cl.user_session.set("message_history", history_snapshot)
         await cl.Message(content=f"❌ **Unexpected Error**: {str(e)}").send()
         
 @cl.on_chat_end
-def on_chat_end():
+async def on_chat_end():
+    # Element uploads are written behind the response: make sure they are
+    # done before the files are removed
+    if data_layer:
+        await data_layer.writer.flush()
+    compaction_task = cl.user_session.get("compaction_task")
+    if compaction_task and not compaction_task.done():
+        compaction_task.cancel()
+    # The conversation may be resumed on another task: finish the pending write
+    state_save_task = cl.user_session.get("state_save_task")
+    if state_save_task:
+        await asyncio.gather(state_save_task, return_exceptions=True)
     # sometimes chainlit does not automatically delete the uploaded files. 
     # So we are removing all the files to garantee the privacy
-    message_contents = cl.user_session.get("message_contents")
-    content_service.delete_contents(message_contents, True)
\ No newline at end of file
+    await upload_tracker.release(cl.user_session.get("id"))
+    # Attachments sent by S3 reference: a saved conversation still refers to
+    # them, the bucket lifecycle rule expires them
+    if attachment_transport:
+        await asyncio.to_thread(attachment_transport.release, cl.user_session.get("id"), session_state is None)
+
+startup_timer.report()
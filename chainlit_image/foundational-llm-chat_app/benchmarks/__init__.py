@@ -0,0 +1,5 @@
+"""
+Performance benchmarks of the hot path, run from the application directory, e.g.:
+
+    python -m benchmarks.thinking
+"""
@@ -0,0 +1,44 @@
+"""
+Measure the CPU and memory of logging message content with large attachments.
+
+Run with: python -m benchmarks.log_events
+"""
+
+import time
+import logging
+import tracemalloc
+
+from utils.log_utils import log_event
+
+
+def main(attachment_mb: int = 5, attachments: int = 4, rounds: int = 20) -> None:
+    logger = logging.getLogger("benchmark")
+    logger.addHandler(logging.NullHandler())
+    logger.propagate = False
+    content = [
+        {"image": {"format": "png", "source": {"bytes": bytes(attachment_mb * 1024 * 1024)}}}
+        for _ in range(attachments)
+    ] + [{"text": "Describe these images"}]
+
+    def measure(log):
+        tracemalloc.start()
+        start = time.process_time()
+        for _ in range(rounds):
+            log()
+        cpu = (time.process_time() - start) / rounds
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        return cpu * 1000, peak / (1024 * 1024)
+
+    print(f"Message content: {attachments} x {attachment_mb} MB images")
+    for level_name, level in (("off", logging.INFO), ("on", logging.DEBUG)):
+        logger.setLevel(level)
+        eager = measure(lambda: logger.debug(f"Created image content: {content}"))
+        lazy = measure(lambda: log_event(logger, logging.DEBUG, "content.created", content=content))
+        print(f"  DEBUG {level_name}:")
+        print(f"    f-string:  {eager[0]:9.3f} ms CPU/message, {eager[1]:8.1f} MB peak allocation")
+        print(f"    log_event: {lazy[0]:9.3f} ms CPU/message, {lazy[1]:8.1f} MB peak allocation")
+
+
+if __name__ == "__main__":
+    main()
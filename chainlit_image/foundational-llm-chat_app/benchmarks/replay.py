@@ -0,0 +1,48 @@
+"""
+Replay fixtures through the stream processing of the application (output
+filter and thinking accumulation) and report the time per event.
+
+Run with: python -m benchmarks.replay <fixture file or directory> [speed]
+"""
+
+import sys
+import time
+
+from services.output_filter_service import create_output_filter
+from services.replay_service import ReplayBedrockClient, list_fixtures
+from services.thinking_service import ThinkingService
+
+
+def main(path: str, speed: float = 0) -> None:
+    client = ReplayBedrockClient(list_fixtures(path), speed=speed)
+    for fixture in client._fixtures["converse_stream"]:
+        output_filter = create_output_filter(False)
+        thinking = ThinkingService()
+        text_chars = 0
+        start_wall = time.perf_counter()
+        start_cpu = time.process_time()
+        first_token = None
+        for event in client.converse_stream()["stream"]:
+            delta = event.get("contentBlockDelta", {}).get("delta", {})
+            if "text" in delta:
+                if first_token is None:
+                    first_token = time.perf_counter() - start_wall
+                text_chars += len(output_filter.feed(delta["text"]))
+            elif "reasoningContent" in delta and "text" in delta["reasoningContent"]:
+                thinking.add_thinking(delta["reasoningContent"]["text"])
+        text_chars += len(output_filter.flush())
+        cpu = time.process_time() - start_cpu
+        events = len(fixture["events"])
+        recorded = fixture["events"][-1]["t"] if events else 0
+        print(f"{fixture.get('model_id')}: {events} events, {text_chars} text chars, {thinking.thinking_length} thinking chars")
+        print(f"  recorded duration: {recorded:.3f} s, replay wall time: {time.perf_counter() - start_wall:.3f} s")
+        if first_token is not None:
+            print(f"  time to first text token: {first_token:.3f} s")
+        print(f"  processing: {1e6 * cpu / max(events, 1):.1f} us CPU/event")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: python -m benchmarks.replay <fixture file or directory> [speed]")
+        sys.exit(1)
+    main(sys.argv[1], float(sys.argv[2]) if len(sys.argv) > 2 else 0)
@@ -0,0 +1,60 @@
+"""
+Measure the CPU cost per reasoning token of accumulating and rendering thinking.
+
+Run with: python -m benchmarks.thinking
+"""
+
+import time
+import asyncio
+
+from services.thinking_service import ThinkingService, ThrottledStreamWriter
+
+
+class _Sink:
+    async def stream_token(self, text):
+        pass
+
+
+class _Concatenating:
+    thinking_text = ""
+
+
+def main(budget_tokens: int = 64000, chars_per_token: int = 4, tokens_per_delta: int = 3) -> None:
+    delta = "x" * (chars_per_token * tokens_per_delta)
+    deltas = budget_tokens // tokens_per_delta
+
+    # Previous implementation: concatenation on an attribute, which CPython
+    # cannot resize in place
+    start = time.process_time()
+    previous = _Concatenating()
+    for _ in range(deltas):
+        previous.thinking_text += delta
+    text = previous.thinking_text
+    concat_cpu = time.process_time() - start
+
+    start = time.process_time()
+    thinking = ThinkingService()
+    for _ in range(deltas):
+        thinking.add_thinking(delta)
+    blocks = thinking.get_api_blocks()
+    chunked_cpu = time.process_time() - start
+    assert len(blocks[0]["reasoningContent"]["reasoningText"]["text"]) == len(text)
+
+    async def render(interval):
+        writer = ThrottledStreamWriter(_Sink(), interval)
+        start = time.process_time()
+        for _ in range(deltas):
+            await writer.write(delta)
+        await writer.flush()
+        return time.process_time() - start, writer.updates
+
+    print(f"Reasoning budget: {budget_tokens} tokens in {deltas} deltas")
+    print(f"  string concatenation: {1e6 * concat_cpu / budget_tokens:.3f} us CPU/token")
+    print(f"  chunked accumulator:  {1e6 * chunked_cpu / budget_tokens:.3f} us CPU/token")
+    for interval in (0, 0.1):
+        cpu, updates = asyncio.run(render(interval))
+        print(f"  rendering (interval {interval}s): {1e6 * cpu / budget_tokens:.3f} us CPU/token, {updates} updates")
+
+
+if __name__ == "__main__":
+    main()
@@ -3,10 +3,14 @@ Application configuration.
 """
 
 import os
+import re
 import json
-from typing import Dict, Any, Optional
+from typing import Dict, Any
 import logging
 
+from config.model_config import ModelConfig
+from services.metrics_service import METRICS_NAMESPACE
+
 logger = logging.getLogger(__name__)
 
 
@@ -53,7 +57,7 @@ class AppConfig:
         }
 
     @staticmethod
-    def load_data_layer_config() -> Dict[str, Optional[str]]:
+    def load_data_layer_config() -> Dict[str, Any]:
         """Load data layer configuration."""
         return {
             "dynamodb_table": None
@@ -68,19 +72,242 @@ class AppConfig:
                 or os.getenv("S3_DATA_LAYER_NAME") == "None"
             )
             else str(os.getenv("S3_DATA_LAYER_NAME")),
+            # Optional endpoints to point the data layer at local stand-ins
+            # (e.g. DynamoDB Local, MinIO or LocalStack)
+            "dynamodb_endpoint_url": os.getenv("DYNAMODB_ENDPOINT_URL") or None,
+            "s3_endpoint_url": os.getenv("S3_ENDPOINT_URL") or None,
+            "max_queue_size": int(os.getenv("DATA_LAYER_MAX_QUEUE_SIZE", "1000")),
+            "multipart_threshold_mb": int(os.getenv("DATA_LAYER_MULTIPART_THRESHOLD_MB", "8")),
+        }
+
+    @staticmethod
+    def load_preprocessing_config() -> Dict[str, Any]:
+        """Load document pre-processing configuration."""
+        return {
+            "enabled": os.getenv("DOC_PREPROCESSING_ENABLED", "false").lower() == "true",
+            "workers": int(os.getenv("DOC_PREPROCESSING_WORKERS", "2")),
+        }
+
+    @staticmethod
+    def load_upload_config() -> Dict[str, Any]:
+        """Load uploaded file lifecycle configuration."""
+        return {
+            "quota_mb": float(os.getenv("UPLOAD_DISK_QUOTA_MB", "1024")),
+            "ttl": float(os.getenv("UPLOAD_TTL_SECONDS", "3600")),
+            "reap_interval": float(os.getenv("UPLOAD_REAP_INTERVAL_SECONDS", "60")),
+        }
+
+    @staticmethod
+    def load_session_state_config() -> Dict[str, Any]:
+        """Load external session state configuration."""
+        return {
+            # "none" (task memory only), "memory", "redis" or "dynamodb"
+            "backend": os.getenv("SESSION_STATE_BACKEND", "none").lower(),
+            "redis_url": os.getenv("SESSION_STATE_REDIS_URL", "redis://localhost:6379/0"),
+            "dynamodb_table": os.getenv("SESSION_STATE_DYNAMODB_TABLE") or None,
+            "dynamodb_endpoint_url": os.getenv("SESSION_STATE_DYNAMODB_ENDPOINT_URL")
+            or os.getenv("DYNAMODB_ENDPOINT_URL")
+            or None,
+            "ttl": float(os.getenv("SESSION_STATE_TTL_SECONDS", "86400")),
+        }
+
+    @staticmethod
+    def load_readiness_config() -> Dict[str, Any]:
+        """Load readiness thresholds and load metrics configuration."""
+        return {
+            "max_active_streams": int(os.getenv("READY_MAX_ACTIVE_STREAMS", "20")),
+            "max_queued_requests": int(os.getenv("READY_MAX_QUEUED_REQUESTS", "10")),
+            "max_loop_lag_ms": float(os.getenv("READY_MAX_LOOP_LAG_MS", "500")),
+            "min_memory_headroom_mb": float(os.getenv("READY_MIN_MEMORY_HEADROOM_MB", "100")),
+            "publish_interval": float(os.getenv("LOAD_METRICS_INTERVAL_SECONDS", "60")),
+        }
+
+    @staticmethod
+    def load_stall_config() -> Dict[str, Any]:
+        """Load event loop stall detection configuration."""
+        return {
+            "enabled": os.getenv("LOOP_STALL_DETECTION_ENABLED", "true").lower() == "true",
+            "threshold_ms": float(os.getenv("LOOP_STALL_THRESHOLD_MS", "200")),
+            "sample_rate": float(os.getenv("LOOP_STALL_SAMPLE_RATE", "0.1")),
+        }
+
+    @staticmethod
+    def load_log_event_config() -> Dict[str, Any]:
+        """Load hot path log event configuration."""
+        sample_rates = {}
+        if os.getenv("LOG_EVENT_SAMPLE_RATES"):
+            try:
+                sample_rates = {
+                    str(event): float(rate)
+                    for event, rate in json.loads(os.getenv("LOG_EVENT_SAMPLE_RATES")).items()
+                }
+            except (json.JSONDecodeError, AttributeError, ValueError) as e:
+                logger.error(f"Error parsing LOG_EVENT_SAMPLE_RATES: {e}")
+        return {
+            "max_chars": int(os.getenv("LOG_EVENT_MAX_CHARS", "500")),
+            "sample_rates": sample_rates,
+        }
+
+    @staticmethod
+    def load_replay_config() -> Dict[str, Any]:
+        """Load Bedrock response recording and replay configuration."""
+        return {
+            "record_dir": os.getenv("BEDROCK_RECORD_DIR") or None,
+            "replay_fixtures": os.getenv("BEDROCK_REPLAY_FIXTURES") or None,
+            "replay_speed": float(os.getenv("BEDROCK_REPLAY_SPEED", "1")),
+        }
+
+    @staticmethod
+    def load_batch_config() -> Dict[str, Any]:
+        """Load batch inference configuration."""
+        return {
+            "concurrency": int(os.getenv("BATCH_CONCURRENCY", "8")),
+            "initial_rate": float(os.getenv("BATCH_INITIAL_RATE", "2")),
+            "max_rate": float(os.getenv("BATCH_MAX_RATE", "20")),
+            "max_attempts": int(os.getenv("BATCH_MAX_ATTEMPTS", "6")),
+        }
+
+    @staticmethod
+    def load_openai_api_config() -> Dict[str, Any]:
+        """Load OpenAI-compatible API configuration."""
+        return {
+            "enabled": os.getenv("OPENAI_API_ENABLED", "false").lower() == "true",
+            "max_concurrency": int(os.getenv("OPENAI_API_MAX_CONCURRENCY", "8")),
+        }
+
+    @staticmethod
+    def load_tool_result_config() -> Dict[str, Any]:
+        """Load MCP tool result size configuration."""
+        tool_limits = {}
+        if os.getenv("MCP_TOOL_RESULT_LIMITS"):
+            try:
+                tool_limits = {
+                    str(tool): int(limit)
+                    for tool, limit in json.loads(os.getenv("MCP_TOOL_RESULT_LIMITS")).items()
+                }
+            except (json.JSONDecodeError, AttributeError, ValueError) as e:
+                logger.error(f"Error parsing MCP_TOOL_RESULT_LIMITS: {e}")
+        return {
+            "max_chars": int(os.getenv("MCP_TOOL_RESULT_MAX_CHARS", "20000")),
+            "tool_limits": tool_limits,
+        }
+
+    @staticmethod
+    def load_tool_schema_config() -> Dict[str, Any]:
+        """Load MCP tool schema cache configuration."""
+        return {
+            "cache_size": int(os.getenv("MCP_TOOL_SCHEMA_CACHE_SIZE", "256")),
         }
 
     @staticmethod
-    def load_bedrock_models() -> Dict[str, Any]:
-        """Load Bedrock models configuration."""
+    def load_attachment_config() -> Dict[str, Any]:
+        """Load attachment transport configuration."""
+        bucket = os.getenv("ATTACHMENT_S3_BUCKET") or os.getenv("S3_DATA_LAYER_NAME")
+        return {
+            "s3_bucket": None if not bucket or bucket == "None" else str(bucket),
+            "s3_endpoint_url": os.getenv("ATTACHMENT_S3_ENDPOINT_URL") or os.getenv("S3_ENDPOINT_URL") or None,
+            "s3_threshold_mb": float(os.getenv("ATTACHMENT_S3_THRESHOLD_MB", "1")),
+            "s3_prefix": os.getenv("ATTACHMENT_S3_PREFIX", "attachments/"),
+            "s3_bucket_owner": os.getenv("ATTACHMENT_S3_BUCKET_OWNER") or None,
+        }
+
+    @staticmethod
+    def load_usage_config() -> Dict[str, Any]:
+        """Load usage accounting configuration."""
+        return {
+            # Enforced per task, on the spending seen by that task
+            "daily_budget": None
+            if (
+                not os.getenv("USAGE_DAILY_BUDGET_USD")
+                or os.getenv("USAGE_DAILY_BUDGET_USD") == "None"
+            )
+            else float(os.getenv("USAGE_DAILY_BUDGET_USD")),
+            "flush_interval": float(os.getenv("USAGE_FLUSH_INTERVAL_SECONDS", "60")),
+            "sink": os.getenv("USAGE_SINK", "log"),
+        }
+
+    @staticmethod
+    def load_metrics_config() -> Dict[str, Any]:
+        """Load custom metrics configuration."""
+        return {
+            "enabled": os.getenv("METRICS_ENABLED", "true").lower() == "true",
+            "namespace": os.getenv("METRICS_NAMESPACE", METRICS_NAMESPACE),
+        }
+
+    @staticmethod
+    def load_output_filter_config() -> Dict[str, Any]:
+        """Load model output filter configuration."""
+        patterns = []
+        if os.getenv("OUTPUT_REDACTION_PATTERNS"):
+            try:
+                patterns = [
+                    (re.compile(pattern), "[REDACTED]")
+                    for pattern in json.loads(os.getenv("OUTPUT_REDACTION_PATTERNS"))
+                ]
+            except (json.JSONDecodeError, TypeError, re.error) as e:
+                logger.error(f"Ignoring invalid OUTPUT_REDACTION_PATTERNS: {e}")
+                patterns = []
+        return {"redaction_patterns": patterns}
+
+    @staticmethod
+    def load_thinking_config() -> Dict[str, Any]:
+        """Load thinking rendering configuration."""
+        return {
+            "update_interval": float(os.getenv("THINKING_UPDATE_INTERVAL_MS", "100")) / 1000,
+        }
+
+    @staticmethod
+    def load_compare_config() -> Dict[str, Any]:
+        """Load compare mode configuration."""
+        return {
+            "max_profiles": int(os.getenv("COMPARE_MAX_PROFILES", "3")),
+        }
+
+    @staticmethod
+    def load_router_config() -> Dict[str, Any]:
+        """Load request router configuration."""
+        return {
+            "fast_profile": (
+                None
+                if not os.getenv("ROUTER_FAST_PROFILE")
+                or os.getenv("ROUTER_FAST_PROFILE") == "None"
+                else str(os.getenv("ROUTER_FAST_PROFILE"))
+            ),
+            "max_chars": int(os.getenv("ROUTER_MAX_CHARS", "400")),
+        }
+
+    @staticmethod
+    def load_compaction_config() -> Dict[str, Any]:
+        """Load background conversation compaction configuration."""
+        return {
+            "profile": (
+                None
+                if not os.getenv("COMPACTION_PROFILE")
+                or os.getenv("COMPACTION_PROFILE") == "None"
+                else str(os.getenv("COMPACTION_PROFILE"))
+            ),
+            "threshold_messages": int(os.getenv("COMPACTION_THRESHOLD_MESSAGES", "20")),
+            "keep_messages": int(os.getenv("COMPACTION_KEEP_MESSAGES", "6")),
+        }
+
+    @staticmethod
+    def load_bedrock_models() -> Dict[str, ModelConfig]:
+        """Load, parse and validate the Bedrock models configuration."""
         if not os.getenv("BEDROCK_MODELS"):
             logger.error("BEDROCK_MODELS environment variable not set")
             return {}
 
         try:
-            models = json.loads(os.getenv("BEDROCK_MODELS"))
-            logger.debug(f"Loaded {len(models)} Bedrock models")
-            return models
+            raw_models = json.loads(os.getenv("BEDROCK_MODELS"))
         except json.JSONDecodeError:
             logger.error("Error decoding BEDROCK_MODELS JSON")
             return {}
+
+        models = {}
+        for name, data in raw_models.items():
+            try:
+                models[name] = ModelConfig.from_dict(name, data)
+            except ValueError as e:
+                logger.error(f"Skipping invalid model configuration: {e}")
+        logger.debug(f"Loaded {len(models)} Bedrock models")
+        return models
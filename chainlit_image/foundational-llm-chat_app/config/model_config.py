@@ -0,0 +1,139 @@
+"""
+Typed Bedrock model configuration.
+"""
+
+from dataclasses import dataclass
+from typing import Dict, Any, Optional, Tuple
+
+
+@dataclass(frozen=True, slots=True)
+class ReasoningConfig:
+    """Reasoning capabilities of a model."""
+
+    enabled: bool = False
+    openai_reasoning_modalities: bool = False
+    no_reasoning_params: bool = False
+    hybrid: bool = False
+    budget_thinking_tokens: bool = False
+    temperature_forced: Optional[float] = None
+
+    @classmethod
+    def from_value(cls, value: Any) -> "ReasoningConfig":
+        """
+        Parse the `reasoning` field of a model configuration.
+
+        Args:
+            value: Either a boolean or a reasoning configuration object.
+
+        Returns:
+            The parsed reasoning configuration.
+        """
+        if isinstance(value, dict):
+            temperature_forced = value.get("temperature_forced")
+            return cls(
+                enabled=bool(value.get("enabled", True)),
+                openai_reasoning_modalities=bool(value.get("openai_reasoning_modalities", False)),
+                no_reasoning_params=bool(value.get("no_reasoning_params", False)),
+                hybrid=bool(value.get("hybrid", False)),
+                budget_thinking_tokens=bool(value.get("budget_thinking_tokens", False)),
+                temperature_forced=float(temperature_forced) if temperature_forced is not None else None,
+            )
+        return cls(enabled=bool(value))
+
+
+@dataclass(frozen=True, slots=True)
+class ModelConfig:
+    """Configuration of a Bedrock model, parsed and validated once at startup."""
+
+    name: str
+    id: str
+    regions: Tuple[str, ...] = ()
+    inference_profile_region: Optional[str] = None
+    input_1k_price: float = 0.0
+    output_1k_price: float = 0.0
+    cache_read_1k_price: float = 0.0
+    cache_write_1k_price: float = 0.0
+    max_tokens: int = 4096
+    context_window: Optional[int] = None
+    vision: bool = False
+    document: bool = False
+    tool: bool = False
+    streaming: bool = True
+    # Whether large attachments can be sent by S3 reference (s3Location)
+    s3_attachments: bool = False
+    reasoning: ReasoningConfig = ReasoningConfig()
+    system_prompt: str = ""
+    default: bool = False
+
+    @property
+    def region_name(self) -> Optional[str]:
+        """Region of the Bedrock runtime client used for this model."""
+        if len(self.regions) > 1 and self.inference_profile_region:
+            return self.inference_profile_region
+        return self.regions[0] if self.regions else None
+
+    @property
+    def is_claude(self) -> bool:
+        """Whether the model is an Anthropic Claude model."""
+        return "claude" in self.id.lower()
+
+    @classmethod
+    def from_dict(cls, name: str, data: Dict[str, Any]) -> "ModelConfig":
+        """
+        Parse and validate a model entry of the BEDROCK_MODELS configuration.
+
+        Args:
+            name: The chat profile name of the model.
+            data: The model configuration.
+
+        Returns:
+            The parsed model configuration.
+
+        Raises:
+            ValueError: If the model configuration is invalid.
+        """
+        if not isinstance(data, dict):
+            raise ValueError(f"Model {name}: configuration must be an object")
+        if not data.get("id"):
+            raise ValueError(f"Model {name}: missing id")
+
+        regions = data.get("region", ())
+        if isinstance(regions, str):
+            regions = (regions,)
+        inference_profile = data.get("inference_profile") or {}
+        if len(regions) > 1 and not inference_profile.get("region"):
+            raise ValueError(f"Model {name}: inference_profile.region is required with multiple regions")
+
+        cost = data.get("cost") or {}
+        try:
+            input_1k_price = float(cost.get("input_1k_price", 0))
+            output_1k_price = float(cost.get("output_1k_price", 0))
+            cache_read_1k_price = float(cost.get("cache_read_1k_price", input_1k_price))
+            cache_write_1k_price = float(cost.get("cache_write_1k_price", input_1k_price))
+            max_tokens = int(data.get("maxTokens", 4096))
+            context_window = int(data["contextWindow"]) if data.get("contextWindow") else None
+        except (TypeError, ValueError) as e:
+            raise ValueError(f"Model {name}: invalid numeric value ({e})")
+        if max_tokens < 1:
+            raise ValueError(f"Model {name}: maxTokens must be positive")
+
+        return cls(
+            name=name,
+            id=data["id"],
+            regions=tuple(regions),
+            inference_profile_region=inference_profile.get("region"),
+            input_1k_price=input_1k_price,
+            output_1k_price=output_1k_price,
+            cache_read_1k_price=cache_read_1k_price,
+            cache_write_1k_price=cache_write_1k_price,
+            max_tokens=max_tokens,
+            context_window=context_window,
+            vision=bool(data.get("vision", False)),
+            document=bool(data.get("document", False)),
+            tool=bool(data.get("tool", False)),
+            streaming=bool(data.get("streaming", True)),
+            s3_attachments=bool(data.get("s3Attachments", False)),
+            reasoning=ReasoningConfig.from_value(data.get("reasoning", False)),
+            system_prompt=data.get("system_prompt", "") or "",
+            default=bool(data.get("default", False)),
+        )
@@ -0,0 +1,283 @@
+"""
+Service for sending large attachments to Bedrock by S3 reference.
+"""
+
+import os
+import time
+import uuid
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Set, Tuple
+
+import boto3
+from boto3.s3.transfer import TransferConfig
+
+logger = logging.getLogger(__name__)
+
+
+class AttachmentTransport:
+    """
+    Chooses how an attachment is sent to Bedrock: inline bytes or `s3Location`.
+
+    Large attachments are uploaded once to S3 (multipart, streamed from disk) and
+    referenced by URI, so they are neither held in memory nor serialized into
+    every request of the conversation. Small attachments stay inline.
+
+    The same file is uploaded once and shared by the sessions sending it; an
+    object is deleted when the last session using it is released.
+    """
+
+    def __init__(
+        self,
+        bucket_name: str,
+        s3_client: Any,
+        threshold_mb: float = 1.0,
+        prefix: str = "attachments/",
+        bucket_owner: Optional[str] = None,
+        max_cached: int = 1024,
+        max_age: float = 12 * 3600,
+    ):
+        """
+        Initialize the transport.
+
+        Args:
+            bucket_name: The S3 bucket of the uploaded attachments.
+            s3_client: A boto3 S3 client (or a local stand-in).
+            threshold_mb: Attachments larger than this are sent by S3 reference.
+            prefix: Key prefix of the uploaded attachments.
+            bucket_owner: Optional account ID owning the bucket.
+            max_cached: Maximum uploaded attachments remembered for reuse.
+            max_age: Seconds after which an attachment sent again is uploaded again
+                (shorter than the expiration of the objects in the bucket).
+        """
+        self.bucket_name = bucket_name
+        self.s3_client = s3_client
+        self.threshold_bytes = int(threshold_mb * 1024 * 1024)
+        self.prefix = prefix
+        self.bucket_owner = bucket_owner
+        self.transfer_config = TransferConfig(multipart_threshold=8 * 1024 * 1024)
+        self.max_cached = max_cached
+        self.max_age = max_age
+        self.uploaded = 0
+        self.deleted = 0
+        self.delete_failed = 0
+        # Content hash -> (`s3Location`, upload time) of the uploaded attachments, least recently used first
+        self.locations: "OrderedDict[str, Tuple[Dict[str, Any], float]]" = OrderedDict()
+        # URI -> size of the uploaded attachments, for token estimates
+        self._sizes: "OrderedDict[str, int]" = OrderedDict()
+        # Session ID -> URIs sent by the session, and URI -> sessions using it
+        self._session_uris: Dict[str, Set[str]] = {}
+        self._uri_sessions: Dict[str, Set[str]] = {}
+        # Sources are built in worker threads
+        self._lock = threading.Lock()
+
+    def use_s3(self, size: int, model_config) -> bool:
+        """
+        Check if an attachment is sent by S3 reference.
+
+        Args:
+            size: The attachment size in bytes.
+            model_config: The ModelConfig of the model receiving the attachment.
+
+        Returns:
+            True if the model supports S3 references and the attachment is large.
+        """
+        return bool(model_config and model_config.s3_attachments and size > self.threshold_bytes)
+
+    def upload(
+        self, path: str, name: str, mime: Optional[str] = None, content_hash: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        Upload an attachment.
+
+        Args:
+            path: The local file path.
+            name: The file name.
+            mime: The MIME type.
+            content_hash: Optional content hash used as key, instead of a random one.
+
+        Returns:
+            The `s3Location` of the uploaded attachment.
+        """
+        key = f"{self.prefix}{content_hash or uuid.uuid4().hex}/{os.path.basename(name)}"
+        extra_args = {"ContentType": mime} if mime else None
+        self.s3_client.upload_file(
+            path, self.bucket_name, key, ExtraArgs=extra_args, Config=self.transfer_config
+        )
+        self.uploaded += 1
+        logger.debug(f"Uploaded attachment {name} to s3://{self.bucket_name}/{key}")
+        location = {"uri": f"s3://{self.bucket_name}/{key}"}
+        if self.bucket_owner:
+            location["bucketOwner"] = self.bucket_owner
+        return location
+
+    def source(self, attachment, model_config, session_id: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Build the content block source of an attachment.
+
+        Args:
+            attachment: The AttachmentDescriptor of the attachment.
+            model_config: The ModelConfig of the model receiving the attachment.
+            session_id: The session sending the attachment, released with release().
+
+        Returns:
+            A Converse `source`: {"s3Location": ...} or {"bytes": ...}.
+        """
+        if not self.use_s3(attachment.size, model_config):
+            with open(attachment.path, "rb") as f:
+                return {"bytes": f.read()}
+
+        # The same file is uploaded once, even if it is sent again
+        with self._lock:
+            cached = self.locations.get(attachment.content_hash)
+            if cached is not None and time.monotonic() - cached[1] < self.max_age:
+                self.locations.move_to_end(attachment.content_hash)
+                location = cached[0]
+            else:
+                location = None
+        if location is None:
+            location = self.upload(attachment.path, attachment.name, attachment.mime, attachment.content_hash)
+        with self._lock:
+            self.locations[attachment.content_hash] = (location, time.monotonic())
+            self.locations.move_to_end(attachment.content_hash)
+            while len(self.locations) > self.max_cached:
+                self.locations.popitem(last=False)
+            self._sizes[location["uri"]] = attachment.size
+            self._sizes.move_to_end(location["uri"])
+            while len(self._sizes) > self.max_cached:
+                self._sizes.popitem(last=False)
+            if session_id is not None:
+                self._session_uris.setdefault(session_id, set()).add(location["uri"])
+                self._uri_sessions.setdefault(location["uri"], set()).add(session_id)
+        return {"s3Location": location}
+
+    def for_session(self, session_id: str) -> "SessionAttachmentTransport":
+        """
+        Get the transport of a session, recording the attachments it sends.
+
+        Args:
+            session_id: The session ID.
+
+        Returns:
+            A transport usable wherever an AttachmentTransport is.
+        """
+        return SessionAttachmentTransport(self, session_id)
+
+    def size_of(self, uri: str) -> Optional[int]:
+        """
+        Get the size of an attachment sent by S3 reference.
+
+        Args:
+            uri: The S3 URI of the attachment.
+
+        Returns:
+            Its size, the size threshold (a lower bound) for an attachment of this
+            transport no longer remembered, or None for another URI.
+        """
+        with self._lock:
+            size = self._sizes.get(uri)
+        if size is None and uri.startswith(f"s3://{self.bucket_name}/{self.prefix}"):
+            return self.threshold_bytes
+        return size
+
+    def release(self, session_id: str, delete: bool = True) -> int:
+        """
+        Release the attachments of a session, deleting those no other session uses.
+
+        Args:
+            session_id: The session ID.
+            delete: Whether to delete the objects (False keeps them, e.g. when the
+                conversation can be resumed, and only forgets the session).
+
+        Returns:
+            The number of deleted objects.
+        """
+        unused = []
+        with self._lock:
+            for uri in self._session_uris.pop(session_id, set()):
+                sessions = self._uri_sessions.get(uri)
+                if sessions is not None:
+                    sessions.discard(session_id)
+                    if not sessions:
+                        del self._uri_sessions[uri]
+                        unused.append(uri)
+            if not delete:
+                return 0
+            for uri in unused:
+                # Sent again later: upload it again
+                for content_hash, (location, _) in list(self.locations.items()):
+                    if location["uri"] == uri:
+                        del self.locations[content_hash]
+                self._sizes.pop(uri, None)
+        keys = [uri[len(f"s3://{self.bucket_name}/"):] for uri in unused]
+        deleted = 0
+        for batch_start in range(0, len(keys), 1000):
+            batch = keys[batch_start:batch_start + 1000]
+            try:
+                # Quiet: only the keys that could not be deleted are reported
+                response = self.s3_client.delete_objects(
+                    Bucket=self.bucket_name,
+                    Delete={"Objects": [{"Key": key} for key in batch], "Quiet": True},
+                )
+            except Exception as e:
+                # The bucket lifecycle rule removes them eventually
+                self.delete_failed += len(batch)
+                logger.error(f"Error deleting {len(batch)} attachments: {e}")
+                continue
+            errors = response.get("Errors", [])
+            for error in errors:
+                logger.error(f"Error deleting attachment {error.get('Key')}: {error.get('Code')} {error.get('Message')}")
+            self.delete_failed += len(errors)
+            deleted += len(batch) - len(errors)
+        self.deleted += deleted
+        if keys:
+            logger.debug(f"Deleted {deleted} of {len(keys)} attachments of session {session_id}")
+        return deleted
+
+
+class SessionAttachmentTransport:
+    """The attachment transport of a session: records the attachments it sends."""
+
+    def __init__(self, transport: AttachmentTransport, session_id: str):
+        """
+        Initialize the session transport.
+
+        Args:
+            transport: The shared transport.
+            session_id: The session ID.
+        """
+        self.transport = transport
+        self.session_id = session_id
+
+    def source(self, attachment, model_config) -> Dict[str, Any]:
+        """Build the content block source of an attachment (see AttachmentTransport.source)."""
+        return self.transport.source(attachment, model_config, self.session_id)
+
+
+def create_attachment_transport(
+    attachment_config: Dict[str, Any],
+    region_name: str,
+) -> Optional[AttachmentTransport]:
+    """
+    Create the attachment transport from the attachment configuration.
+
+    Args:
+        attachment_config: Output of AppConfig.load_attachment_config().
+        region_name: The AWS region of the bucket.
+
+    Returns:
+        The transport, or None if no bucket is configured.
+    """
+    if not attachment_config["s3_bucket"]:
+        return None
+    s3_kwargs = {"region_name": region_name}
+    if attachment_config.get("s3_endpoint_url"):
+        s3_kwargs["endpoint_url"] = attachment_config["s3_endpoint_url"]
+    return AttachmentTransport(
+        bucket_name=attachment_config["s3_bucket"],
+        s3_client=boto3.client("s3", **s3_kwargs),
+        threshold_mb=attachment_config["s3_threshold_mb"],
+        prefix=attachment_config["s3_prefix"],
+        bucket_owner=attachment_config.get("s3_bucket_owner"),
+    )
@@ -0,0 +1,521 @@
+"""
+Service for running prompts in batch through the chat profiles, outside of Chainlit.
+
+Requests are built with the same request builder, profile capabilities, system
+prompts and default settings as the chat, so batch results match what users get.
+
+Run with: python -m services.batch_service <input.jsonl> <output.jsonl> [options]
+"""
+
+import os
+import json
+import time
+import random
+import asyncio
+import logging
+from typing import Dict, Any, Callable, Iterator, List, Optional, Set, Tuple
+
+from services.request_service import build_request, build_request_template, default_settings
+from services.usage_service import PriceTable, converse_usage
+
+logger = logging.getLogger(__name__)
+
+# Errors worth retrying: the request may succeed later
+RETRYABLE_ERROR_CODES = {
+    "ThrottlingException",
+    "TooManyRequestsException",
+    "ServiceUnavailableException",
+    "ModelNotReadyException",
+    "InternalServerException",
+    "ModelTimeoutException",
+}
+# Errors meaning the request rate is too high
+THROTTLING_ERROR_CODES = {"ThrottlingException", "TooManyRequestsException"}
+
+# Settings a record may override (see build_request_template)
+SETTING_KEYS = (
+    "thinking_enabled",
+    "temperature",
+    "reasoning_effort",
+    "reasoning_budget",
+    "interleaved_thinking",
+    "max_tokens",
+)
+
+
+def error_code(error: Exception) -> str:
+    """The AWS error code of an exception (empty for other errors)."""
+    return getattr(error, "response", {}).get("Error", {}).get("Code", "")
+
+
+class AdaptiveRateLimiter:
+    """
+    Request rate limiter adapting to throttling (additive increase, multiplicative decrease).
+
+    Requests are spaced by the inverse of the current rate. Each success raises
+    the rate a little; a throttling error halves it, once per burst of errors.
+    """
+
+    def __init__(self, initial_rate: float = 2.0, max_rate: float = 20.0, min_rate: float = 0.1, increase: float = 0.5):
+        """
+        Initialize the limiter.
+
+        Args:
+            initial_rate: Requests per second to start with.
+            max_rate: Highest requests per second.
+            min_rate: Lowest requests per second.
+            increase: Requests per second gained after one second of successes.
+        """
+        self.max_rate = max_rate
+        self.min_rate = min_rate
+        self.increase = increase
+        self.rate = min(max(initial_rate, min_rate), max_rate)
+        self.throttles = 0
+        self._next_slot = 0.0
+        self._last_decrease = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        """Wait for the next request slot."""
+        async with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + 1 / self.rate
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+    def on_success(self) -> None:
+        """Raise the rate after a successful request."""
+        self.rate = min(self.max_rate, self.rate + self.increase / self.rate)
+
+    def on_throttle(self) -> None:
+        """Halve the rate after a throttling error (errors of the same burst count once)."""
+        self.throttles += 1
+        now = time.monotonic()
+        if now - self._last_decrease < 1 / self.rate:
+            return
+        self._last_decrease = now
+        self.rate = max(self.min_rate, self.rate / 2)
+        # Requests already scheduled at the old rate are pushed back
+        self._next_slot = max(self._next_slot, now) + 1 / self.rate
+        logger.info(f"Throttled: request rate lowered to {self.rate:.2f}/s")
+
+
+def read_records(path: str) -> Iterator[Dict[str, Any]]:
+    """
+    Read the input records, one JSON object per line.
+
+    A record has a "prompt" (text) or "messages" (Converse messages), and
+    optionally an "id" (defaults to the line number), a "profile", a
+    "system_prompt" and "settings" overriding the chat defaults.
+
+    Args:
+        path: The input JSONL file.
+
+    Yields:
+        The records, with their "id".
+    """
+    with open(path, encoding="utf-8") as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError as e:
+                record = {"error": f"Invalid JSON: {e}"}
+            if not isinstance(record, dict):
+                record = {"error": "A record must be a JSON object"}
+            record.setdefault("id", str(line_number))
+            yield record
+
+
+def load_checkpoint(path: str) -> Set[str]:
+    """
+    Find the records already answered by an earlier run, from its output file.
+
+    Args:
+        path: The output JSONL file.
+
+    Returns:
+        The ids of the successful results (failed records are run again).
+    """
+    done = set()
+    if not os.path.exists(path):
+        return done
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                result = json.loads(line)
+            except json.JSONDecodeError:
+                # Last line cut by an interrupted run
+                continue
+            if result.get("status") == "ok":
+                done.add(str(result["id"]))
+    return done
+
+
+def build_messages(record: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    Build the Converse messages of a record.
+
+    Args:
+        record: The input record.
+
+    Returns:
+        The conversation messages.
+
+    Raises:
+        ValueError: If the record has neither a prompt nor messages, or invalid messages.
+    """
+    if record.get("messages"):
+        if not isinstance(record["messages"], list) or not all(isinstance(message, dict) for message in record["messages"]):
+            raise ValueError("'messages' must be a list of Converse messages")
+        return record["messages"]
+    if isinstance(record.get("prompt"), str) and record["prompt"].strip():
+        return [{"role": "user", "content": [{"text": record["prompt"]}]}]
+    raise ValueError("A record needs a non-empty 'prompt' or 'messages'")
+
+
+def parse_response(response: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Extract the answer of a Converse response.
+
+    Args:
+        response: The Converse response.
+
+    Returns:
+        The answer text, the reasoning text (if any) and the stop reason.
+    """
+    text, reasoning = [], []
+    for block in response.get("output", {}).get("message", {}).get("content", []):
+        if "text" in block:
+            text.append(block["text"])
+        elif "reasoningContent" in block:
+            reasoning.append(block["reasoningContent"].get("reasoningText", {}).get("text", ""))
+    parsed = {"text": "".join(text), "stop_reason": response.get("stopReason")}
+    if reasoning:
+        parsed["reasoning"] = "".join(reasoning)
+    return parsed
+
+
+class BatchRunner:
+    """
+    Runs records through the chat profiles with bounded concurrency and an
+    adaptive request rate per profile, retrying transient errors.
+    """
+
+    def __init__(
+        self,
+        bedrock_models: Dict[str, Any],
+        capabilities: Dict[str, Any],
+        system_prompts: Dict[str, str],
+        client_factory: Callable[[Optional[str]], Any],
+        default_profile: str,
+        concurrency: int = 8,
+        initial_rate: float = 2.0,
+        max_rate: float = 20.0,
+        max_attempts: int = 6,
+    ):
+        """
+        Initialize the runner.
+
+        Args:
+            bedrock_models: The ModelConfig of each profile, keyed by profile name.
+            capabilities: The compiled capabilities of each profile.
+            system_prompts: The system prompt text of each profile.
+            client_factory: Creates the Bedrock runtime client of a region.
+            default_profile: Profile of the records without one.
+            concurrency: Maximum requests in flight.
+            initial_rate: Requests per second of each profile to start with.
+            max_rate: Highest requests per second of each profile.
+            max_attempts: Attempts of a record before it is reported as failed.
+        """
+        self.bedrock_models = bedrock_models
+        self.capabilities = capabilities
+        self.system_prompts = system_prompts
+        self.client_factory = client_factory
+        self.default_profile = default_profile
+        self.concurrency = concurrency
+        self.initial_rate = initial_rate
+        self.max_rate = max_rate
+        self.max_attempts = max_attempts
+        self.limiters: Dict[str, AdaptiveRateLimiter] = {}
+        self.price_tables = {profile: PriceTable(model_config) for profile, model_config in bedrock_models.items()}
+        self._clients: Dict[Optional[str], Any] = {}
+        self._templates: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        self.stats = {"ok": 0, "error": 0, "skipped": 0, "input_tokens": 0, "output_tokens": 0, "cost": 0.0}
+
+    def _client(self, region_name: Optional[str]):
+        if region_name not in self._clients:
+            self._clients[region_name] = self.client_factory(region_name)
+        return self._clients[region_name]
+
+    def _limiter(self, profile: str) -> AdaptiveRateLimiter:
+        if profile not in self.limiters:
+            self.limiters[profile] = AdaptiveRateLimiter(self.initial_rate, self.max_rate)
+        return self.limiters[profile]
+
+    def request_template(self, profile: str, record: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Get the request template of a record, cached per profile and overrides.
+
+        Args:
+            profile: The chat profile of the record.
+            record: The input record.
+
+        Returns:
+            The request template, built as the chat builds it.
+        """
+        overrides = {key: value for key, value in (record.get("settings") or {}).items() if key in SETTING_KEYS}
+        if "system_prompt" in record:
+            overrides["system_prompt"] = record["system_prompt"]
+        key = (profile, json.dumps(overrides, sort_keys=True))
+        template = self._templates.get(key)
+        if template is None:
+            capabilities = self.capabilities[profile]
+            settings = default_settings(capabilities, self.system_prompts.get(profile, ""))
+            settings.update(overrides)
+            if "system_prompt" in overrides:
+                settings["system_prompt"] = [{"text": overrides["system_prompt"] or ""}]
+            # As in the chat, the maximum tokens never exceed the model maximum
+            settings["max_tokens"] = min(int(settings["max_tokens"]), capabilities.max_tokens)
+            if not capabilities.reasoning_enabled:
+                settings["thinking_enabled"] = False
+            elif capabilities.openai_reasoning:
+                settings["thinking_enabled"] = True
+            template = self._templates[key] = build_request_template(capabilities, settings, [])
+        return template
+
+    async def run_record(self, record: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Answer one record.
+
+        Args:
+            record: The input record.
+
+        Returns:
+            The result: id, profile, status, answer, usage, cost, latency and
+            attempts, or the error.
+        """
+        profile = record.get("profile") or self.default_profile
+        result: Dict[str, Any] = {"id": str(record["id"]), "profile": profile, "status": "error", "attempts": 0}
+        try:
+            if "error" in record:
+                raise ValueError(record["error"])
+            if not isinstance(record.get("settings") or {}, dict):
+                raise ValueError("'settings' must be an object")
+            if profile not in self.bedrock_models:
+                raise ValueError(f"Unknown profile: {profile}")
+            model_config = self.bedrock_models[profile]
+            api_params = build_request(self.request_template(profile, record), model_config.id, build_messages(record))
+        except (ValueError, TypeError) as e:
+            result["error"] = str(e)
+            return result
+
+        result["model_id"] = model_config.id
+        client = self._client(model_config.region_name)
+        limiter = self._limiter(profile)
+        for attempt in range(1, self.max_attempts + 1):
+            result["attempts"] = attempt
+            await limiter.acquire()
+            start = time.perf_counter()
+            try:
+                response = await asyncio.to_thread(client.converse, **api_params)
+            except Exception as e:
+                code = error_code(e)
+                if code in THROTTLING_ERROR_CODES:
+                    limiter.on_throttle()
+                if code not in RETRYABLE_ERROR_CODES or attempt == self.max_attempts:
+                    result["error"] = str(e)
+                    return result
+                # Exponential backoff with full jitter, capped at 20 seconds
+                await asyncio.sleep(random.uniform(0, min(20.0, 0.5 * (2 ** attempt))))
+                continue
+            limiter.on_success()
+            usage = converse_usage(response.get("usage", {}))
+            result.update(parse_response(response))
+            result.update(
+                status="ok",
+                usage=usage,
+                cost=self.price_tables[profile].cost(usage),
+                latency=round(time.perf_counter() - start, 3),
+            )
+            return result
+        return result
+
+    async def run(self, records: Iterator[Dict[str, Any]], output_path: str) -> Dict[str, Any]:
+        """
+        Answer records, appending each result to the output as soon as it is known.
+
+        Records answered by an earlier run into the same output are skipped, so an
+        interrupted run resumes where it stopped.
+
+        Args:
+            records: The input records.
+            output_path: The output JSONL file.
+
+        Returns:
+            The run statistics.
+        """
+        done = load_checkpoint(output_path)
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.concurrency * 2)
+        start = time.perf_counter()
+
+        with open(output_path, "a+", encoding="utf-8") as output:
+            # A line cut by an interrupted run must not swallow the next result
+            if output.tell() > 0:
+                output.seek(output.tell() - 1)
+                if output.read(1) != "\n":
+                    output.write("\n")
+
+            async def work():
+                while True:
+                    record = await queue.get()
+                    if record is None:
+                        return
+                    try:
+                        result = await self.run_record(record)
+                    except Exception as e:
+                        # A worker never dies on a record: the others would wait for it forever
+                        logger.exception(f"Unexpected error on record {record.get('id')}")
+                        result = {
+                            "id": str(record.get("id")),
+                            "profile": record.get("profile") or self.default_profile,
+                            "status": "error",
+                            "attempts": 0,
+                            "error": f"{type(e).__name__}: {e}",
+                        }
+                    output.write(json.dumps(result, ensure_ascii=False) + "\n")
+                    output.flush()
+                    self._count(result)
+
+            workers = [asyncio.create_task(work()) for _ in range(self.concurrency)]
+            try:
+                for record in records:
+                    if str(record["id"]) in done:
+                        self.stats["skipped"] += 1
+                        continue
+                    done.add(str(record["id"]))
+                    await queue.put(record)
+                for _ in workers:
+                    await queue.put(None)
+                await asyncio.gather(*workers)
+            finally:
+                for worker in workers:
+                    worker.cancel()
+
+        self.stats["duration"] = round(time.perf_counter() - start, 3)
+        self.stats["rates"] = {profile: round(limiter.rate, 2) for profile, limiter in self.limiters.items()}
+        self.stats["throttles"] = sum(limiter.throttles for limiter in self.limiters.values())
+        return self.stats
+
+    def _count(self, result: Dict[str, Any]) -> None:
+        self.stats[result["status"]] += 1
+        if result["status"] == "ok":
+            self.stats["input_tokens"] += result["usage"]["inputTokenCount"]
+            self.stats["output_tokens"] += result["usage"]["outputTokenCount"]
+            self.stats["cost"] += result["cost"]
+        else:
+            logger.warning(f"Record {result['id']} failed: {result.get('error')}")
+        answered = self.stats["ok"] + self.stats["error"]
+        if answered % 100 == 0:
+            logger.info(f"{answered} records answered ({self.stats['error']} failed), cost ${self.stats['cost']:.4f}")
+
+
+def fetch_system_prompts(
+    bedrock_models: Dict[str, Any],
+    system_prompt_list: Dict[str, Any],
+    agent_client_factory: Callable[[], Any],
+) -> Dict[str, str]:
+    """
+    Resolve the system prompt of each profile as the chat does: the Prompt
+    Manager prompt when one is configured, the model system prompt otherwise.
+
+    Args:
+        bedrock_models: The ModelConfig of each profile, keyed by profile name.
+        system_prompt_list: The Prompt Manager prompt of each profile.
+        agent_client_factory: Creates the Bedrock agent client.
+
+    Returns:
+        The system prompt text of each profile.
+    """
+    from utils.message_utils import extract_and_process_prompt
+
+    system_prompts = {profile: model_config.system_prompt for profile, model_config in bedrock_models.items()}
+    agent_client = None
+    for profile, prompt in system_prompt_list.items():
+        if profile not in system_prompts:
+            continue
+        try:
+            agent_client = agent_client or agent_client_factory()
+            prompt_from_manager = extract_and_process_prompt(
+                agent_client.get_prompt(promptIdentifier=prompt.get("id"), promptVersion=prompt.get("version"))
+            )
+            if prompt_from_manager:
+                system_prompts[profile] = prompt_from_manager
+        except Exception as e:
+            logger.error(f"Error getting system prompt from Prompt Manager for {profile}: {e}")
+    return system_prompts
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    """Command line entry point."""
+    import argparse
+
+    from config.app_config import AppConfig
+    from services.bedrock_client_service import create_client_factory
+    from services.request_service import compile_capabilities
+
+    batch_config = AppConfig.load_batch_config()
+    parser = argparse.ArgumentParser(
+        prog="python -m services.batch_service",
+        description="Run JSONL prompts through the chat profiles. Re-running with the same output resumes the run.",
+    )
+    parser.add_argument("input", help="Input JSONL: one {\"id\", \"prompt\" or \"messages\", \"profile\", \"system_prompt\", \"settings\"} per line")
+    parser.add_argument("output", help="Output JSONL: results are appended as they complete")
+    parser.add_argument("--profile", help="Profile of the records without one (defaults to the default chat profile)")
+    parser.add_argument("--concurrency", type=int, default=batch_config["concurrency"], help="Maximum requests in flight")
+    parser.add_argument("--rate", type=float, default=batch_config["initial_rate"], help="Initial requests per second of each profile")
+    parser.add_argument("--max-rate", type=float, default=batch_config["max_rate"], help="Highest requests per second of each profile")
+    parser.add_argument("--max-attempts", type=int, default=batch_config["max_attempts"], help="Attempts of a record before it fails")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    bedrock_models = AppConfig.load_bedrock_models()
+    if not bedrock_models:
+        parser.error("No model configured: set BEDROCK_MODELS")
+    default_profile = args.profile or next(
+        (profile for profile, model_config in bedrock_models.items() if model_config.default),
+        next(iter(bedrock_models)),
+    )
+    if default_profile not in bedrock_models:
+        parser.error(f"Unknown profile: {default_profile}")
+
+    # The clients do not retry on their own: the runner retries, so throttling
+    # reaches its rate limiter
+    create_client = create_client_factory(
+        AppConfig.load_aws_config(),
+        AppConfig.load_replay_config(),
+        max_pool_connections=max(10, args.concurrency),
+        max_attempts=1,
+        read_timeout=300,
+    )
+    runner = BatchRunner(
+        bedrock_models,
+        compile_capabilities(bedrock_models),
+        fetch_system_prompts(
+            bedrock_models, AppConfig.load_system_prompts(), lambda: create_client(None, "bedrock-agent")
+        ),
+        create_client,
+        default_profile,
+        concurrency=args.concurrency,
+        initial_rate=args.rate,
+        max_rate=args.max_rate,
+        max_attempts=args.max_attempts,
+    )
+    stats = asyncio.run(runner.run(read_records(args.input), args.output))
+    print(json.dumps(stats, indent=2))
+
+
+if __name__ == "__main__":
+    main()
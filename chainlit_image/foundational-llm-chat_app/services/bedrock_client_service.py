@@ -0,0 +1,66 @@
+"""
+Service for creating the Bedrock clients of the chat, the chat completions API and the batch runner.
+"""
+
+import threading
+from typing import Dict, Any, Callable, Optional
+
+# Clients are created in worker threads by concurrent sessions: the default boto3
+# session they share is not thread-safe, so creation is serialized (using a client is safe)
+client_creation_lock = threading.Lock()
+
+
+def create_client_factory(
+    aws_config: Dict[str, str],
+    replay_config: Dict[str, Any],
+    max_pool_connections: Optional[int] = None,
+    max_attempts: Optional[int] = None,
+    read_timeout: Optional[float] = None,
+) -> Callable[..., Any]:
+    """
+    Make the factory of the Bedrock clients.
+
+    Runtime clients answer from recorded fixtures when replay is configured, and
+    record their calls when recording is. boto3 is imported on first use to keep
+    the application startup fast.
+
+    Args:
+        aws_config: The AWS configuration.
+        replay_config: The Bedrock recording and replay configuration.
+        max_pool_connections: Connection pool size of each client (botocore default if None).
+        max_attempts: Attempts of each call, retries included (botocore default if None).
+        read_timeout: Seconds to wait for a response (botocore default if None).
+
+    Returns:
+        A function creating the client of a region and service.
+    """
+
+    def create_client(region_name: Optional[str] = None, service_name: str = "bedrock-runtime"):
+        if service_name == "bedrock-runtime" and replay_config["replay_fixtures"]:
+            # Answers from recorded fixtures, without network
+            from services.replay_service import ReplayBedrockClient, list_fixtures
+            return ReplayBedrockClient(
+                list_fixtures(replay_config["replay_fixtures"]),
+                speed=replay_config["replay_speed"],
+                region_name=region_name or aws_config["region_name"],
+            )
+        import boto3
+        from botocore.config import Config
+
+        options: Dict[str, Any] = {**aws_config}
+        if region_name:
+            options["region_name"] = region_name
+        if max_pool_connections:
+            options["max_pool_connections"] = max_pool_connections
+        if max_attempts:
+            options["retries"] = {"mode": "standard", "max_attempts": max_attempts}
+        if read_timeout:
+            options["read_timeout"] = read_timeout
+        with client_creation_lock:
+            client = boto3.client(service_name, config=Config(**options))
+        if service_name == "bedrock-runtime" and replay_config["record_dir"]:
+            from services.replay_service import RecordingBedrockClient
+            return RecordingBedrockClient(client, replay_config["record_dir"])
+        return client
+
+    return create_client
@@ -0,0 +1,200 @@
+"""
+Service for compacting long conversations in the background.
+"""
+
+import asyncio
+import json
+import logging
+from dataclasses import dataclass
+from typing import Dict, Any, List, Optional
+
+from utils.conversation_history import ConversationHistory
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_SYSTEM_PROMPT = (
+    "You summarize conversations between a user and an assistant. Write a compact summary "
+    "keeping every fact, decision, name, number, file and open question needed to continue "
+    "the conversation. Do not add anything that is not in the conversation."
+)
+SUMMARY_PREFIX = "Summary of the earlier part of our conversation:\n\n"
+SUMMARY_ACK = "Understood. I will continue the conversation from this summary."
+
+# Maximum characters of a tool input or result in the transcript
+TRANSCRIPT_TOOL_CHARS = 2000
+
+
+@dataclass(slots=True)
+class CompactionResult:
+    """A summary of the oldest messages of a conversation, ready to be swapped in."""
+
+    # The last summarized message: the swap is only valid if it is still in place
+    boundary: Dict[str, Any]
+    cut: int
+    summary: str
+    usage: Dict[str, Any]
+
+
+def find_compaction_cut(messages: List[Dict[str, Any]], keep_messages: int) -> int:
+    """
+    Find where the summarized part of a conversation ends.
+
+    The kept part starts with a user message that is not a tool result, so tool
+    use/result pairs and the thinking blocks signed for them are kept verbatim.
+
+    Args:
+        messages: The conversation messages.
+        keep_messages: Minimum number of recent messages to keep.
+
+    Returns:
+        The index of the first kept message (0 if nothing can be summarized).
+    """
+    for index in range(len(messages) - keep_messages, 0, -1):
+        message = messages[index]
+        if message["role"] == "user" and not any("toolResult" in block for block in message.get("content", [])):
+            return index
+    return 0
+
+
+def to_transcript(messages: List[Dict[str, Any]]) -> str:
+    """
+    Render messages as a plain text transcript for the summarizer.
+
+    Args:
+        messages: The messages to render.
+
+    Returns:
+        The transcript.
+    """
+    lines = []
+    for message in messages:
+        parts = []
+        for block in message.get("content", []):
+            if "text" in block:
+                parts.append(block["text"])
+            elif "image" in block:
+                parts.append("[image]")
+            elif "document" in block:
+                parts.append(f"[document {block['document'].get('name', '')}]")
+            elif "toolUse" in block:
+                tool_input = json.dumps(block["toolUse"].get("input", {}))[:TRANSCRIPT_TOOL_CHARS]
+                parts.append(f"[tool call {block['toolUse'].get('name', '')}: {tool_input}]")
+            elif "toolResult" in block:
+                result = " ".join(
+                    item.get("text", "") for item in block["toolResult"].get("content", []) if "text" in item
+                )
+                parts.append(f"[tool result: {result[:TRANSCRIPT_TOOL_CHARS]}]")
+            # Reasoning blocks are not part of the conversation content
+        if parts:
+            lines.append(f"{message['role'].upper()}: " + "\n".join(parts))
+    return "\n\n".join(lines)
+
+
+class ConversationCompactor:
+    """
+    Summarizes the oldest turns of long conversations with an inexpensive model.
+
+    Compaction runs in the background between turns. The result is swapped into
+    the history at the start of the next turn only if it is ready: a turn never
+    waits for a compaction.
+    """
+
+    def __init__(
+        self,
+        bedrock_client,
+        model_id: str,
+        threshold_messages: int = 20,
+        keep_messages: int = 6,
+        max_tokens: int = 1024,
+    ):
+        """
+        Initialize the compactor.
+
+        Args:
+            bedrock_client: The Bedrock runtime client of the summarizer model region.
+            model_id: The summarizer model ID.
+            threshold_messages: Compact conversations longer than this.
+            keep_messages: Minimum number of recent messages kept verbatim.
+            max_tokens: Maximum tokens of a summary.
+        """
+        self.bedrock_client = bedrock_client
+        self.model_id = model_id
+        self.threshold_messages = threshold_messages
+        self.keep_messages = keep_messages
+        self.max_tokens = max_tokens
+
+    def should_compact(self, history: ConversationHistory) -> bool:
+        """
+        Check if a conversation is long enough to be compacted.
+
+        Args:
+            history: The conversation history.
+
+        Returns:
+            True if the history should be compacted.
+        """
+        return len(history) > self.threshold_messages
+
+    async def compact(self, history: ConversationHistory) -> Optional[CompactionResult]:
+        """
+        Summarize the oldest messages of a conversation.
+
+        Args:
+            history: A snapshot of the conversation history.
+
+        Returns:
+            The compaction result, or None if there is nothing to summarize.
+        """
+        messages = history.messages()
+        cut = find_compaction_cut(messages, self.keep_messages)
+        if cut < 2:
+            return None
+
+        response = await asyncio.to_thread(
+            self.bedrock_client.converse,
+            modelId=self.model_id,
+            system=[{"text": SUMMARY_SYSTEM_PROMPT}],
+            messages=[{"role": "user", "content": [{"text": to_transcript(messages[:cut])}]}],
+            inferenceConfig={"maxTokens": self.max_tokens, "temperature": 0.0},
+        )
+        summary = "".join(
+            block["text"] for block in response["output"]["message"]["content"] if "text" in block
+        ).strip()
+        if not summary:
+            return None
+        usage = response.get("usage", {})
+        return CompactionResult(
+            boundary=messages[cut - 1],
+            cut=cut,
+            summary=summary,
+            usage={
+                "inputTokenCount": usage.get("inputTokens", 0),
+                "outputTokenCount": usage.get("outputTokens", 0),
+            },
+        )
+
+    @staticmethod
+    def apply(history: ConversationHistory, result: CompactionResult) -> Optional[ConversationHistory]:
+        """
+        Swap a summary into a history.
+
+        Messages appended after the compaction started are kept.
+
+        Args:
+            history: The current conversation history.
+            result: The compaction result.
+
+        Returns:
+            The compacted history, or None if the history changed under the
+            summarized part (e.g. a rollback) and the result is stale.
+        """
+        messages = history.messages()
+        if len(messages) <= result.cut or messages[result.cut - 1] is not result.boundary:
+            return None
+        return ConversationHistory(
+            [
+                {"role": "user", "content": [{"text": SUMMARY_PREFIX + result.summary}]},
+                {"role": "assistant", "content": [{"text": SUMMARY_ACK}]},
+            ]
+            + messages[result.cut:]
+        )
@@ -0,0 +1,212 @@
+"""
+Service for comparing the answers of several chat profiles to the same message.
+"""
+
+import asyncio
+import logging
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Dict, Any, List, Optional, Callable, Awaitable, AsyncIterator
+
+from services.usage_service import converse_usage
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(slots=True)
+class CompareResult:
+    """Answer and performance of one profile in a comparison."""
+
+    profile: str
+    chunks: List[str] = field(default_factory=list)
+    # Time to first token and total duration, in seconds
+    ttft: Optional[float] = None
+    duration: float = 0.0
+    usage: Dict[str, Any] = field(default_factory=dict)
+    cost: float = 0.0
+    error: Optional[str] = None
+
+    @property
+    def text(self) -> str:
+        """The answer text."""
+        return "".join(self.chunks)
+
+    @property
+    def tokens_per_second(self) -> float:
+        """Output tokens per second, measured after the first token."""
+        generation_time = self.duration - (self.ttft or 0.0)
+        output_tokens = self.usage.get("outputTokenCount", 0)
+        if generation_time <= 0 or not output_tokens:
+            return 0.0
+        return output_tokens / generation_time
+
+
+def filter_content_for_model(content: List[Dict[str, Any]], model_config) -> List[Dict[str, Any]]:
+    """
+    Keep the content blocks a model accepts.
+
+    The blocks are shared between profiles: they are filtered, never copied.
+
+    Args:
+        content: The encoded user message content.
+        model_config: The ModelConfig of the profile.
+
+    Returns:
+        The content blocks supported by the model.
+    """
+    return [
+        block for block in content
+        if ("image" not in block or model_config.vision)
+        and ("document" not in block or model_config.document)
+    ]
+
+
+async def iterate_stream(stream, executor=None) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Iterate a botocore event stream from a worker thread.
+
+    Reading the stream blocks on the network: reading it in the event loop would
+    serialize the profiles of a comparison. When the iteration stops early (the
+    consumer closed or was cancelled), the worker thread is released and the
+    stream closed.
+
+    Args:
+        stream: The `stream` of a ConverseStream response.
+        executor: The executor of the worker thread (the default executor if None).
+
+    Yields:
+        The stream events.
+    """
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue()
+    done = object()
+    stopped = threading.Event()
+
+    def put(item):
+        try:
+            loop.call_soon_threadsafe(queue.put_nowait, item)
+        except RuntimeError:
+            # The event loop was closed while the stream was read
+            stopped.set()
+
+    def pump():
+        try:
+            for event in stream:
+                if stopped.is_set():
+                    return
+                put(event)
+        except Exception as e:
+            # Reading a stream closed by the consumer fails: nobody is waiting for the error
+            if not stopped.is_set():
+                put(e)
+        finally:
+            put(done)
+
+    reader = loop.run_in_executor(executor, pump)
+    finished = False
+    try:
+        while True:
+            item = await queue.get()
+            if item is done:
+                finished = True
+                break
+            if isinstance(item, Exception):
+                finished = True
+                raise item
+            yield item
+    finally:
+        if not finished:
+            stopped.set()
+            # Unblocks a read waiting on the network and releases the connection
+            close = getattr(stream, "close", None)
+            if close is not None:
+                try:
+                    close()
+                except Exception as e:
+                    logger.debug(f"Error closing the stream: {e}")
+    await reader
+
+
+async def run_profile(
+    profile: str,
+    bedrock_client,
+    api_params: Dict[str, Any],
+    streaming: bool,
+    on_token: Callable[[str], Awaitable[None]],
+) -> CompareResult:
+    """
+    Send a request to one profile of a comparison, measuring its performance.
+
+    Errors are captured in the result so one profile cannot fail the comparison.
+
+    Args:
+        profile: The chat profile name.
+        bedrock_client: The Bedrock runtime client of the profile region.
+        api_params: The Converse API parameters.
+        streaming: Whether to use ConverseStream.
+        on_token: Called with each chunk of answer text.
+
+    Returns:
+        The result of the profile (usage keys as in UsageLedger.record).
+    """
+    result = CompareResult(profile=profile)
+    usage = {}
+    start = time.perf_counter()
+    try:
+        if streaming:
+            response = await asyncio.to_thread(bedrock_client.converse_stream, **api_params)
+            async for event in iterate_stream(response["stream"]):
+                if "contentBlockDelta" in event:
+                    text = event["contentBlockDelta"].get("delta", {}).get("text")
+                    if text:
+                        if result.ttft is None:
+                            result.ttft = time.perf_counter() - start
+                        result.chunks.append(text)
+                        await on_token(text)
+                elif "metadata" in event:
+                    usage = event["metadata"].get("usage", usage)
+        else:
+            response = await asyncio.to_thread(bedrock_client.converse, **api_params)
+            # Without streaming, the first token arrives with the whole answer
+            result.ttft = time.perf_counter() - start
+            text = "".join(
+                block["text"] for block in response["output"]["message"]["content"] if "text" in block
+            )
+            result.chunks.append(text)
+            await on_token(text)
+            usage = response.get("usage", {})
+    except Exception as e:
+        logger.error(f"Comparison request failed for {profile}: {e}")
+        result.error = str(e)
+
+    result.duration = time.perf_counter() - start
+    result.usage = converse_usage(usage)
+    return result
+
+
+def format_summary(results: List[CompareResult], precision: int = 4) -> str:
+    """
+    Format the performance of each profile of a comparison as a markdown table.
+
+    Args:
+        results: The results of the comparison.
+        precision: Digits of the costs.
+
+    Returns:
+        The markdown table.
+    """
+    lines = [
+        "| Profile | TTFT (s) | Tokens/s | Output tokens | Cost ($) |",
+        "| --- | --- | --- | --- | --- |",
+    ]
+    for result in results:
+        if result.error:
+            lines.append(f"| {result.profile} | ❌ {result.error.replace('|', '/')} | | | |")
+            continue
+        ttft = f"{result.ttft:.2f}" if result.ttft is not None else "-"
+        lines.append(
+            f"| {result.profile} | {ttft} | {result.tokens_per_second:.1f} | "
+            f"{result.usage.get('outputTokenCount', 0)} | {result.cost:.{precision}f} |"
+        )
+    return "\n".join(lines)
@@ -0,0 +1,207 @@
+"""
+Service for measuring the load of the task: readiness and autoscaling signal.
+"""
+
+import asyncio
+import logging
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Any, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Memory limit and usage of the container (cgroup v2, then v1)
+CGROUP_MEMORY_FILES = (
+    ("/sys/fs/cgroup/memory.max", "/sys/fs/cgroup/memory.current"),
+    ("/sys/fs/cgroup/memory/memory.limit_in_bytes", "/sys/fs/cgroup/memory/memory.usage_in_bytes"),
+)
+# cgroup v1 reports "no limit" as a huge number
+UNLIMITED_MEMORY = 1 << 60
+
+# Request being handled in the current task
+_current_request: ContextVar[Optional["RequestLoad"]] = ContextVar("current_request", default=None)
+
+
+def read_memory() -> Optional[Tuple[int, int]]:
+    """
+    Read the memory limit and usage of the container.
+
+    Returns:
+        A tuple of (limit, usage) in bytes, or None without a cgroup memory limit.
+    """
+    for limit_file, usage_file in CGROUP_MEMORY_FILES:
+        try:
+            with open(limit_file) as f:
+                limit = f.read().strip()
+            with open(usage_file) as f:
+                usage = int(f.read().strip())
+        except (OSError, ValueError):
+            continue
+        if limit == "max" or int(limit) >= UNLIMITED_MEMORY:
+            return None
+        return int(limit), usage
+    return None
+
+
+class RequestLoad:
+    """A message being handled: queued until its model request is sent, then streaming."""
+
+    __slots__ = ("monitor", "streaming")
+
+    def __init__(self, monitor: "LoadMonitor"):
+        self.monitor = monitor
+        self.streaming = False
+
+    def start_streaming(self) -> None:
+        if not self.streaming:
+            self.streaming = True
+            self.monitor.queued_requests -= 1
+            self.monitor.active_streams += 1
+
+    def end(self) -> None:
+        if self.streaming:
+            self.monitor.active_streams -= 1
+        else:
+            self.monitor.queued_requests -= 1
+
+
+class LoadMonitor:
+    """
+    Tracks active streams, queued requests, event loop lag and memory headroom.
+
+    The task is ready while every signal is below its saturation threshold. The
+    load factor (the highest signal relative to its threshold, 1.0 = saturated)
+    is published periodically as the autoscaling metric.
+    """
+
+    def __init__(
+        self,
+        max_active_streams: int = 20,
+        max_queued_requests: int = 10,
+        max_loop_lag_ms: float = 500,
+        min_memory_headroom_mb: float = 100,
+        sample_interval: float = 0.5,
+        publish_interval: float = 60,
+        metrics_service=None,
+    ):
+        """
+        Initialize the monitor.
+
+        Args:
+            max_active_streams: Streams at which the task is saturated.
+            max_queued_requests: Queued requests at which the task is saturated.
+            max_loop_lag_ms: Event loop lag at which the task is saturated.
+            min_memory_headroom_mb: Memory headroom under which the task is saturated.
+            sample_interval: Seconds between two event loop lag samples.
+            publish_interval: Seconds between two publications of the load metrics.
+            metrics_service: Optional MetricsService receiving the load metrics.
+        """
+        self.max_active_streams = max_active_streams
+        self.max_queued_requests = max_queued_requests
+        self.max_loop_lag_ms = max_loop_lag_ms
+        self.min_memory_headroom_bytes = int(min_memory_headroom_mb * 1024 * 1024)
+        self.sample_interval = sample_interval
+        self.publish_interval = publish_interval
+        self.metrics_service = metrics_service
+        self.active_streams = 0
+        self.queued_requests = 0
+        # Lag of the last samples, in milliseconds
+        self._lag_samples: deque = deque(maxlen=max(1, int(5 / sample_interval)))
+        self._sampler: Optional[asyncio.Task] = None
+
+    def open_request(self) -> RequestLoad:
+        """Track a request across tasks: call end() on the result once it is answered."""
+        self._ensure_sampler()
+        self.queued_requests += 1
+        return RequestLoad(self)
+
+    @contextmanager
+    def request(self):
+        """Track a message from its arrival until it is answered."""
+        load = self.open_request()
+        token = _current_request.set(load)
+        try:
+            yield load
+        finally:
+            _current_request.reset(token)
+            load.end()
+
+    def start_streaming(self) -> None:
+        """Mark the request of the current task as sent to the model."""
+        load = _current_request.get()
+        if load is not None:
+            load.start_streaming()
+
+    @property
+    def loop_lag_ms(self) -> float:
+        """Highest event loop lag of the last seconds."""
+        return max(self._lag_samples, default=0.0)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        Measure the current load.
+
+        Returns:
+            The load signals, the load factor and the readiness with its reasons.
+        """
+        self._ensure_sampler()
+        memory = read_memory()
+        headroom = memory[0] - memory[1] if memory else None
+        ratios = {
+            "active_streams": self.active_streams / self.max_active_streams if self.max_active_streams else 0.0,
+            "queued_requests": self.queued_requests / self.max_queued_requests if self.max_queued_requests else 0.0,
+            "loop_lag": self.loop_lag_ms / self.max_loop_lag_ms if self.max_loop_lag_ms else 0.0,
+        }
+        if memory and memory[0] > self.min_memory_headroom_bytes:
+            ratios["memory"] = memory[1] / (memory[0] - self.min_memory_headroom_bytes)
+        reasons: List[str] = [name for name, ratio in ratios.items() if ratio >= 1.0]
+        return {
+            "ready": not reasons,
+            "reasons": reasons,
+            "load_factor": round(max(ratios.values()), 3),
+            "active_streams": self.active_streams,
+            "queued_requests": self.queued_requests,
+            "loop_lag_ms": round(self.loop_lag_ms, 1),
+            "memory_headroom_mb": round(headroom / (1024 * 1024), 1) if headroom is not None else None,
+        }
+
+    def publish_metrics(self) -> None:
+        """Publish the load signals and the load factor (the autoscaling metric)."""
+        if not self.metrics_service:
+            return
+        snapshot = self.snapshot()
+        metrics = {
+            "LoadFactor": snapshot["load_factor"],
+            "ActiveStreams": snapshot["active_streams"],
+            "QueuedRequests": snapshot["queued_requests"],
+            "EventLoopLag": snapshot["loop_lag_ms"],
+        }
+        units = {"EventLoopLag": "Milliseconds", "MemoryHeadroom": "Megabytes"}
+        if snapshot["memory_headroom_mb"] is not None:
+            metrics["MemoryHeadroom"] = snapshot["memory_headroom_mb"]
+        self.metrics_service.put_metrics(metrics, units=units)
+
+    def _ensure_sampler(self) -> None:
+        """Start the sampling task on first use."""
+        if self._sampler is None or self._sampler.done():
+            try:
+                self._sampler = asyncio.get_running_loop().create_task(self._sample_periodically())
+            except RuntimeError:
+                # No running loop: nothing to sample
+                pass
+
+    async def _sample_periodically(self) -> None:
+        loop = asyncio.get_running_loop()
+        next_publish = loop.time() + self.publish_interval
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.sample_interval)
+            # Time past the scheduled wake-up: how long ready callbacks wait for the loop
+            self._lag_samples.append(max(0.0, (loop.time() - start - self.sample_interval) * 1000))
+            if loop.time() >= next_publish:
+                next_publish = loop.time() + self.publish_interval
+                try:
+                    self.publish_metrics()
+                except Exception as e:
+                    logger.error(f"Error publishing load metrics: {e}")
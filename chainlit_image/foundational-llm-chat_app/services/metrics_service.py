@@ -0,0 +1,80 @@
+"""
+Service for publishing custom metrics.
+"""
+
+import json
+import sys
+import time
+import logging
+from typing import Dict, Any, Optional
+
+logger = logging.getLogger(__name__)
+
+METRICS_NAMESPACE = "FoundationalLlmChat"
+
+
+class MetricsService:
+    """
+    Service for publishing metrics in CloudWatch Embedded Metric Format (EMF).
+
+    EMF records are plain JSON log lines: the awslogs driver of the ECS task ships
+    them to CloudWatch Logs, which extracts the metrics without any API call from
+    the application.
+    """
+
+    def __init__(self, namespace: str = METRICS_NAMESPACE, enabled: bool = True, stream=None):
+        """
+        Initialize the metrics service.
+
+        Args:
+            namespace: The CloudWatch metrics namespace.
+            enabled: Whether metrics are published at all.
+            stream: Where EMF records are written (defaults to stdout).
+        """
+        self.namespace = namespace
+        self.enabled = enabled
+        self.stream = stream or sys.stdout
+
+    def put_metrics(
+        self,
+        metrics: Dict[str, float],
+        dimensions: Optional[Dict[str, str]] = None,
+        units: Optional[Dict[str, str]] = None,
+        properties: Optional[Dict[str, Any]] = None,
+    ) -> None:
+        """
+        Publish a set of metrics sharing the same dimensions.
+
+        Args:
+            metrics: Metric names and values.
+            dimensions: Dimension names and values.
+            units: Optional unit for each metric (defaults to "None").
+            properties: Extra fields stored with the record but not as metrics.
+        """
+        if not self.enabled or not metrics:
+            return
+
+        dimensions = dimensions or {}
+        units = units or {}
+        record = {
+            "_aws": {
+                "Timestamp": int(time.time() * 1000),
+                "CloudWatchMetrics": [
+                    {
+                        "Namespace": self.namespace,
+                        "Dimensions": [list(dimensions.keys())],
+                        "Metrics": [
+                            {"Name": name, "Unit": units.get(name, "None")}
+                            for name in metrics
+                        ],
+                    }
+                ],
+            },
+            **dimensions,
+            **metrics,
+            **(properties or {}),
+        }
+        try:
+            self.stream.write(json.dumps(record, default=str) + "\n")
+        except Exception as e:
+            logger.error(f"Error publishing metrics: {e}")
@@ -0,0 +1,611 @@
+"""
+Service answering OpenAI-style chat completions with the chat profiles, without Chainlit sessions.
+"""
+
+import re
+import json
+import time
+import uuid
+import base64
+import asyncio
+import weakref
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Dict, Any, AsyncIterator, Callable, List, Optional, Tuple
+
+from services.batch_service import error_code
+from services.compare_service import iterate_stream
+from services.request_service import build_request, build_request_template, default_settings
+from services.usage_service import converse_usage
+
+logger = logging.getLogger(__name__)
+
+FINISH_REASONS = {
+    "end_turn": "stop",
+    "stop_sequence": "stop",
+    "max_tokens": "length",
+    "tool_use": "tool_calls",
+    "content_filtered": "content_filter",
+    "guardrail_intervened": "content_filter",
+}
+# Reasoning budget of each reasoning_effort, for models with a thinking budget
+REASONING_BUDGETS = {"low": 1024, "medium": 4096, "high": 16384}
+# HTTP status of the Bedrock errors (others are reported as 502)
+ERROR_STATUS = {
+    "ValidationException": 400,
+    "AccessDeniedException": 403,
+    "ResourceNotFoundException": 404,
+    "ThrottlingException": 429,
+    "ServiceQuotaExceededException": 429,
+    "ModelNotReadyException": 503,
+    "ServiceUnavailableException": 503,
+    "ModelTimeoutException": 504,
+}
+DATA_URL = re.compile(r"^data:image/(png|jpe?g|gif|webp);base64,(.*)$", re.DOTALL)
+SSE_DONE = "data: [DONE]\n\n"
+
+
+class ChatCompletionError(Exception):
+    """A chat completion failing with an HTTP status and an OpenAI error body."""
+
+    def __init__(self, message: str, status: int = 400, error_type: str = "invalid_request_error", code: Optional[str] = None):
+        super().__init__(message)
+        self.status = status
+        self.body = {"error": {"message": message, "type": error_type, "param": None, "code": code}}
+
+    @classmethod
+    def from_bedrock(cls, error: Exception) -> "ChatCompletionError":
+        """Wrap a Bedrock error, keeping its meaning for the client."""
+        code = error_code(error)
+        status = ERROR_STATUS.get(code, 502)
+        error_type = "rate_limit_error" if status == 429 else "invalid_request_error" if status < 500 else "api_error"
+        return cls(str(error), status, error_type, code or None)
+
+
+def sse(data: Dict[str, Any]) -> str:
+    """Format a server-sent event."""
+    return f"data: {json.dumps(data, ensure_ascii=False, separators=(',', ':'))}\n\n"
+
+
+def _text_of(content: Any) -> str:
+    """The text of an OpenAI message content (a string or a list of parts)."""
+    if isinstance(content, str):
+        return content
+    return "".join(part.get("text", "") for part in content or [] if part.get("type") == "text")
+
+
+def _content_blocks(content: Any) -> List[Dict[str, Any]]:
+    """Convert an OpenAI message content to Converse content blocks."""
+    if isinstance(content, str):
+        return [{"text": content}] if content.strip() else []
+    blocks = []
+    for part in content or []:
+        if part.get("type") == "text":
+            if part.get("text", "").strip():
+                blocks.append({"text": part["text"]})
+        elif part.get("type") == "image_url":
+            # Only inline images: the server does not fetch client URLs
+            match = DATA_URL.match((part.get("image_url") or {}).get("url", ""))
+            if not match:
+                raise ChatCompletionError("Images must be base64 data URLs (PNG, JPEG, GIF or WEBP)")
+            image_format = "jpeg" if match.group(1) == "jpg" else match.group(1)
+            blocks.append({"image": {"format": image_format, "source": {"bytes": base64.b64decode(match.group(2))}}})
+        else:
+            raise ChatCompletionError(f"Unsupported content part type: {part.get('type')}")
+    return blocks
+
+
+def to_converse_messages(messages: List[Dict[str, Any]]) -> Tuple[Optional[str], List[Dict[str, Any]]]:
+    """
+    Convert OpenAI chat messages to Converse messages.
+
+    System and developer messages become the system prompt; tool messages
+    become tool results; consecutive messages of the same role are merged, as
+    Converse requires alternating roles.
+
+    Args:
+        messages: The OpenAI chat messages.
+
+    Returns:
+        A tuple of (system prompt or None, Converse messages).
+
+    Raises:
+        ChatCompletionError: If the messages are not valid.
+    """
+    system_parts = []
+    converse_messages: List[Dict[str, Any]] = []
+
+    def append(role: str, blocks: List[Dict[str, Any]]) -> None:
+        if not blocks:
+            return
+        if converse_messages and converse_messages[-1]["role"] == role:
+            converse_messages[-1]["content"].extend(blocks)
+        else:
+            converse_messages.append({"role": role, "content": blocks})
+
+    for message in messages:
+        role = message.get("role")
+        if role in ("system", "developer"):
+            system_parts.append(_text_of(message.get("content")))
+        elif role == "user":
+            append("user", _content_blocks(message.get("content")))
+        elif role == "assistant":
+            blocks = _content_blocks(message.get("content"))
+            for call in message.get("tool_calls") or []:
+                function = call.get("function", {})
+                try:
+                    tool_input = json.loads(function.get("arguments") or "{}")
+                except json.JSONDecodeError:
+                    raise ChatCompletionError(f"Invalid arguments of tool call {call.get('id')}")
+                blocks.append({"toolUse": {"toolUseId": call.get("id"), "name": function.get("name"), "input": tool_input}})
+            append("assistant", blocks)
+        elif role == "tool":
+            append("user", [{
+                "toolResult": {
+                    "toolUseId": message.get("tool_call_id"),
+                    "content": [{"text": _text_of(message.get("content")) or "(empty)"}],
+                }
+            }])
+        else:
+            raise ChatCompletionError(f"Unsupported message role: {role}")
+
+    if not converse_messages or converse_messages[0]["role"] != "user":
+        raise ChatCompletionError("The conversation must start with a user message")
+    return ("\n\n".join(system_parts) if system_parts else None), converse_messages
+
+
+def to_tool_specs(tools: Optional[List[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+    """
+    Convert OpenAI function tools to Bedrock tool specifications.
+
+    Args:
+        tools: The OpenAI tools.
+
+    Returns:
+        The Bedrock tool specifications.
+    """
+    specs = []
+    for tool in tools or []:
+        function = tool.get("function") or {}
+        if tool.get("type") != "function" or not function.get("name"):
+            raise ChatCompletionError("Only named function tools are supported")
+        specs.append({
+            "toolSpec": {
+                "name": function["name"],
+                "description": function.get("description") or function["name"],
+                "inputSchema": {"json": function.get("parameters") or {"type": "object", "properties": {}}},
+            }
+        })
+    return specs
+
+
+def to_tool_choice(tool_choice: Any) -> Optional[Dict[str, Any]]:
+    """Convert an OpenAI tool_choice to a Bedrock toolChoice (None for the default)."""
+    if tool_choice == "required":
+        return {"any": {}}
+    if isinstance(tool_choice, dict) and tool_choice.get("function", {}).get("name"):
+        return {"tool": {"name": tool_choice["function"]["name"]}}
+    return None
+
+
+def request_settings(body: Dict[str, Any], capabilities, system_prompt: str) -> Dict[str, Any]:
+    """
+    Build the chat settings of a completion: the chat defaults of the profile,
+    overridden by the OpenAI parameters of the request.
+
+    Args:
+        body: The chat completion request.
+        capabilities: The capabilities of the profile.
+        system_prompt: The system prompt text.
+
+    Returns:
+        The settings expected by build_request_template.
+    """
+    settings = default_settings(capabilities, system_prompt)
+    max_tokens = body.get("max_completion_tokens") or body.get("max_tokens")
+    if max_tokens:
+        settings["max_tokens"] = int(max_tokens)
+    settings["max_tokens"] = min(int(settings["max_tokens"]), capabilities.max_tokens)
+    if body.get("temperature") is not None:
+        settings["temperature"] = float(body["temperature"])
+
+    effort = body.get("reasoning_effort")
+    if not capabilities.reasoning_enabled:
+        settings["thinking_enabled"] = False
+    elif capabilities.openai_reasoning:
+        settings["thinking_enabled"] = True
+        if effort in REASONING_BUDGETS:
+            settings["reasoning_effort"] = effort
+    elif effort == "none":
+        settings["thinking_enabled"] = False
+    elif effort in REASONING_BUDGETS:
+        settings["reasoning_budget"] = REASONING_BUDGETS[effort]
+    if (
+        settings["thinking_enabled"]
+        and capabilities.sends_reasoning_params
+        and not capabilities.openai_reasoning
+        and settings["reasoning_budget"] >= settings["max_tokens"]
+    ):
+        # The thinking budget must stay below the maximum tokens
+        settings["thinking_enabled"] = False
+    return settings
+
+
+def completion_usage(usage: Dict[str, Any]) -> Dict[str, Any]:
+    """Convert the usage of a Converse response to the OpenAI usage."""
+    cached = usage.get("cacheReadInputTokens", 0)
+    prompt_tokens = usage.get("inputTokens", 0) + cached + usage.get("cacheWriteInputTokens", 0)
+    completion_tokens = usage.get("outputTokens", 0)
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens,
+        "prompt_tokens_details": {"cached_tokens": cached},
+    }
+
+
+class CompletionStream:
+    """Translates ConverseStream events into chat completion chunks."""
+
+    def __init__(self, completion_id: str, model: str, output_filter):
+        """
+        Initialize the translation.
+
+        Args:
+            completion_id: The id of the completion.
+            model: The profile name reported as the model.
+            output_filter: The output filter pipeline of the response.
+        """
+        self.completion_id = completion_id
+        self.model = model
+        self.output_filter = output_filter
+        self.created = int(time.time())
+        self.usage: Dict[str, Any] = {}
+        self.finish_reason: Optional[str] = None
+        # Index of the tool call of each tool use content block
+        self._tool_calls: Dict[int, int] = {}
+
+    def chunk(self, delta: Dict[str, Any], finish_reason: Optional[str] = None) -> Dict[str, Any]:
+        return {
+            "id": self.completion_id,
+            "object": "chat.completion.chunk",
+            "created": self.created,
+            "model": self.model,
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+        }
+
+    def translate(self, event: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """
+        Translate a stream event.
+
+        Args:
+            event: The ConverseStream event.
+
+        Returns:
+            The chunks to send (possibly none).
+        """
+        if "messageStart" in event:
+            return [self.chunk({"role": "assistant", "content": ""})]
+        if "contentBlockStart" in event:
+            tool_use = event["contentBlockStart"].get("start", {}).get("toolUse")
+            if not tool_use:
+                return []
+            index = self._tool_calls[event["contentBlockStart"]["contentBlockIndex"]] = len(self._tool_calls)
+            return [self.chunk({"tool_calls": [{
+                "index": index,
+                "id": tool_use["toolUseId"],
+                "type": "function",
+                "function": {"name": tool_use["name"], "arguments": ""},
+            }]})]
+        if "contentBlockDelta" in event:
+            delta = event["contentBlockDelta"].get("delta", {})
+            if "text" in delta:
+                text = self.output_filter.feed(delta["text"])
+                return [self.chunk({"content": text})] if text else []
+            if "reasoningContent" in delta and delta["reasoningContent"].get("text"):
+                return [self.chunk({"reasoning_content": delta["reasoningContent"]["text"]})]
+            if "toolUse" in delta:
+                index = self._tool_calls.get(event["contentBlockDelta"].get("contentBlockIndex"), 0)
+                return [self.chunk({"tool_calls": [{"index": index, "function": {"arguments": delta["toolUse"].get("input", "")}}]})]
+            return []
+        if "messageStop" in event:
+            self.finish_reason = FINISH_REASONS.get(event["messageStop"].get("stopReason"), "stop")
+            return []
+        if "metadata" in event:
+            self.usage = event["metadata"].get("usage", self.usage)
+        return []
+
+    def finish(self, include_usage: bool) -> List[Dict[str, Any]]:
+        """
+        Close the stream.
+
+        Args:
+            include_usage: Whether to send the usage chunk (stream_options.include_usage).
+
+        Returns:
+            The last chunks.
+        """
+        chunks = []
+        text = self.output_filter.flush()
+        if text:
+            chunks.append(self.chunk({"content": text}))
+        chunks.append(self.chunk({}, self.finish_reason or "stop"))
+        if include_usage:
+            chunks.append({**self.chunk({}), "choices": [], "usage": completion_usage(self.usage)})
+        return chunks
+
+
+def completion_response(response: Dict[str, Any], completion_id: str, model: str, output_filter) -> Dict[str, Any]:
+    """
+    Convert a Converse response to a chat completion.
+
+    Args:
+        response: The Converse response.
+        completion_id: The id of the completion.
+        model: The profile name reported as the model.
+        output_filter: The output filter pipeline of the response.
+
+    Returns:
+        The chat completion.
+    """
+    text, reasoning, tool_calls = "", "", []
+    for block in response.get("output", {}).get("message", {}).get("content", []):
+        if "text" in block:
+            text += output_filter.feed(block["text"])
+        elif "reasoningContent" in block:
+            reasoning += block["reasoningContent"].get("reasoningText", {}).get("text", "")
+        elif "toolUse" in block:
+            tool_calls.append({
+                "id": block["toolUse"]["toolUseId"],
+                "type": "function",
+                "function": {"name": block["toolUse"]["name"], "arguments": json.dumps(block["toolUse"]["input"])},
+            })
+    text += output_filter.flush()
+    message: Dict[str, Any] = {"role": "assistant", "content": text or None}
+    if reasoning:
+        message["reasoning_content"] = reasoning
+    if tool_calls:
+        message["tool_calls"] = tool_calls
+    return {
+        "id": completion_id,
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{
+            "index": 0,
+            "message": message,
+            "finish_reason": FINISH_REASONS.get(response.get("stopReason"), "stop"),
+        }],
+        "usage": completion_usage(response.get("usage", {})),
+    }
+
+
+class ChatCompletionsService:
+    """
+    Answers chat completions with the chat profiles: same model registry,
+    request building, output filters, usage accounting and load tracking as the
+    chat, with process-wide clients instead of per-session state.
+
+    A model call holds a worker thread for its whole duration: calls run on a
+    dedicated bounded executor, so API clients cannot starve the threads of the
+    chat, and requests over the bound are refused with a 429.
+    """
+
+    def __init__(
+        self,
+        bedrock_models: Dict[str, Any],
+        capabilities: Dict[str, Any],
+        client_factory: Callable[[Optional[str]], Any],
+        system_prompt_loader: Callable[[], Dict[str, str]],
+        output_filter_factory: Callable[[bool], Any],
+        usage_ledger,
+        load_monitor=None,
+        max_concurrency: int = 8,
+    ):
+        """
+        Initialize the service.
+
+        Args:
+            bedrock_models: The ModelConfig of each profile, keyed by profile name.
+            capabilities: The compiled capabilities of each profile.
+            client_factory: Creates the Bedrock runtime client of a region.
+            system_prompt_loader: Resolves the system prompt of each profile (called once).
+            output_filter_factory: Creates the output filter pipeline of a response
+                (the argument tells whether tools are available).
+            usage_ledger: The UsageLedger recording usage and enforcing budgets.
+            load_monitor: Optional LoadMonitor tracking the requests.
+            max_concurrency: Maximum model calls and streams in flight.
+        """
+        self.bedrock_models = bedrock_models
+        self.capabilities = capabilities
+        self.client_factory = client_factory
+        self.system_prompt_loader = system_prompt_loader
+        self.output_filter_factory = output_filter_factory
+        self.usage_ledger = usage_ledger
+        self.load_monitor = load_monitor
+        self.max_concurrency = max_concurrency
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="chat-completions")
+        self._in_flight = 0
+        self._clients: Dict[Optional[str], Any] = {}
+        self._system_prompts: Optional[Dict[str, str]] = None
+        self._lock = asyncio.Lock()
+
+    def list_models(self) -> Dict[str, Any]:
+        """The chat profiles, as an OpenAI model list."""
+        return {
+            "object": "list",
+            "data": [
+                {"id": profile, "object": "model", "created": 0, "owned_by": "bedrock"}
+                for profile in self.bedrock_models
+            ],
+        }
+
+    async def _client(self, region_name: Optional[str]):
+        if region_name not in self._clients:
+            async with self._lock:
+                if region_name not in self._clients:
+                    self._clients[region_name] = await asyncio.to_thread(self.client_factory, region_name)
+        return self._clients[region_name]
+
+    async def _system_prompt(self, profile: str) -> str:
+        if self._system_prompts is None:
+            async with self._lock:
+                if self._system_prompts is None:
+                    self._system_prompts = await asyncio.to_thread(self.system_prompt_loader)
+        return self._system_prompts.get(profile, "")
+
+    async def prepare(self, body: Dict[str, Any], user: str) -> Tuple[str, Dict[str, Any], bool]:
+        """
+        Validate a chat completion request and build its Converse parameters.
+
+        Args:
+            body: The chat completion request.
+            user: The user identifier (for budgets).
+
+        Returns:
+            A tuple of (profile, Converse parameters, whether tools are available).
+
+        Raises:
+            ChatCompletionError: If the request cannot be answered.
+        """
+        profile = body.get("model")
+        if profile not in self.bedrock_models:
+            raise ChatCompletionError(f"The model {profile} does not exist", 404, code="model_not_found")
+        if self.usage_ledger.is_over_budget(user):
+            raise ChatCompletionError("Your daily usage budget has been reached", 429, "rate_limit_error", "budget_exceeded")
+        capabilities = self.capabilities[profile]
+        try:
+            system_prompt, messages = to_converse_messages(body.get("messages") or [])
+            tools = to_tool_specs(body.get("tools")) if body.get("tool_choice") != "none" else []
+            settings = request_settings(body, capabilities, system_prompt or "")
+        except (AttributeError, TypeError, ValueError) as e:
+            # Malformed fields (wrong types, invalid base64 or numbers)
+            raise ChatCompletionError(f"Invalid request: {e}")
+        if system_prompt is None:
+            settings["system_prompt"] = [{"text": await self._system_prompt(profile)}]
+        api_params = build_request(
+            build_request_template(capabilities, settings, tools), self.bedrock_models[profile].id, messages
+        )
+        tool_choice = to_tool_choice(body.get("tool_choice"))
+        if tools and tool_choice:
+            api_params["toolConfig"] = {**api_params["toolConfig"], "toolChoice": tool_choice}
+        return profile, api_params, bool(tools)
+
+    async def complete(self, body: Dict[str, Any], user: str) -> Dict[str, Any]:
+        """
+        Answer a chat completion without streaming.
+
+        Args:
+            body: The chat completion request.
+            user: The user identifier.
+
+        Returns:
+            The chat completion.
+
+        Raises:
+            ChatCompletionError: If the request fails.
+        """
+        profile, api_params, has_tools = await self.prepare(body, user)
+        client = await self._client(self.bedrock_models[profile].region_name)
+        self._acquire()
+        load = self._open_request()
+        try:
+            response = await asyncio.get_running_loop().run_in_executor(
+                self._executor, partial(client.converse, **api_params)
+            )
+        except Exception as e:
+            raise ChatCompletionError.from_bedrock(e)
+        finally:
+            self._release()
+            if load:
+                load.end()
+        self.usage_ledger.record(user, profile, converse_usage(response.get("usage", {})))
+        return completion_response(
+            response, f"chatcmpl-{uuid.uuid4().hex}", profile, self.output_filter_factory(has_tools)
+        )
+
+    async def stream(self, body: Dict[str, Any], user: str) -> AsyncIterator[str]:
+        """
+        Validate a streaming chat completion and open its stream.
+
+        Errors before the first event are raised, so they get an HTTP status;
+        later errors are sent as an error event.
+
+        Args:
+            body: The chat completion request.
+            user: The user identifier.
+
+        Returns:
+            The server-sent events of the completion.
+
+        Raises:
+            ChatCompletionError: If the request fails before streaming.
+        """
+        profile, api_params, has_tools = await self.prepare(body, user)
+        client = await self._client(self.bedrock_models[profile].region_name)
+        include_usage = bool((body.get("stream_options") or {}).get("include_usage"))
+        completion = CompletionStream(f"chatcmpl-{uuid.uuid4().hex}", profile, self.output_filter_factory(has_tools))
+        self._acquire()
+        load = self._open_request()
+        try:
+            response = await asyncio.get_running_loop().run_in_executor(
+                self._executor, partial(client.converse_stream, **api_params)
+            )
+        except Exception as e:
+            self._release()
+            if load:
+                load.end()
+            raise ChatCompletionError.from_bedrock(e)
+
+        released = False
+
+        def release():
+            nonlocal released
+            if not released:
+                released = True
+                self._release()
+                if load:
+                    load.end()
+
+        async def events() -> AsyncIterator[str]:
+            try:
+                # Closing the events (e.g. when the client disconnects) stops
+                # reading the model stream and frees its thread
+                async for event in iterate_stream(response["stream"], self._executor):
+                    for chunk in completion.translate(event):
+                        yield sse(chunk)
+                for chunk in completion.finish(include_usage):
+                    yield sse(chunk)
+            except Exception as e:
+                logger.error(f"Chat completion stream failed: {e}")
+                yield sse(ChatCompletionError.from_bedrock(e).body)
+            finally:
+                release()
+                if completion.usage:
+                    self.usage_ledger.record(user, profile, converse_usage(completion.usage))
+            yield SSE_DONE
+
+        stream = events()
+        # Events never iterated (the client left before the response started) never run their finally
+        weakref.finalize(stream, release)
+        return stream
+
+    def _acquire(self) -> None:
+        """Reserve a worker thread for a model call or stream, refusing the request when all are busy."""
+        if self._in_flight >= self.max_concurrency:
+            raise ChatCompletionError(
+                "Too many concurrent requests, please retry later", 429, "rate_limit_error", "too_many_requests"
+            )
+        self._in_flight += 1
+
+    def _release(self) -> None:
+        self._in_flight -= 1
+
+    def _open_request(self):
+        """Track a request in the load monitor, as sent to the model."""
+        if self.load_monitor is None:
+            return None
+        load = self.load_monitor.open_request()
+        load.start_streaming()
+        return load
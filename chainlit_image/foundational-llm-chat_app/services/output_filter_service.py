@@ -0,0 +1,187 @@
+"""
+Service for filtering model output, chunk by chunk.
+"""
+
+import re
+import logging
+from typing import List, Optional, Pattern, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class OutputFilter:
+    """
+    A stateful stage of the output filter pipeline.
+
+    Stages see the output as a sequence of chunks and may hold back text until
+    they know how to emit it, so their result does not depend on where the
+    chunk boundaries fall.
+    """
+
+    def feed(self, text: str) -> str:
+        """
+        Process a chunk.
+
+        Args:
+            text: The chunk of model output.
+
+        Returns:
+            The text that can be emitted now.
+        """
+        return text
+
+    def flush(self) -> str:
+        """
+        Signal the end of the output.
+
+        Returns:
+            The text still held back by the stage.
+        """
+        return ""
+
+
+class NewlineNormalizer(OutputFilter):
+    """Collapses runs of 3 or more newlines into 2, including runs split across chunks."""
+
+    def __init__(self):
+        self.pending_newlines = 0
+
+    def feed(self, text: str) -> str:
+        body = text.lstrip("\n")
+        leading = len(text) - len(body)
+        if not body:
+            # Only newlines: keep counting until we know how long the run is
+            self.pending_newlines += leading
+            return ""
+
+        prefix = "\n" * min(2, self.pending_newlines + leading)
+        if "\n\n\n" in body:
+            body = re.sub(r"\n{3,}", "\n\n", body)
+
+        # Hold back trailing newlines: the next chunk may extend the run
+        stripped = body.rstrip("\n")
+        self.pending_newlines = len(body) - len(stripped)
+        return prefix + stripped
+
+    def flush(self) -> str:
+        text = "\n" * min(2, self.pending_newlines)
+        self.pending_newlines = 0
+        return text
+
+
+class EmptyTextSuppressor(OutputFilter):
+    """
+    Drops whitespace-only output.
+
+    Models may return empty text together with tool calls. Whitespace is held
+    back until real content arrives, so it is only dropped when the whole
+    output is empty, not when a single chunk happens to be whitespace.
+    """
+
+    def __init__(self):
+        self.started = False
+        self.held = []
+
+    def feed(self, text: str) -> str:
+        if self.started:
+            return text
+        if not text.strip():
+            self.held.append(text)
+            return ""
+        self.started = True
+        held, self.held = "".join(self.held), []
+        return held + text
+
+    def flush(self) -> str:
+        if self.held:
+            logger.debug("Skipping empty text content (tools enabled)")
+        self.held = []
+        return ""
+
+
+class RedactionFilter(OutputFilter):
+    """
+    Applies redaction patterns to the output.
+
+    The last `holdback` characters are kept until the next chunk, so a match
+    split across chunks is still redacted as long as it is not longer than
+    `holdback` characters.
+    """
+
+    def __init__(self, patterns: List[Tuple[Pattern, str]], holdback: int = 64):
+        """
+        Initialize the redaction filter.
+
+        Args:
+            patterns: Compiled regular expressions and their replacement.
+            holdback: Maximum length of a match split across chunks.
+        """
+        self.patterns = patterns
+        self.holdback = holdback
+        self.buffer = ""
+
+    def _redact(self, text: str) -> str:
+        for pattern, replacement in self.patterns:
+            text = pattern.sub(replacement, text)
+        return text
+
+    def feed(self, text: str) -> str:
+        self.buffer = self._redact(self.buffer + text)
+        if len(self.buffer) <= self.holdback:
+            return ""
+        emit, self.buffer = self.buffer[: -self.holdback], self.buffer[-self.holdback :]
+        return emit
+
+    def flush(self) -> str:
+        text, self.buffer = self._redact(self.buffer), ""
+        return text
+
+
+class OutputFilterPipeline(OutputFilter):
+    """Chains output filter stages."""
+
+    def __init__(self, stages: List[OutputFilter]):
+        """
+        Initialize the pipeline.
+
+        Args:
+            stages: The stages, applied in order.
+        """
+        self.stages = stages
+
+    def feed(self, text: str) -> str:
+        for stage in self.stages:
+            if not text:
+                return ""
+            text = stage.feed(text)
+        return text
+
+    def flush(self) -> str:
+        text = ""
+        for stage in self.stages:
+            # Output released by a stage still goes through the next ones
+            text = (stage.feed(text) if text else "") + stage.flush()
+        return text
+
+
+def create_output_filter(
+    has_tools: bool,
+    redaction_patterns: Optional[List[Tuple[Pattern, str]]] = None,
+) -> OutputFilterPipeline:
+    """
+    Create the output filter pipeline of a model response.
+
+    Args:
+        has_tools: Whether tools are available (empty text is then suppressed).
+        redaction_patterns: Optional compiled patterns and their replacement.
+
+    Returns:
+        A new pipeline. Use one pipeline per response.
+    """
+    stages = []
+    if has_tools:
+        stages.append(EmptyTextSuppressor())
+    stages.append(NewlineNormalizer())
+    if redaction_patterns:
+        stages.append(RedactionFilter(redaction_patterns))
+    return OutputFilterPipeline(stages)
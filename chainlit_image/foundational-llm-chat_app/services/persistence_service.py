@@ -0,0 +1,480 @@
+"""
+Service for persisting conversations to DynamoDB and S3 without blocking the chat.
+"""
+
+import asyncio
+import os
+import random
+import logging
+from typing import Dict, Any, List, Optional, Callable
+
+import boto3
+from boto3.s3.transfer import TransferConfig
+from botocore.exceptions import ClientError
+from chainlit.data.dynamodb import DynamoDBDataLayer
+from chainlit.data.utils import queue_until_user_message
+
+logger = logging.getLogger(__name__)
+
+# DynamoDB accepts at most 25 put/delete requests per BatchWriteItem call
+MAX_BATCH_SIZE = 25
+
+RETRYABLE_ERROR_CODES = {
+    "ProvisionedThroughputExceededException",
+    "ThrottlingException",
+    "RequestLimitExceeded",
+    "InternalServerError",
+    "ServiceUnavailable",
+    "SlowDown",
+}
+
+
+class WriteBehindWriter:
+    """
+    Bounded write-behind queue that batches DynamoDB writes and S3 uploads.
+
+    Writes are executed by a single background task, so callers only pay for
+    an in-memory enqueue. When the queue is full, producers wait (backpressure)
+    instead of growing memory without bounds.
+    """
+
+    def __init__(
+        self,
+        table_name: str,
+        bucket_name: Optional[str],
+        dynamodb_client: Any,
+        s3_client: Any = None,
+        max_queue_size: int = 1000,
+        flush_interval: float = 0.2,
+        max_attempts: int = 5,
+        multipart_threshold_mb: int = 8,
+    ):
+        """
+        Initialize the writer.
+
+        Args:
+            table_name: The DynamoDB table name.
+            bucket_name: The S3 bucket used for element files.
+            dynamodb_client: A boto3 DynamoDB client (or a local stand-in).
+            s3_client: A boto3 S3 client (or a local stand-in).
+            max_queue_size: Maximum number of pending operations.
+            flush_interval: Seconds to wait for more operations before writing a partial batch.
+            max_attempts: Maximum attempts for each write before it is dropped.
+            multipart_threshold_mb: File size above which S3 uploads use multipart.
+        """
+        self.table_name = table_name
+        self.bucket_name = bucket_name
+        self.dynamodb_client = dynamodb_client
+        self.s3_client = s3_client
+        self.flush_interval = flush_interval
+        self.max_attempts = max_attempts
+        self.transfer_config = TransferConfig(
+            multipart_threshold=multipart_threshold_mb * 1024 * 1024,
+            multipart_chunksize=multipart_threshold_mb * 1024 * 1024,
+        )
+        self._queue: Optional[asyncio.Queue] = None
+        self._max_queue_size = max_queue_size
+        self._worker: Optional[asyncio.Task] = None
+        self.written = 0
+        self.failed = 0
+
+    def _ensure_worker(self) -> asyncio.Queue:
+        """Create the queue and start the background worker on first use."""
+        if self._queue is None:
+            self._queue = asyncio.Queue(maxsize=self._max_queue_size)
+        if self._worker is None or self._worker.done():
+            self._worker = asyncio.create_task(self._run())
+        return self._queue
+
+    @property
+    def pending(self) -> int:
+        """Number of operations waiting to be written."""
+        return self._queue.qsize() if self._queue else 0
+
+    async def put_item(self, item: Dict[str, Any]) -> None:
+        """Queue a serialized DynamoDB item for a batched put."""
+        await self._ensure_worker().put({"kind": "put", "item": item})
+
+    async def delete_item(self, key: Dict[str, Any]) -> None:
+        """Queue a serialized DynamoDB key for a batched delete."""
+        await self._ensure_worker().put({"kind": "delete", "key": key})
+
+    async def update_item(self, params: Dict[str, Any]) -> None:
+        """Queue an UpdateItem call (updates cannot be batched by DynamoDB)."""
+        await self._ensure_worker().put({"kind": "update", "params": params})
+
+    async def upload(
+        self,
+        object_key: str,
+        mime: str,
+        path: Optional[str] = None,
+        data: Optional[bytes] = None,
+        then_put: Optional[Dict[str, Any]] = None,
+    ) -> None:
+        """
+        Queue an S3 upload, optionally followed by a DynamoDB put.
+
+        Args:
+            object_key: The S3 object key.
+            mime: The content type of the object.
+            path: Local file to upload (multipart for large files).
+            data: In-memory content to upload.
+            then_put: Serialized item written once the upload succeeds.
+        """
+        await self._ensure_worker().put(
+            {
+                "kind": "upload",
+                "object_key": object_key,
+                "mime": mime,
+                "path": path,
+                "data": data,
+                "then_put": then_put,
+            }
+        )
+
+    async def flush(self) -> None:
+        """Wait until every queued operation has been written or dropped."""
+        if self._queue is not None and self._worker is not None:
+            await self._queue.join()
+
+    async def close(self) -> None:
+        """Flush pending operations and stop the background worker."""
+        await self.flush()
+        if self._worker:
+            self._worker.cancel()
+            self._worker = None
+
+    async def _run(self) -> None:
+        """Drain the queue, grouping operations into batches."""
+        queue = self._queue
+        while True:
+            ops = [await queue.get()]
+            # Linger briefly so bursts of step writes share a single batch
+            deadline = asyncio.get_running_loop().time() + self.flush_interval
+            while len(ops) < MAX_BATCH_SIZE:
+                timeout = deadline - asyncio.get_running_loop().time()
+                if timeout <= 0:
+                    break
+                try:
+                    ops.append(await asyncio.wait_for(queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            try:
+                await self._process(ops)
+            except Exception as e:
+                logger.error(f"Write-behind batch failed: {e}")
+                self.failed += len(ops)
+            finally:
+                for _ in ops:
+                    queue.task_done()
+
+    async def _process(self, ops: List[Dict[str, Any]]) -> None:
+        """Write a group of operations, preserving their order."""
+        batch: Dict[tuple, Dict[str, Any]] = {}
+        for op in ops:
+            if op["kind"] == "upload":
+                item = await self._upload(op)
+                if item is not None:
+                    self._add_to_batch(batch, {"PutRequest": {"Item": item}})
+            elif op["kind"] == "put":
+                self._add_to_batch(batch, {"PutRequest": {"Item": op["item"]}})
+            elif op["kind"] == "delete":
+                self._add_to_batch(batch, {"DeleteRequest": {"Key": op["key"]}})
+            else:
+                # Keep ordering: pending puts for the same item must land first
+                await self._write_batch(batch)
+                batch = {}
+                try:
+                    await self._call_with_retry(
+                        self.dynamodb_client.update_item, TableName=self.table_name, **op["params"]
+                    )
+                    self.written += 1
+                except Exception as e:
+                    logger.error(f"Error updating item: {e}")
+                    self.failed += 1
+        await self._write_batch(batch)
+
+    @staticmethod
+    def _add_to_batch(batch: Dict[tuple, Dict[str, Any]], request: Dict[str, Any]) -> None:
+        """Add a request to a batch, keeping only the last write for each key."""
+        if "PutRequest" in request:
+            item = request["PutRequest"]["Item"]
+        else:
+            item = request["DeleteRequest"]["Key"]
+        key = (str(item.get("PK")), str(item.get("SK")))
+        # BatchWriteItem rejects duplicate keys; the last full-item write wins anyway
+        batch.pop(key, None)
+        batch[key] = request
+
+    async def _write_batch(self, batch: Dict[tuple, Dict[str, Any]]) -> None:
+        """Send a batch with BatchWriteItem, retrying unprocessed items."""
+        requests = list(batch.values())
+        while requests:
+            chunk, requests = requests[:MAX_BATCH_SIZE], requests[MAX_BATCH_SIZE:]
+            pending = {self.table_name: chunk}
+            dropped = 0
+            for attempt in range(1, self.max_attempts + 1):
+                response = await self._call_with_retry(
+                    self.dynamodb_client.batch_write_item, RequestItems=pending
+                )
+                unprocessed = (response or {}).get("UnprocessedItems") or {}
+                if not unprocessed.get(self.table_name):
+                    break
+                pending = unprocessed
+                logger.debug(
+                    f"Retrying {len(pending[self.table_name])} unprocessed items (attempt {attempt})"
+                )
+                await asyncio.sleep(self._backoff(attempt))
+            else:
+                dropped = len(pending[self.table_name])
+                self.failed += dropped
+                logger.error(f"Dropped {dropped} items after {self.max_attempts} attempts")
+            self.written += len(chunk) - dropped
+
+    async def _upload(self, op: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Upload an element file to S3, returning the follow-up item if any."""
+        if not self.s3_client or not self.bucket_name:
+            logger.warning("No S3 bucket configured, skipping element upload")
+            return None
+        try:
+            if op["path"]:
+                # upload_file switches to multipart above the transfer threshold
+                await self._call_with_retry(
+                    self.s3_client.upload_file,
+                    op["path"],
+                    self.bucket_name,
+                    op["object_key"],
+                    ExtraArgs={"ContentType": op["mime"]},
+                    Config=self.transfer_config,
+                )
+            else:
+                await self._call_with_retry(
+                    self.s3_client.put_object,
+                    Bucket=self.bucket_name,
+                    Key=op["object_key"],
+                    Body=op["data"],
+                    ContentType=op["mime"],
+                )
+        except Exception as e:
+            logger.error(f"Error uploading {op['object_key']}: {e}")
+            self.failed += 1
+            return None
+        return op["then_put"]
+
+    async def _call_with_retry(self, func: Callable, *args, **kwargs) -> Any:
+        """Run a blocking boto3 call in a thread, retrying throttling errors."""
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                return await asyncio.to_thread(func, *args, **kwargs)
+            except ClientError as err:
+                code = err.response.get("Error", {}).get("Code", "")
+                if code not in RETRYABLE_ERROR_CODES or attempt == self.max_attempts:
+                    raise
+                await asyncio.sleep(self._backoff(attempt))
+
+    @staticmethod
+    def _backoff(attempt: int) -> float:
+        """Exponential backoff with full jitter, capped at 5 seconds."""
+        return random.uniform(0, min(5.0, 0.05 * (2 ** attempt)))
+
+
+class WriteBehindDynamoDBDataLayer(DynamoDBDataLayer):
+    """
+    Chainlit DynamoDB data layer whose conversation writes go through a WriteBehindWriter.
+
+    Reads flush pending writes first, so a resumed thread always sees its own messages.
+    """
+
+    def __init__(
+        self,
+        table_name: str,
+        writer: WriteBehindWriter,
+        client: Any = None,
+        storage_provider: Any = None,
+    ):
+        """
+        Initialize the data layer.
+
+        Args:
+            table_name: The DynamoDB table name.
+            writer: The write-behind writer used for conversation writes.
+            client: A boto3 DynamoDB client used for reads.
+            storage_provider: Chainlit storage client used for read URLs.
+        """
+        super().__init__(
+            table_name=table_name,
+            client=client or writer.dynamodb_client,
+            storage_provider=storage_provider,
+        )
+        self.writer = writer
+
+    def _build_update(self, key: Dict[str, Any], updates: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Build UpdateItem parameters the same way the base data layer does."""
+        update_expr = []
+        expression_attribute_names = {}
+        expression_attribute_values = {}
+
+        for index, (attr, value) in enumerate(updates.items()):
+            if not value:
+                continue
+            k, v = f"#{index}", f":{index}"
+            update_expr.append(f"{k} = {v}")
+            expression_attribute_names[k] = attr
+            expression_attribute_values[v] = value
+
+        if not update_expr:
+            return None
+
+        return {
+            "Key": self._serialize_item(key),
+            "UpdateExpression": "SET " + ", ".join(update_expr),
+            "ExpressionAttributeNames": expression_attribute_names,
+            "ExpressionAttributeValues": self._serialize_item(expression_attribute_values),
+        }
+
+    @queue_until_user_message()
+    async def create_step(self, step_dict):
+        item = dict(step_dict)
+        item.update({"PK": f"THREAD#{step_dict['threadId']}", "SK": f"STEP#{step_dict['id']}"})
+        await self.writer.put_item(self._serialize_item(item))
+
+    @queue_until_user_message()
+    async def update_step(self, step_dict):
+        params = self._build_update(
+            key={"PK": f"THREAD#{step_dict['threadId']}", "SK": f"STEP#{step_dict['id']}"},
+            updates=step_dict,
+        )
+        if params:
+            await self.writer.update_item(params)
+
+    @queue_until_user_message()
+    async def delete_step(self, step_id: str):
+        thread_id = self.context.session.thread_id
+        await self.writer.delete_item(
+            {"PK": {"S": f"THREAD#{thread_id}"}, "SK": {"S": f"STEP#{step_id}"}}
+        )
+
+    async def update_thread(self, thread_id: str, name=None, user_id=None, metadata=None, tags=None):
+        ts = self._get_current_timestamp()
+        item = {
+            "UserThreadSK": f"TS#{ts}",
+            "id": thread_id,
+            "createdAt": ts,
+            "name": name,
+            "userId": user_id,
+            "userIdentifier": user_id,
+            "tags": tags,
+            "metadata": metadata,
+        }
+        if user_id:
+            item["UserThreadPK"] = f"USER#{user_id}"
+
+        params = self._build_update(key={"PK": f"THREAD#{thread_id}", "SK": "THREAD"}, updates=item)
+        if params:
+            await self.writer.update_item(params)
+
+    @queue_until_user_message()
+    async def create_element(self, element):
+        if not element.for_id:
+            return
+
+        if not element.mime:
+            element.mime = "application/octet-stream"
+
+        context_user = self.context.session.user
+        user_folder = getattr(context_user, "id", "unknown")
+        object_key = f"{user_folder}/{element.thread_id}/{element.id}"
+
+        element_dict = element.to_dict()
+        element_dict.update(
+            {
+                "PK": f"THREAD#{element.thread_id}",
+                "SK": f"ELEMENT#{element.id}",
+                "url": f"https://{self.writer.bucket_name}.s3.{os.environ.get('DEV_AWS_ENDPOINT', 'amazonaws.com')}/{object_key}",
+                "objectKey": object_key,
+            }
+        )
+
+        content = element.content
+        if isinstance(content, str):
+            content = content.encode("utf-8")
+        if content is None and not element.path:
+            # URL elements are rare; keep the base implementation for them
+            await super().create_element(element)
+            return
+
+        await self.writer.upload(
+            object_key=object_key,
+            mime=element.mime,
+            path=None if content is not None else element.path,
+            data=content,
+            then_put=self._serialize_item(element_dict),
+        )
+
+    @queue_until_user_message()
+    async def delete_element(self, element_id: str, thread_id: Optional[str] = None):
+        thread_id = self.context.session.thread_id
+        await self.writer.delete_item(
+            {"PK": {"S": f"THREAD#{thread_id}"}, "SK": {"S": f"ELEMENT#{element_id}"}}
+        )
+
+    async def get_thread(self, thread_id: str):
+        await self.writer.flush()
+        return await super().get_thread(thread_id)
+
+    async def list_threads(self, pagination, filters):
+        await self.writer.flush()
+        return await super().list_threads(pagination, filters)
+
+    async def delete_thread(self, thread_id: str):
+        # Pending writes would otherwise re-create items of the deleted thread
+        await self.writer.flush()
+        await super().delete_thread(thread_id)
+
+    async def close(self) -> None:
+        await self.writer.close()
+        await super().close()
+
+
+def create_data_layer(
+    data_layer_config: Dict[str, Any],
+    region_name: str,
+) -> Optional[WriteBehindDynamoDBDataLayer]:
+    """
+    Create the write-behind data layer from the data layer configuration.
+
+    Args:
+        data_layer_config: Output of AppConfig.load_data_layer_config().
+        region_name: The AWS region of the table and bucket.
+
+    Returns:
+        The data layer, or None if persistence is not configured.
+    """
+    if not (data_layer_config["dynamodb_table"] and data_layer_config["s3_bucket"]):
+        return None
+
+    from chainlit.data.storage_clients.s3 import S3StorageClient
+
+    dynamodb_client = boto3.client(
+        "dynamodb",
+        region_name=region_name,
+        endpoint_url=data_layer_config.get("dynamodb_endpoint_url"),
+    )
+    s3_kwargs = {"region_name": region_name}
+    if data_layer_config.get("s3_endpoint_url"):
+        s3_kwargs["endpoint_url"] = data_layer_config["s3_endpoint_url"]
+    s3_client = boto3.client("s3", **s3_kwargs)
+
+    writer = WriteBehindWriter(
+        table_name=data_layer_config["dynamodb_table"],
+        bucket_name=data_layer_config["s3_bucket"],
+        dynamodb_client=dynamodb_client,
+        s3_client=s3_client,
+        max_queue_size=data_layer_config.get("max_queue_size", 1000),
+        multipart_threshold_mb=data_layer_config.get("multipart_threshold_mb", 8),
+    )
+    return WriteBehindDynamoDBDataLayer(
+        table_name=data_layer_config["dynamodb_table"],
+        writer=writer,
+        storage_provider=S3StorageClient(bucket=data_layer_config["s3_bucket"], **s3_kwargs),
+    )
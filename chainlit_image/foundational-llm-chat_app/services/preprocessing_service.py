@@ -0,0 +1,409 @@
+"""
+Service for pre-processing documents locally to reduce their input tokens.
+"""
+
+import asyncio
+import csv
+import hashlib
+import io
+import logging
+import multiprocessing
+import re
+import zipfile
+import xml.etree.ElementTree as ET
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timedelta
+from html.parser import HTMLParser
+from typing import Dict, Any, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Formats that can be pre-processed and the format of the processed document
+PREPROCESSED_FORMATS = {"html": "md", "csv": "csv", "xlsx": "csv", "md": "md"}
+
+XLSX_NAMESPACE = {"x": "http://schemas.openxmlformats.org/spreadsheetml/2006/main"}
+XLSX_RELATIONSHIP = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}id"
+
+# Built-in number formats of dates and times (ECMA-376 18.8.30, including the East Asian dates)
+XLSX_DATE_FORMATS = set(range(14, 18)) | set(range(27, 37)) | set(range(50, 59))
+XLSX_TIME_FORMATS = {18, 19, 20, 21, 45, 46, 47}
+XLSX_DATETIME_FORMATS = {22}
+
+# Decompressed size limits of the workbook parts, checked before reading them (zip bombs)
+XLSX_MAX_PART_BYTES = 64 * 1024 * 1024
+XLSX_MAX_TOTAL_BYTES = 256 * 1024 * 1024
+
+
+class _HtmlToMarkdown(HTMLParser):
+    """Converts HTML to compact markdown-like text, dropping scripts, styles and page chrome."""
+
+    SKIPPED_TAGS = {"script", "style", "head", "nav", "footer", "noscript", "svg", "template", "iframe"}
+    BLOCK_TAGS = {"p", "div", "section", "article", "header", "main", "table", "tr", "ul", "ol", "blockquote", "pre", "br", "hr"}
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts: List[str] = []
+        self.skip_depth = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.SKIPPED_TAGS:
+            self.skip_depth += 1
+        elif self.skip_depth:
+            return
+        elif re.fullmatch(r"h[1-6]", tag):
+            self.parts.append("\n\n" + "#" * int(tag[1]) + " ")
+        elif tag == "li":
+            self.parts.append("\n- ")
+        elif tag in ("td", "th"):
+            self.parts.append(" | ")
+        elif tag in self.BLOCK_TAGS:
+            self.parts.append("\n")
+
+    def handle_endtag(self, tag):
+        if tag in self.SKIPPED_TAGS:
+            self.skip_depth = max(0, self.skip_depth - 1)
+        elif not self.skip_depth and tag != "tr" and (tag in self.BLOCK_TAGS or re.fullmatch(r"h[1-6]", tag)):
+            self.parts.append("\n")
+
+    def handle_data(self, data):
+        if not self.skip_depth:
+            self.parts.append(re.sub(r"\s+", " ", data))
+
+    def text(self) -> str:
+        text = "".join(self.parts)
+        text = re.sub(r"[ \t]+\n", "\n", text)
+        text = re.sub(r"\n[ \t]+", "\n", text)
+        return re.sub(r"\n{3,}", "\n\n", text).strip()
+
+
+def html_to_markdown(data: bytes) -> str:
+    """Convert an HTML document to markdown-like text."""
+    parser = _HtmlToMarkdown()
+    parser.feed(data.decode("utf-8", errors="replace"))
+    parser.close()
+    return parser.text()
+
+
+def clean_rows(rows: List[List[str]]) -> List[List[str]]:
+    """
+    Clean a table: strip cells, drop empty rows and columns and repeated header rows.
+
+    Args:
+        rows: The table rows.
+
+    Returns:
+        The cleaned rows.
+    """
+    rows = [[cell.strip() for cell in row] for row in rows]
+    rows = [row for row in rows if any(row)]
+    if not rows:
+        return []
+    width = max(len(row) for row in rows)
+    rows = [row + [""] * (width - len(row)) for row in rows]
+    kept_columns = [index for index in range(width) if any(row[index] for row in rows)]
+    rows = [[row[index] for index in kept_columns] for row in rows]
+    # Exports often repeat the header row (e.g. on every page)
+    header = rows[0]
+    return [header] + [row for row in rows[1:] if row != header]
+
+
+def rows_to_csv(rows: List[List[str]]) -> str:
+    """Serialize rows as CSV."""
+    output = io.StringIO()
+    csv.writer(output, lineterminator="\n").writerows(rows)
+    return output.getvalue()
+
+
+def clean_csv(data: bytes) -> str:
+    """Clean a CSV document."""
+    text = data.decode("utf-8-sig", errors="replace")
+    try:
+        dialect = csv.Sniffer().sniff(text[:4096])
+    except csv.Error:
+        dialect = csv.excel
+    return rows_to_csv(clean_rows(list(csv.reader(io.StringIO(text), dialect))))
+
+
+def _column_index(reference: str) -> int:
+    """Column index of a cell reference (e.g. "C7" -> 2)."""
+    index = 0
+    for char in reference:
+        if not char.isalpha():
+            break
+        index = index * 26 + ord(char.upper()) - ord("A") + 1
+    return index - 1
+
+
+def _number_format_kind(format_code: str) -> Optional[str]:
+    """Kind of a custom number format: "date", "time", "datetime" or None (not a date)."""
+    # Literal text, colors, conditions and escaped characters are not date parts
+    code = re.sub(r'"[^"]*"|\\.|_.|\*.', "", format_code)
+    if re.search(r"\[(h+|m+|s+)\]", code, re.IGNORECASE):
+        # Elapsed durations are kept as numbers
+        return None
+    code = re.sub(r"\[[^\]]*\]", "", code).split(";")[0].lower()
+    has_time = "h" in code or "s" in code
+    has_date = "d" in code or "y" in code or ("m" in code and not has_time)
+    if has_date and has_time:
+        return "datetime"
+    if has_date:
+        return "date"
+    return "time" if has_time else None
+
+
+class _WorkbookReader:
+    """Reads the parts of an XLSX workbook, refusing parts over the decompressed size limits."""
+
+    def __init__(self, workbook: zipfile.ZipFile):
+        self.workbook = workbook
+        self.total_bytes = 0
+
+    def has(self, name: str) -> bool:
+        return name in self.workbook.namelist()
+
+    def read(self, name: str) -> bytes:
+        size = self.workbook.getinfo(name).file_size
+        self.total_bytes += size
+        if size > XLSX_MAX_PART_BYTES or self.total_bytes > XLSX_MAX_TOTAL_BYTES:
+            raise ValueError(f"Workbook part {name} is too large once decompressed ({size} bytes)")
+        return self.workbook.read(name)
+
+
+def _xlsx_format_kinds(workbook: _WorkbookReader) -> List[Optional[str]]:
+    """Date kind of each cell style of a workbook (see _number_format_kind), by style index."""
+    if not workbook.has("xl/styles.xml"):
+        return []
+    root = ET.fromstring(workbook.read("xl/styles.xml"))
+    custom_formats = {
+        int(fmt.get("numFmtId")): fmt.get("formatCode", "")
+        for fmt in root.iterfind("x:numFmts/x:numFmt", XLSX_NAMESPACE)
+    }
+    kinds = []
+    for style in root.iterfind("x:cellXfs/x:xf", XLSX_NAMESPACE):
+        format_id = int(style.get("numFmtId", "0"))
+        if format_id in custom_formats:
+            kinds.append(_number_format_kind(custom_formats[format_id]))
+        elif format_id in XLSX_DATE_FORMATS:
+            kinds.append("date")
+        elif format_id in XLSX_TIME_FORMATS:
+            kinds.append("time")
+        elif format_id in XLSX_DATETIME_FORMATS:
+            kinds.append("datetime")
+        else:
+            kinds.append(None)
+    return kinds
+
+
+def _format_serial_date(value: str, kind: str, epoch: datetime) -> str:
+    """Format a date serial number as ISO 8601, or return it unchanged if it is not a number."""
+    try:
+        moment = epoch + timedelta(days=float(value))
+    except (ValueError, OverflowError):
+        return value
+    # Round to the second: serials are binary fractions of a day
+    moment = (moment + timedelta(microseconds=500_000)).replace(microsecond=0)
+    if kind == "date":
+        return moment.date().isoformat()
+    if kind == "time":
+        return moment.time().isoformat()
+    return moment.isoformat(sep=" ")
+
+
+def xlsx_to_csv(data: bytes) -> str:
+    """
+    Convert the sheets of an XLSX workbook to cleaned CSV, one section per sheet.
+
+    Dates and times are written in ISO 8601 from their cell style, booleans as TRUE/FALSE.
+    Raises ValueError if a part is over the decompressed size limits.
+    """
+    with zipfile.ZipFile(io.BytesIO(data)) as archive:
+        workbook = _WorkbookReader(archive)
+        shared_strings = []
+        if workbook.has("xl/sharedStrings.xml"):
+            root = ET.fromstring(workbook.read("xl/sharedStrings.xml"))
+            for item in root.findall("x:si", XLSX_NAMESPACE):
+                shared_strings.append("".join(node.text or "" for node in item.iter(f"{{{XLSX_NAMESPACE['x']}}}t")))
+
+        relationships = {
+            rel.get("Id"): rel.get("Target")
+            for rel in ET.fromstring(workbook.read("xl/_rels/workbook.xml.rels"))
+        }
+        workbook_root = ET.fromstring(workbook.read("xl/workbook.xml"))
+        sheets = workbook_root.find("x:sheets", XLSX_NAMESPACE)
+        properties = workbook_root.find("x:workbookPr", XLSX_NAMESPACE)
+        date1904 = properties is not None and properties.get("date1904") in ("1", "true")
+        # Serial 60 is the 1900-02-29 that never was: dates before March 1900 are off by one
+        epoch = datetime(1904, 1, 1) if date1904 else datetime(1899, 12, 30)
+        format_kinds = _xlsx_format_kinds(workbook)
+
+        sections = []
+        for sheet in sheets:
+            target = relationships.get(sheet.get(XLSX_RELATIONSHIP), "")
+            path = target.lstrip("/") if target.startswith("/") else f"xl/{target}"
+            rows = []
+            for row in ET.fromstring(workbook.read(path)).iter(f"{{{XLSX_NAMESPACE['x']}}}row"):
+                values = {}
+                for cell in row.findall("x:c", XLSX_NAMESPACE):
+                    cell_type = cell.get("t")
+                    if cell_type == "inlineStr":
+                        value = "".join(node.text or "" for node in cell.iter(f"{{{XLSX_NAMESPACE['x']}}}t"))
+                    else:
+                        node = cell.find("x:v", XLSX_NAMESPACE)
+                        value = node.text if node is not None and node.text else ""
+                        if cell_type == "s" and value:
+                            value = shared_strings[int(value)]
+                        elif cell_type == "b" and value:
+                            value = "TRUE" if value == "1" else "FALSE"
+                        elif cell_type in (None, "n") and value:
+                            style = int(cell.get("s", "0"))
+                            kind = format_kinds[style] if style < len(format_kinds) else None
+                            if kind:
+                                value = _format_serial_date(value, kind, epoch)
+                    values[_column_index(cell.get("r", "A"))] = value
+                if values:
+                    rows.append([values.get(index, "") for index in range(max(values) + 1)])
+            rows = clean_rows(rows)
+            if rows:
+                sections.append((sheet.get("name"), rows_to_csv(rows)))
+
+    if len(sections) == 1:
+        return sections[0][1]
+    return "\n".join(f"# Sheet: {name}\n{content}" for name, content in sections)
+
+
+def clean_markdown(data: bytes) -> str:
+    """Clean a markdown document: comments, trailing spaces and blank line runs."""
+    text = data.decode("utf-8", errors="replace")
+    text = re.sub(r"<!--.*?-->", "", text, flags=re.DOTALL)
+    text = re.sub(r"[ \t]+\n", "\n", text)
+    return re.sub(r"\n{3,}", "\n\n", text).strip()
+
+
+def preprocess_document(data: bytes, doc_format: str) -> Optional[bytes]:
+    """
+    Pre-process a document. Runs in a worker process.
+
+    Args:
+        data: The document bytes.
+        doc_format: The Bedrock document format.
+
+    Returns:
+        The processed document, or None if it cannot be processed.
+    """
+    try:
+        if doc_format == "html":
+            text = html_to_markdown(data)
+        elif doc_format == "csv":
+            text = clean_csv(data)
+        elif doc_format == "xlsx":
+            text = xlsx_to_csv(data)
+        elif doc_format == "md":
+            text = clean_markdown(data)
+        else:
+            return None
+    except Exception as e:
+        logger.warning(f"Could not pre-process {doc_format} document: {e}")
+        return None
+    return text.encode("utf-8")
+
+
+class DocumentPreprocessor:
+    """
+    Pre-processes documents on a worker pool, caching the results by content hash.
+
+    Only processed documents smaller than the original replace it: a document
+    that cannot be processed, or does not shrink, is sent as is.
+    """
+
+    def __init__(self, max_workers: int = 2, cache_size: int = 256):
+        """
+        Initialize the pre-processor.
+
+        Args:
+            max_workers: Number of worker processes.
+            cache_size: Number of processed documents kept in the cache.
+        """
+        self.max_workers = max_workers
+        self.cache_size = cache_size
+        self._executor: Optional[ProcessPoolExecutor] = None
+        # Content hash and format -> (processed format, processed bytes or None)
+        self._cache: "OrderedDict[Tuple[str, str], Tuple[str, Optional[bytes]]]" = OrderedDict()
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # Forked workers would inherit the threads and locks of the event loop process
+            methods = multiprocessing.get_all_start_methods()
+            context = multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers, mp_context=context)
+        return self._executor
+
+    async def _preprocess(self, data: bytes, doc_format: str) -> Optional[bytes]:
+        # Documents are up to several MB: hashed off the event loop
+        content_hash = await asyncio.to_thread(lambda: hashlib.sha256(data).hexdigest())
+        key = (content_hash, doc_format)
+        if key in self._cache:
+            self._cache.move_to_end(key)
+            return self._cache[key][1]
+        loop = asyncio.get_running_loop()
+        executor = self._get_executor()
+        try:
+            processed = await loop.run_in_executor(executor, preprocess_document, data, doc_format)
+        except BrokenProcessPool:
+            # A worker died (e.g. killed out of memory): the document is sent as is and the
+            # pool is created again for the next ones. Not cached, the cause may be another document
+            logger.error(f"Pre-processing worker pool broken while processing a {doc_format} document")
+            if self._executor is executor:
+                self._executor = None
+                executor.shutdown(wait=False, cancel_futures=True)
+            return None
+        self._cache[key] = (PREPROCESSED_FORMATS[doc_format], processed)
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return processed
+
+    async def process(
+        self,
+        doc_blocks: List[Dict[str, Any]],
+        token_estimator,
+        family: str,
+    ) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+        """
+        Pre-process the document content blocks of a message.
+
+        Args:
+            doc_blocks: The document content blocks (inline bytes; S3 references are kept as is).
+            token_estimator: The TokenEstimator used to report the tokens saved.
+            family: The model family.
+
+        Returns:
+            A tuple of (content blocks, report). The report has one entry per
+            processed document: name, format, tokens_before, tokens_after.
+        """
+        async def process_block(block):
+            document = block["document"]
+            data = document["source"].get("bytes")
+            doc_format = document.get("format")
+            if data is None or doc_format not in PREPROCESSED_FORMATS:
+                return block, None
+            processed = await self._preprocess(data, doc_format)
+            if processed is None or len(processed) >= len(data):
+                return block, None
+            new_format = PREPROCESSED_FORMATS[doc_format]
+            report = {
+                "name": document["name"],
+                "format": doc_format,
+                "tokens_before": token_estimator.estimate_document(data, doc_format, family),
+                "tokens_after": token_estimator.estimate_document(processed, new_format, family),
+            }
+            return {"document": {**document, "format": new_format, "source": {"bytes": processed}}}, report
+
+        results = await asyncio.gather(*(process_block(block) for block in doc_blocks))
+        return [block for block, _ in results], [report for _, report in results if report]
+
+    def shutdown(self) -> None:
+        """Stop the worker processes."""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
@@ -0,0 +1,251 @@
+"""
+Service for recording Bedrock responses to fixtures and replaying them without network.
+"""
+
+import os
+import gzip
+import json
+import time
+import uuid
+import base64
+import logging
+import threading
+from typing import Dict, Any, Iterator, List
+
+logger = logging.getLogger(__name__)
+
+FIXTURE_VERSION = 1
+FIXTURE_SUFFIX = ".jsonl.gz"
+
+
+def _encode_default(value: Any) -> Any:
+    if isinstance(value, (bytes, bytearray)):
+        return {"$b": base64.b64encode(value).decode("ascii")}
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not serializable")
+
+
+def _decode_hook(value: Dict[str, Any]) -> Any:
+    if len(value) == 1 and "$b" in value:
+        return base64.b64decode(value["$b"])
+    return value
+
+
+def _without_metadata(response: Dict[str, Any]) -> Dict[str, Any]:
+    """A response without its HTTP metadata and its stream."""
+    return {key: value for key, value in response.items() if key not in ("ResponseMetadata", "stream")}
+
+
+def save_fixture(path: str, header: Dict[str, Any], events: List[Dict[str, Any]]) -> None:
+    """
+    Write a fixture: a gzipped JSON line header, then one line per event.
+
+    Args:
+        path: The fixture file.
+        header: The fixture header (operation, model, response fields).
+        events: The recorded events: {"t": seconds since the request, "e": event}.
+    """
+    with gzip.open(path, "wt", encoding="utf-8") as f:
+        f.write(json.dumps({"version": FIXTURE_VERSION, **header}, separators=(",", ":"), default=_encode_default))
+        f.write("\n")
+        for event in events:
+            f.write(json.dumps(event, separators=(",", ":"), default=_encode_default))
+            f.write("\n")
+
+
+def load_fixture(path: str) -> Dict[str, Any]:
+    """
+    Read a fixture.
+
+    Args:
+        path: The fixture file.
+
+    Returns:
+        The header, with the recorded events under "events".
+    """
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        lines = [json.loads(line, object_hook=_decode_hook) for line in f if line.strip()]
+    header = lines[0]
+    if header.get("version") != FIXTURE_VERSION:
+        raise ValueError(f"Unsupported fixture version in {path}: {header.get('version')}")
+    header["events"] = lines[1:]
+    return header
+
+
+def list_fixtures(path: str) -> List[str]:
+    """
+    List the fixtures of a directory in recording order (or a single fixture file).
+
+    Args:
+        path: A fixture file or directory.
+
+    Returns:
+        The fixture files.
+    """
+    if os.path.isdir(path):
+        return sorted(
+            os.path.join(path, name) for name in os.listdir(path) if name.endswith(FIXTURE_SUFFIX)
+        )
+    return [path]
+
+
+class RecordingBedrockClient:
+    """
+    Bedrock runtime client recording every Converse and ConverseStream response
+    to a fixture, with the arrival time of each stream event.
+
+    Streams are recorded as they are consumed: the caller sees the events with
+    no added latency, and the fixture is written when the stream ends.
+    """
+
+    def __init__(self, client, directory: str):
+        """
+        Initialize the recorder.
+
+        Args:
+            client: The Bedrock runtime client.
+            directory: Where fixtures are written.
+        """
+        self._client = client
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._sequence = 0
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+    def _fixture_path(self, operation: str) -> str:
+        with self._lock:
+            self._sequence += 1
+            sequence = self._sequence
+        # Sortable by recording time, unique across processes
+        return os.path.join(
+            self.directory,
+            f"{time.strftime('%Y%m%d-%H%M%S')}-{sequence:04d}-{operation}-{uuid.uuid4().hex[:8]}{FIXTURE_SUFFIX}",
+        )
+
+    def converse(self, **params):
+        start = time.perf_counter()
+        response = self._client.converse(**params)
+        header = {
+            "operation": "converse",
+            "model_id": params.get("modelId"),
+            "latency": round(time.perf_counter() - start, 4),
+            "response": _without_metadata(response),
+        }
+        try:
+            save_fixture(self._fixture_path("converse"), header, [])
+        except Exception as e:
+            logger.error(f"Error recording Bedrock response: {e}")
+        return response
+
+    def converse_stream(self, **params):
+        start = time.perf_counter()
+        response = self._client.converse_stream(**params)
+        header = {
+            "operation": "converse_stream",
+            "model_id": params.get("modelId"),
+            "latency": round(time.perf_counter() - start, 4),
+            "response": _without_metadata(response),
+        }
+        response["stream"] = self._record(response["stream"], header, start)
+        return response
+
+    def _record(self, stream, header: Dict[str, Any], start: float) -> Iterator[Dict[str, Any]]:
+        events = []
+        try:
+            for event in stream:
+                events.append({"t": round(time.perf_counter() - start, 4), "e": event})
+                yield event
+        finally:
+            try:
+                save_fixture(self._fixture_path("converse_stream"), header, events)
+            except Exception as e:
+                logger.error(f"Error recording Bedrock stream: {e}")
+
+
+class ReplayStream:
+    """Replays recorded stream events, at the recorded pace scaled by a speed factor."""
+
+    def __init__(self, events: List[Dict[str, Any]], speed: float = 1.0, start_offset: float = 0.0):
+        """
+        Initialize the stream.
+
+        Args:
+            events: The recorded events.
+            speed: Pace factor (2.0 = twice as fast; 0 = as fast as possible).
+            start_offset: Time of the request relative to the first event already waited for.
+        """
+        self.events = events
+        self.speed = speed
+        self.start_offset = start_offset
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        start = time.perf_counter() - self.start_offset
+        for event in self.events:
+            if self.speed > 0:
+                delay = event["t"] / self.speed - (time.perf_counter() - start)
+                if delay > 0:
+                    time.sleep(delay)
+            yield event["e"]
+
+
+class ReplayBedrockClient:
+    """
+    Stand-in Bedrock runtime client answering from fixtures, in order.
+
+    Each Converse or ConverseStream call takes the next fixture of its operation
+    (a turn with tool use takes one fixture per model call), cycling when all
+    were used. The request parameters are ignored.
+    """
+
+    def __init__(self, fixtures: List[str], speed: float = 1.0, region_name: str = "us-east-1"):
+        """
+        Initialize the replayer.
+
+        Args:
+            fixtures: The fixture files.
+            speed: Pace factor (2.0 = twice as fast; 0 = as fast as possible).
+            region_name: The region reported by the client.
+        """
+        self.speed = speed
+        self.meta = type("ReplayMeta", (), {"region_name": region_name})()
+        self._fixtures: Dict[str, List[Dict[str, Any]]] = {"converse": [], "converse_stream": []}
+        for path in fixtures:
+            fixture = load_fixture(path)
+            self._fixtures[fixture["operation"]].append(fixture)
+        self._next = {"converse": 0, "converse_stream": 0}
+        self._lock = threading.Lock()
+
+    def _take(self, operation: str) -> Dict[str, Any]:
+        fixtures = self._fixtures[operation]
+        if not fixtures:
+            raise RuntimeError(f"No {operation} fixture to replay")
+        with self._lock:
+            fixture = fixtures[self._next[operation] % len(fixtures)]
+            self._next[operation] += 1
+        return fixture
+
+    def _wait(self, latency: float) -> None:
+        if self.speed > 0 and latency:
+            time.sleep(latency / self.speed)
+
+    def converse(self, **params):
+        fixture = self._take("converse")
+        self._wait(fixture.get("latency", 0))
+        return json.loads(json.dumps(fixture["response"], default=_encode_default), object_hook=_decode_hook)
+
+    def converse_stream(self, **params):
+        fixture = self._take("converse_stream")
+        latency = fixture.get("latency", 0)
+        self._wait(latency)
+        return {
+            **fixture["response"],
+            "stream": ReplayStream(fixture["events"], self.speed, latency / self.speed if self.speed > 0 else 0),
+        }
+
+    def get_async_invoke(self, **params):
+        # Connection pre-warm: nothing to open
+        return {}
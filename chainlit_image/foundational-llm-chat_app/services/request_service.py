@@ -0,0 +1,191 @@
+"""
+Service for building Bedrock Converse requests.
+"""
+
+from dataclasses import dataclass
+from typing import Dict, Any, List, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+INTERLEAVED_THINKING_BETA = "interleaved-thinking-2025-05-14"
+
+# Initial values of the chat settings
+DEFAULT_TEMPERATURE = 1.0
+DEFAULT_REASONING_BUDGET = 4096
+DEFAULT_REASONING_EFFORT = "medium"
+
+
+@dataclass(frozen=True, slots=True)
+class ModelCapabilities:
+    """Capabilities of a chat profile, compiled once from its ModelConfig."""
+
+    model_id: str
+    reasoning_enabled: bool
+    # OpenAI-style reasoning: effort levels, temperature/topP forced to 1,
+    # no signatures and reasoning kept in history only around tool calls
+    openai_reasoning: bool
+    # False for models reasoning at model level (e.g. DeepSeek R1)
+    sends_reasoning_params: bool
+    supports_signatures: bool
+    supports_streaming: bool
+    supports_interleaved_thinking: bool
+    max_tokens: int
+    context_window: Optional[int]
+
+    @classmethod
+    def from_model_config(cls, model_config) -> "ModelCapabilities":
+        """
+        Compile the capabilities of a model.
+
+        Args:
+            model_config: The ModelConfig of the chat profile.
+
+        Returns:
+            The compiled capabilities.
+        """
+        reasoning = model_config.reasoning
+        return cls(
+            model_id=model_config.id,
+            reasoning_enabled=reasoning.enabled,
+            openai_reasoning=reasoning.openai_reasoning_modalities,
+            sends_reasoning_params=not reasoning.no_reasoning_params,
+            supports_signatures=not reasoning.openai_reasoning_modalities,
+            supports_streaming=model_config.streaming,
+            supports_interleaved_thinking=model_config.is_claude,
+            max_tokens=model_config.max_tokens,
+            context_window=model_config.context_window,
+        )
+
+
+def compile_capabilities(bedrock_models: Dict[str, Any]) -> Dict[str, ModelCapabilities]:
+    """
+    Compile the capabilities of every chat profile.
+
+    Args:
+        bedrock_models: The ModelConfig of each profile, keyed by profile name.
+
+    Returns:
+        The capabilities of each profile, keyed by profile name.
+    """
+    return {
+        profile: ModelCapabilities.from_model_config(model_config)
+        for profile, model_config in bedrock_models.items()
+    }
+
+
+def default_max_tokens(capabilities: ModelCapabilities) -> int:
+    """Initial maximum tokens of a profile: half of its maximum, capped at 8192."""
+    return min(capabilities.max_tokens // 2, 8192)
+
+
+def default_settings(capabilities: ModelCapabilities, system_prompt: str) -> Dict[str, Any]:
+    """
+    Build the initial chat settings of a profile, as a new chat session starts with.
+
+    Args:
+        capabilities: The capabilities of the chat profile.
+        system_prompt: The system prompt text of the profile.
+
+    Returns:
+        The settings expected by build_request_template.
+    """
+    return {
+        "thinking_enabled": capabilities.reasoning_enabled,
+        "temperature": DEFAULT_TEMPERATURE,
+        "reasoning_effort": DEFAULT_REASONING_EFFORT,
+        "reasoning_budget": DEFAULT_REASONING_BUDGET,
+        "interleaved_thinking": False,
+        "max_tokens": default_max_tokens(capabilities),
+        "system_prompt": [{"text": system_prompt or ""}],
+    }
+
+
+def build_request_template(
+    capabilities: ModelCapabilities,
+    settings: Dict[str, Any],
+    tools: List[Dict[str, Any]],
+) -> Dict[str, Any]:
+    """
+    Build the session-level part of a Converse request.
+
+    The template only depends on the chat settings and on the available tools, so
+    it is built once and reused for every turn until one of them changes.
+
+    Args:
+        capabilities: The capabilities of the chat profile.
+        settings: The chat settings (thinking_enabled, temperature, reasoning_effort,
+            reasoning_budget, interleaved_thinking, max_tokens, system_prompt).
+        tools: The Bedrock tool specifications available to the model.
+
+    Returns:
+        The request fields shared by every call: inferenceConfig,
+        additionalModelRequestFields and, when relevant, system and toolConfig.
+    """
+    thinking_enabled = settings.get("thinking_enabled")
+    inference_config = {"maxTokens": int(settings["max_tokens"])}
+    additional_model_fields = {}
+
+    if not thinking_enabled:
+        inference_config["temperature"] = float(settings.get("temperature", 1.0))
+        logger.debug(f"Using temperature: {inference_config['temperature']}")
+    elif capabilities.openai_reasoning:
+        # For OpenAI reasoning models, set temperature and top_p to 1
+        inference_config["temperature"] = 1.0
+        inference_config["topP"] = 1.0
+
+    if thinking_enabled:
+        if not capabilities.sends_reasoning_params:
+            logger.debug("Model has reasoning always enabled - not sending any reasoning parameters")
+        elif capabilities.openai_reasoning:
+            additional_model_fields["reasoning_config"] = settings.get("reasoning_effort", "medium")
+        else:
+            additional_model_fields["thinking"] = {
+                "type": "enabled",
+                "budget_tokens": int(settings["reasoning_budget"]),
+            }
+            if (
+                settings.get("interleaved_thinking")
+                and capabilities.supports_interleaved_thinking
+                and tools
+            ):
+                additional_model_fields["anthropic_beta"] = [INTERLEAVED_THINKING_BETA]
+
+    template = {
+        "inferenceConfig": inference_config,
+        "additionalModelRequestFields": additional_model_fields,
+    }
+
+    # Only add system prompt if it's not empty
+    system_prompt = settings.get("system_prompt")
+    if system_prompt and system_prompt[0].get("text", "").strip():
+        template["system"] = system_prompt
+
+    if tools:
+        template["toolConfig"] = {"tools": tools}
+
+    return template
+
+
+def build_request(
+    template: Dict[str, Any],
+    model_id: str,
+    messages: List[Dict[str, Any]],
+    max_tokens: Optional[int] = None,
+) -> Dict[str, Any]:
+    """
+    Assemble the parameters of a Converse call from a request template.
+
+    Args:
+        template: The session request template.
+        model_id: The model ID to use.
+        messages: The conversation messages.
+        max_tokens: Overrides the template maxTokens when different.
+
+    Returns:
+        The Converse API parameters.
+    """
+    api_params = {"modelId": model_id, "messages": messages, **template}
+    if max_tokens is not None and max_tokens != template["inferenceConfig"]["maxTokens"]:
+        api_params["inferenceConfig"] = {**template["inferenceConfig"], "maxTokens": max_tokens}
+    return api_params
@@ -0,0 +1,147 @@
+"""
+Service for routing simple requests to a fast, inexpensive chat profile.
+"""
+
+import re
+import time
+import logging
+from dataclasses import dataclass
+from typing import Dict, Any, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Requests that are usually simple rewrites or lookups
+SIMPLE_PATTERNS = re.compile(
+    r"^\s*(?:please\s+)?(?:"
+    r"translate|fix (?:the |this |my )?(?:typo|typos|spelling|grammar)|correct|proofread|rephrase|reword|"
+    r"paraphrase|spell|capitalize|convert|define|what(?:'s| is) the (?:meaning|definition)|"
+    r"hi|hello|hey|thanks|thank you|ciao"
+    r")\b",
+    re.IGNORECASE,
+)
+
+# Markers of requests needing the capabilities of the chat profile
+COMPLEX_PATTERNS = re.compile(
+    r"```|\b(?:"
+    r"analy[sz]e|explain why|step by step|prove|reason|design|architecture|debug|implement|refactor|"
+    r"optimi[sz]e|plan|compare|evaluate|write (?:a |an )?(?:program|function|script|essay|report)"
+    r")\b",
+    re.IGNORECASE,
+)
+
+
+@dataclass(frozen=True, slots=True)
+class RouteDecision:
+    """Decision of the router for one message."""
+
+    profile: str
+    routed: bool
+    reason: str
+    # Time spent deciding, in milliseconds
+    overhead_ms: float
+
+
+class RequestRouter:
+    """
+    Routes simple messages to a fast profile using local heuristics.
+
+    Only messages positively recognized as simple are routed: anything
+    ambiguous stays on the chat profile.
+    """
+
+    def __init__(self, fast_profile: str, max_chars: int = 400, max_history_messages: int = 20):
+        """
+        Initialize the router.
+
+        Args:
+            fast_profile: The chat profile answering simple messages.
+            max_chars: Messages longer than this are never routed.
+            max_history_messages: Conversations longer than this are never routed.
+        """
+        self.fast_profile = fast_profile
+        self.max_chars = max_chars
+        self.max_history_messages = max_history_messages
+
+    def route(
+        self,
+        chat_profile: str,
+        text: Optional[str],
+        has_attachments: bool = False,
+        has_tools: bool = False,
+        history_length: int = 0,
+    ) -> RouteDecision:
+        """
+        Choose the profile answering a message.
+
+        Args:
+            chat_profile: The profile chosen by the user.
+            text: The message text.
+            has_attachments: Whether the message has images or documents.
+            has_tools: Whether tools are connected or were used in the conversation.
+            history_length: Number of messages in the conversation.
+
+        Returns:
+            The routing decision.
+        """
+        start = time.perf_counter()
+        reason = self._classify(chat_profile, text or "", has_attachments, has_tools, history_length)
+        routed = reason is None
+        return RouteDecision(
+            profile=self.fast_profile if routed else chat_profile,
+            routed=routed,
+            reason=reason or "simple request",
+            overhead_ms=(time.perf_counter() - start) * 1000,
+        )
+
+    def _classify(
+        self,
+        chat_profile: str,
+        text: str,
+        has_attachments: bool,
+        has_tools: bool,
+        history_length: int,
+    ) -> Optional[str]:
+        """Return why the message stays on the chat profile, or None to route it."""
+        if chat_profile == self.fast_profile:
+            return "already on the fast profile"
+        if has_attachments:
+            return "attachments"
+        if has_tools:
+            return "tools"
+        if history_length > self.max_history_messages:
+            return "long conversation"
+        if len(text) > self.max_chars:
+            return "long message"
+        if COMPLEX_PATTERNS.search(text):
+            return "complex request"
+        if not SIMPLE_PATTERNS.match(text):
+            return "not recognized as simple"
+        return None
+
+
+def strip_reasoning(messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Remove reasoning blocks from a conversation sent to another model.
+
+    Reasoning blocks (and their signatures) are only valid for the model that
+    produced them. Only the messages holding reasoning blocks are copied.
+
+    Args:
+        messages: The conversation messages.
+
+    Returns:
+        The messages without reasoning blocks.
+    """
+    stripped = []
+    for message in messages:
+        content = message.get("content", [])
+        if any("reasoningContent" in block or "redactedReasoningContent" in block for block in content):
+            message = {
+                **message,
+                "content": [
+                    block for block in content
+                    if "reasoningContent" not in block and "redactedReasoningContent" not in block
+                ],
+            }
+        stripped.append(message)
+    return stripped
@@ -0,0 +1,539 @@
+"""
+Service for keeping session state in an external store, so conversations survive
+task replacements and can be resumed on any task.
+"""
+
+import json
+import time
+import zlib
+import base64
+import random
+import asyncio
+import logging
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, field
+from typing import Dict, Any, List, Optional, Tuple
+
+from botocore.exceptions import ClientError
+
+from utils.conversation_history import ConversationHistory
+
+logger = logging.getLogger(__name__)
+
+# Records larger than this are compressed
+COMPRESSION_THRESHOLD = 1024
+# DynamoDB items are limited to 400 KB: larger message records are split into chunk items
+DYNAMODB_CHUNK_BYTES = 350 * 1024
+# First byte of a record: how the JSON payload is stored
+RAW_RECORD = b"j"
+COMPRESSED_RECORD = b"z"
+# BatchWriteItem limit
+DYNAMODB_BATCH_SIZE = 25
+
+
+class SessionStateError(Exception):
+    """A session state write the store rejects: retrying it cannot succeed."""
+
+
+def state_key(user_identifier: str, session_id: str) -> str:
+    """
+    Key of the state of a session: the session ID is supplied by the client,
+    so the state is only found again by the user who wrote it.
+
+    Args:
+        user_identifier: The authenticated user identifier.
+        session_id: The session ID.
+
+    Returns:
+        The key, used as the session ID of the store.
+    """
+    return f"{user_identifier}#{session_id}"
+
+
+def _encode_default(value: Any) -> Any:
+    if isinstance(value, (bytes, bytearray)):
+        return {"$b": base64.b64encode(value).decode("ascii")}
+    if isinstance(value, set):
+        return list(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not serializable")
+
+
+def _decode_hook(value: Dict[str, Any]) -> Any:
+    if len(value) == 1 and "$b" in value:
+        return base64.b64decode(value["$b"])
+    return value
+
+
+def encode_record(value: Any) -> bytes:
+    """
+    Serialize a message or field value compactly (bytes are kept, large records compressed).
+
+    Args:
+        value: The value to serialize.
+
+    Returns:
+        The record.
+    """
+    data = json.dumps(value, separators=(",", ":"), default=_encode_default).encode("utf-8")
+    if len(data) > COMPRESSION_THRESHOLD:
+        return COMPRESSED_RECORD + zlib.compress(data, 6)
+    return RAW_RECORD + data
+
+
+def decode_record(record: bytes) -> Any:
+    """
+    Deserialize a record written by encode_record.
+
+    Args:
+        record: The record.
+
+    Returns:
+        The value.
+    """
+    data = record[1:]
+    if record[:1] == COMPRESSED_RECORD:
+        data = zlib.decompress(data)
+    return json.loads(data, object_hook=_decode_hook)
+
+
+class SessionStore(ABC):
+    """
+    Base class of session state stores.
+
+    A session is a list of message records and a map of field records. A write
+    keeps the first `start` messages, replaces the rest with the given records
+    and updates the given fields, so a turn only writes what it added.
+    """
+
+    @abstractmethod
+    async def load(self, session_id: str) -> Optional[Tuple[List[bytes], Dict[str, bytes]]]:
+        """
+        Load a session.
+
+        Args:
+            session_id: The session ID.
+
+        Returns:
+            A tuple of (message records, field records), or None if unknown.
+        """
+
+    @abstractmethod
+    async def write(
+        self,
+        session_id: str,
+        start: int,
+        messages: List[bytes],
+        fields: Dict[str, bytes],
+    ) -> None:
+        """
+        Write the changes of a session.
+
+        Args:
+            session_id: The session ID.
+            start: Number of stored messages kept.
+            messages: Message records stored after them.
+            fields: Changed field records.
+        """
+
+    @abstractmethod
+    async def delete(self, session_id: str) -> None:
+        """
+        Delete a session.
+
+        Args:
+            session_id: The session ID.
+        """
+
+
+class InMemorySessionStore(SessionStore):
+    """Process-local store, for tests and single-task deployments."""
+
+    def __init__(self, ttl: Optional[float] = None):
+        """
+        Initialize the store.
+
+        Args:
+            ttl: Seconds after the last write when a session expires.
+        """
+        self.ttl = ttl
+        # Session ID -> (messages, fields, expiry)
+        self._sessions: Dict[str, Tuple[List[bytes], Dict[str, bytes], Optional[float]]] = {}
+
+    async def load(self, session_id: str) -> Optional[Tuple[List[bytes], Dict[str, bytes]]]:
+        entry = self._sessions.get(session_id)
+        if entry is None:
+            return None
+        messages, fields, expiry = entry
+        if expiry is not None and expiry < time.monotonic():
+            del self._sessions[session_id]
+            return None
+        return list(messages), dict(fields)
+
+    async def write(self, session_id: str, start: int, messages: List[bytes], fields: Dict[str, bytes]) -> None:
+        stored_messages, stored_fields, _ = self._sessions.get(session_id, ([], {}, None))
+        expiry = time.monotonic() + self.ttl if self.ttl else None
+        self._sessions[session_id] = (stored_messages[:start] + messages, {**stored_fields, **fields}, expiry)
+
+    async def delete(self, session_id: str) -> None:
+        self._sessions.pop(session_id, None)
+
+
+class RedisSessionStore(SessionStore):
+    """
+    Redis-compatible store: a list of message records and a hash of field records
+    per session, written in one pipeline per turn.
+    """
+
+    def __init__(self, redis_client, ttl: Optional[float] = None, prefix: str = "session:"):
+        """
+        Initialize the store.
+
+        Args:
+            redis_client: A `redis.asyncio` client (or a compatible one).
+            ttl: Seconds after the last write when a session expires.
+            prefix: Key prefix of the sessions.
+        """
+        self.redis = redis_client
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def _keys(self, session_id: str) -> Tuple[str, str]:
+        return f"{self.prefix}{session_id}:messages", f"{self.prefix}{session_id}:fields"
+
+    async def load(self, session_id: str) -> Optional[Tuple[List[bytes], Dict[str, bytes]]]:
+        messages_key, fields_key = self._keys(session_id)
+        pipeline = self.redis.pipeline(transaction=False)
+        pipeline.lrange(messages_key, 0, -1)
+        pipeline.hgetall(fields_key)
+        messages, fields = await pipeline.execute()
+        if not messages and not fields:
+            return None
+        return list(messages), {
+            (name.decode("utf-8") if isinstance(name, bytes) else name): value
+            for name, value in fields.items()
+        }
+
+    async def write(self, session_id: str, start: int, messages: List[bytes], fields: Dict[str, bytes]) -> None:
+        messages_key, fields_key = self._keys(session_id)
+        pipeline = self.redis.pipeline(transaction=True)
+        if start == 0:
+            pipeline.delete(messages_key)
+        else:
+            pipeline.ltrim(messages_key, 0, start - 1)
+        if messages:
+            pipeline.rpush(messages_key, *messages)
+        if fields:
+            pipeline.hset(fields_key, mapping=fields)
+        if self.ttl:
+            pipeline.expire(messages_key, int(self.ttl))
+            pipeline.expire(fields_key, int(self.ttl))
+        await pipeline.execute()
+
+    async def delete(self, session_id: str) -> None:
+        await self.redis.delete(*self._keys(session_id))
+
+
+class DynamoDBSessionStore(SessionStore):
+    """
+    DynamoDB-compatible store: one item per message and one item holding the
+    fields and the message count, under the session partition key.
+
+    Message records over the item size limit (e.g. with inline attachments) are
+    split into chunk items following the message item.
+    """
+
+    FIELDS_KEY = "fields"
+
+    def __init__(
+        self,
+        table_name: str,
+        dynamodb_client,
+        ttl: Optional[float] = None,
+        chunk_bytes: int = DYNAMODB_CHUNK_BYTES,
+        max_attempts: int = 5,
+    ):
+        """
+        Initialize the store.
+
+        Args:
+            table_name: The table name (partition key `PK`, sort key `SK`, TTL attribute `expires_at`).
+            dynamodb_client: A boto3 DynamoDB client.
+            ttl: Seconds after the last write when a session expires.
+            chunk_bytes: Maximum record bytes stored per item.
+            max_attempts: Attempts of each batch while DynamoDB leaves items unprocessed.
+        """
+        self.table_name = table_name
+        self.dynamodb = dynamodb_client
+        self.ttl = ttl
+        self.chunk_bytes = chunk_bytes
+        self.max_attempts = max_attempts
+
+    @staticmethod
+    def _message_key(index: int, chunk: int = 0) -> str:
+        return f"message#{index:08d}" if chunk == 0 else f"message#{index:08d}#{chunk:04d}"
+
+    def _query(self, session_id: str) -> List[Dict[str, Any]]:
+        items = []
+        params = {
+            "TableName": self.table_name,
+            "KeyConditionExpression": "PK = :pk",
+            "ExpressionAttributeValues": {":pk": {"S": session_id}},
+        }
+        while True:
+            response = self.dynamodb.query(**params)
+            items.extend(response.get("Items", []))
+            if "LastEvaluatedKey" not in response:
+                return items
+            params["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+
+    async def load(self, session_id: str) -> Optional[Tuple[List[bytes], Dict[str, bytes]]]:
+        items = await asyncio.to_thread(self._query, session_id)
+        if not items:
+            return None
+        fields_item = next((item for item in items if item["SK"]["S"] == self.FIELDS_KEY), {})
+        # Messages past the count, and chunks past the chunk count of their message,
+        # are left over by a rewrite and expire with the session
+        count = int(fields_item.get("count", {"N": "0"})["N"])
+        chunks: Dict[int, Dict[int, bytes]] = {}
+        chunk_counts: Dict[int, int] = {}
+        for item in items:
+            if not item["SK"]["S"].startswith("message#"):
+                continue
+            index, _, chunk = item["SK"]["S"][8:].partition("#")
+            index, chunk = int(index), int(chunk or 0)
+            if index < count:
+                chunks.setdefault(index, {})[chunk] = item["data"]["B"]
+                if chunk == 0:
+                    chunk_counts[index] = int(item.get("chunks", {"N": "1"})["N"])
+        messages = [
+            b"".join(chunks[index][chunk] for chunk in range(chunk_counts[index]))
+            for index in sorted(chunks)
+        ]
+        fields = {name[2:]: value["B"] for name, value in fields_item.items() if name.startswith("f_")}
+        return messages, fields
+
+    def _write(self, session_id: str, start: int, messages: List[bytes], fields: Dict[str, bytes]) -> None:
+        expires_at = {"N": str(int(time.time() + self.ttl))} if self.ttl else None
+        requests = []
+        for offset, record in enumerate(messages):
+            parts = [record[index:index + self.chunk_bytes] for index in range(0, len(record), self.chunk_bytes)]
+            for chunk, part in enumerate(parts or [b""]):
+                item = {
+                    "PK": {"S": session_id},
+                    "SK": {"S": self._message_key(start + offset, chunk)},
+                    "data": {"B": part},
+                }
+                if chunk == 0 and len(parts) > 1:
+                    item["chunks"] = {"N": str(len(parts))}
+                if expires_at:
+                    item["expires_at"] = expires_at
+                requests.append({"PutRequest": {"Item": item}})
+        self._batch_write(requests)
+
+        # The fields item is written last: the new messages become visible with the new count
+        names = {"#count": "count"}
+        values = {":count": {"N": str(start + len(messages))}}
+        assignments = ["#count = :count"]
+        for index, (name, record) in enumerate(fields.items()):
+            names[f"#f{index}"] = f"f_{name}"
+            values[f":f{index}"] = {"B": record}
+            assignments.append(f"#f{index} = :f{index}")
+        if expires_at:
+            names["#expires_at"] = "expires_at"
+            values[":expires_at"] = expires_at
+            assignments.append("#expires_at = :expires_at")
+        self._call(
+            self.dynamodb.update_item,
+            TableName=self.table_name,
+            Key={"PK": {"S": session_id}, "SK": {"S": self.FIELDS_KEY}},
+            UpdateExpression="SET " + ", ".join(assignments),
+            ExpressionAttributeNames=names,
+            ExpressionAttributeValues=values,
+        )
+
+    def _batch_write(self, requests: List[Dict[str, Any]]) -> None:
+        """
+        Send write requests with BatchWriteItem, retrying unprocessed items.
+
+        Raises:
+            RuntimeError: If items are still unprocessed after max_attempts (e.g. sustained throttling).
+        """
+        for batch_start in range(0, len(requests), DYNAMODB_BATCH_SIZE):
+            pending = {self.table_name: requests[batch_start:batch_start + DYNAMODB_BATCH_SIZE]}
+            for attempt in range(1, self.max_attempts + 1):
+                response = self._call(self.dynamodb.batch_write_item, RequestItems=pending)
+                unprocessed = response.get("UnprocessedItems") or {}
+                if not unprocessed.get(self.table_name):
+                    break
+                pending = unprocessed
+                if attempt < self.max_attempts:
+                    time.sleep(self._backoff(attempt))
+            else:
+                raise RuntimeError(
+                    f"{len(pending[self.table_name])} session state items unprocessed after {self.max_attempts} attempts"
+                )
+
+    @staticmethod
+    def _backoff(attempt: int) -> float:
+        """Exponential backoff with full jitter, capped at 5 seconds."""
+        return random.uniform(0, min(5.0, 0.05 * (2 ** attempt)))
+
+    @staticmethod
+    def _call(operation, **kwargs) -> Dict[str, Any]:
+        try:
+            return operation(**kwargs)
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") == "ValidationException":
+                # E.g. the fields over the item size limit: the same write would fail again
+                raise SessionStateError(str(e)) from e
+            raise
+
+    async def write(self, session_id: str, start: int, messages: List[bytes], fields: Dict[str, bytes]) -> None:
+        await asyncio.to_thread(self._write, session_id, start, messages, fields)
+
+    def _delete(self, session_id: str) -> None:
+        self._batch_write([
+            {"DeleteRequest": {"Key": {"PK": item["PK"], "SK": item["SK"]}}}
+            for item in self._query(session_id)
+        ])
+
+    async def delete(self, session_id: str) -> None:
+        await asyncio.to_thread(self._delete, session_id)
+
+
+@dataclass(slots=True)
+class SessionStateMarker:
+    """What was last written for a session, to write only the changes of the next turn."""
+
+    # Number of messages written, and the last of them: the next write is a
+    # delta only if it is still in place (not after a compaction or a rollback)
+    length: int = 0
+    boundary: Optional[Dict[str, Any]] = None
+    fields: Dict[str, bytes] = field(default_factory=dict)
+
+
+class SessionStateManager:
+    """Writes session state deltas to a store and hydrates sessions from it."""
+
+    def __init__(self, store: SessionStore):
+        """
+        Initialize the manager.
+
+        Args:
+            store: The session store.
+        """
+        self.store = store
+
+    async def save(
+        self,
+        session_id: str,
+        history: ConversationHistory,
+        fields: Dict[str, Any],
+        marker: Optional[SessionStateMarker] = None,
+    ) -> SessionStateMarker:
+        """
+        Write the changes of a session since the last write.
+
+        Args:
+            session_id: The session ID.
+            history: The conversation history.
+            fields: The session fields (JSON-serializable values).
+            marker: The marker returned by the last write.
+
+        Returns:
+            The marker of this write.
+
+        Raises:
+            SessionStateError: If the store rejects the write (retrying cannot succeed).
+        """
+        marker = marker or SessionStateMarker()
+        messages = history.messages()
+        start = marker.length
+        if start > len(messages) or (start and messages[start - 1] is not marker.boundary):
+            # The history was rewritten: write it again
+            start = 0
+        records = [encode_record(message) for message in messages[start:]]
+        encoded_fields = {name: encode_record(value) for name, value in fields.items()}
+        changed_fields = {
+            name: record for name, record in encoded_fields.items()
+            if marker.fields.get(name) != record
+        }
+        if records or changed_fields or start != marker.length:
+            await self.store.write(session_id, start, records, changed_fields)
+        return SessionStateMarker(
+            length=len(messages),
+            boundary=messages[-1] if messages else None,
+            fields=encoded_fields,
+        )
+
+    async def load(self, session_id: str) -> Optional[Tuple[ConversationHistory, Dict[str, Any], SessionStateMarker]]:
+        """
+        Load a session.
+
+        Args:
+            session_id: The session ID.
+
+        Returns:
+            A tuple of (history, fields, marker), or None if the session is unknown.
+        """
+        stored = await self.store.load(session_id)
+        if stored is None:
+            return None
+        records, field_records = stored
+        messages = [decode_record(record) for record in records]
+        fields = {name: decode_record(record) for name, record in field_records.items()}
+        marker = SessionStateMarker(
+            length=len(messages),
+            boundary=messages[-1] if messages else None,
+            fields=dict(field_records),
+        )
+        return ConversationHistory(messages), fields, marker
+
+    async def delete(self, session_id: str) -> None:
+        """
+        Delete a session.
+
+        Args:
+            session_id: The session ID.
+        """
+        await self.store.delete(session_id)
+
+
+def create_session_state_manager(
+    session_state_config: Dict[str, Any],
+    region_name: str,
+) -> Optional[SessionStateManager]:
+    """
+    Create the session state manager from the session state configuration.
+
+    Args:
+        session_state_config: Output of AppConfig.load_session_state_config().
+        region_name: The AWS region of the DynamoDB table.
+
+    Returns:
+        The manager, or None if session state is kept in memory only.
+    """
+    backend = session_state_config["backend"]
+    ttl = session_state_config["ttl"]
+    if backend == "memory":
+        store = InMemorySessionStore(ttl=ttl)
+    elif backend == "redis":
+        # Imported only when the Redis backend is configured
+        import redis.asyncio as redis
+
+        store = RedisSessionStore(redis.from_url(session_state_config["redis_url"]), ttl=ttl)
+    elif backend == "dynamodb":
+        import boto3
+
+        store = DynamoDBSessionStore(
+            session_state_config["dynamodb_table"],
+            boto3.client(
+                "dynamodb",
+                region_name=region_name,
+                endpoint_url=session_state_config.get("dynamodb_endpoint_url"),
+            ),
+            ttl=ttl,
+        )
+    else:
+        return None
+    return SessionStateManager(store)
@@ -0,0 +1,136 @@
+"""
+Service for detecting blocking calls that stall the event loop.
+"""
+
+import os
+import sys
+import time
+import random
+import asyncio
+import logging
+import threading
+import traceback
+from typing import List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Frames under this directory (and not in installed packages) are application code
+APP_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def is_app_frame(filename: str) -> bool:
+    """Check if a frame belongs to the application rather than a library."""
+    return filename.startswith(APP_ROOT) and "site-packages" not in filename and ".venv" not in filename
+
+
+def stall_location(stack: List[traceback.FrameSummary]) -> str:
+    """
+    Attribute a stall to a code location.
+
+    Args:
+        stack: The stack of the loop thread, outermost frame first.
+
+    Returns:
+        "file:line (function)" of the innermost application frame (or of the
+        innermost frame if no application code is on the stack).
+    """
+    if not stack:
+        return "unknown"
+    frame = next((frame for frame in reversed(stack) if is_app_frame(frame.filename)), stack[-1])
+    return f"{os.path.relpath(frame.filename, APP_ROOT)}:{frame.lineno} ({frame.name})"
+
+
+class StallDetector:
+    """
+    Detects event loop stalls and the code causing them.
+
+    A heartbeat coroutine ticks on the loop; a watchdog thread notices when the
+    ticks stop. When the loop is blocked past the threshold, the watchdog
+    captures the stack of the loop thread (the blocking code is still running)
+    for a sample of the stalls. The stall is reported by the loop once it is
+    free again: a metric for every stall, a log with the stack for sampled ones.
+    """
+
+    def __init__(
+        self,
+        threshold_ms: float = 200,
+        sample_rate: float = 0.1,
+        interval: float = 0.05,
+        metrics_service=None,
+    ):
+        """
+        Initialize the detector.
+
+        Args:
+            threshold_ms: Blocking time from which the loop is considered stalled.
+            sample_rate: Fraction of the stalls whose stack is captured and logged.
+            interval: Seconds between two heartbeats.
+            metrics_service: Optional MetricsService receiving the stalls.
+        """
+        self.threshold = threshold_ms / 1000
+        self.sample_rate = sample_rate
+        self.interval = interval
+        self.metrics_service = metrics_service
+        self.stalls = 0
+        self._beat = time.monotonic()
+        self._loop_thread_id: Optional[int] = None
+        # Heartbeat preceding the stall and stack captured by the watchdog
+        self._capture: Optional[Tuple[float, List[traceback.FrameSummary]]] = None
+        self._heartbeat: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+
+    def ensure_started(self) -> None:
+        """Start the heartbeat and the watchdog on first use (requires a running loop)."""
+        if self._heartbeat is None or self._heartbeat.done():
+            self._loop_thread_id = threading.get_ident()
+            self._beat = time.monotonic()
+            self._heartbeat = asyncio.get_running_loop().create_task(self._run_heartbeat())
+        if self._watchdog is None:
+            self._watchdog = threading.Thread(target=self._run_watchdog, name="stall-watchdog", daemon=True)
+            self._watchdog.start()
+
+    async def _run_heartbeat(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            previous = self._beat
+            blocked = now - previous - self.interval
+            self._beat = now
+            if blocked >= self.threshold:
+                capture, self._capture = self._capture, None
+                # A capture of an earlier stall is ignored
+                self._report(blocked, capture[1] if capture and capture[0] == previous else None)
+
+    def _run_watchdog(self) -> None:
+        captured_beat = None
+        while True:
+            time.sleep(self.interval)
+            beat = self._beat
+            if beat == captured_beat or time.monotonic() - beat - self.interval < self.threshold:
+                continue
+            # Stalled: decide once per stall whether its stack is captured
+            captured_beat = beat
+            if random.random() >= self.sample_rate:
+                continue
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is not None:
+                self._capture = (beat, traceback.extract_stack(frame))
+
+    def _report(self, blocked: float, stack: Optional[List[traceback.FrameSummary]]) -> None:
+        """Publish a stall, with its location and stack if it was sampled."""
+        self.stalls += 1
+        blocked_ms = blocked * 1000
+        location = stall_location(stack) if stack else None
+        if stack:
+            logger.warning(
+                f"Event loop blocked for {blocked_ms:.0f} ms at {location}\n"
+                + "".join(traceback.format_list(stack))
+            )
+        else:
+            logger.debug(f"Event loop blocked for {blocked_ms:.0f} ms")
+        if self.metrics_service:
+            self.metrics_service.put_metrics(
+                {"EventLoopStall": 1, "EventLoopStallDuration": blocked_ms},
+                units={"EventLoopStall": "Count", "EventLoopStallDuration": "Milliseconds"},
+                properties={"Location": location} if location else None,
+            )
@@ -3,6 +3,9 @@ Service for handling thinking content.
 """
 from typing import Dict, Any, List, Optional
 import logging
+import time
+
+from utils.log_utils import log_event
 
 logger = logging.getLogger(__name__)
 
@@ -13,10 +16,25 @@ class ThinkingService:
         """
         Initialize the thinking service.
         """
-        self.thinking_text = ""
+        # Reasoning deltas are kept as chunks and joined only when needed:
+        # concatenating each delta would be quadratic over long reasoning budgets
+        self._chunks: List[str] = []
+        self._length = 0
         self.signature = None
         self.redacted_data = []
         
+    @property
+    def thinking_text(self) -> str:
+        """The thinking text received so far."""
+        if len(self._chunks) > 1:
+            self._chunks = ["".join(self._chunks)]
+        return self._chunks[0] if self._chunks else ""
+        
+    @property
+    def thinking_length(self) -> int:
+        """Length of the thinking text, without joining it."""
+        return self._length
+        
     def add_thinking(self, text: str) -> None:
         """
         Add thinking text.
@@ -24,7 +42,9 @@ class ThinkingService:
         Args:
             text: The thinking text to add.
         """
-        self.thinking_text += text
+        if text:
+            self._chunks.append(text)
+            self._length += len(text)
         
     def set_signature(self, signature: str) -> None:
         """
@@ -51,7 +71,7 @@ class ThinkingService:
         Returns:
             True if there is thinking content, False otherwise.
         """
-        return bool(self.thinking_text)
+        return self._length > 0
         
     def get_api_blocks(self, include_signature: bool = True) -> List[Dict[str, Any]]:
         """
@@ -66,7 +86,7 @@ class ThinkingService:
         blocks = []
         
         # Add thinking block if there is thinking content
-        if self.thinking_text:
+        if self._length:
             reasoning_text = {
                 "text": self.thinking_text
             }
@@ -74,7 +94,7 @@ class ThinkingService:
             # Only include signature if supported by the model and we have one
             if include_signature and self.signature:
                 reasoning_text["signature"] = self.signature
-                logger.debug(f"Including signature in reasoning content: {self.signature[:20] if len(self.signature) > 20 else self.signature}...")
+                log_event(logger, logging.DEBUG, "thinking.signature", length=len(self.signature))
             elif not include_signature and self.signature:
                 logger.debug("Signature present but excluded (model doesn't support signatures)")
             
@@ -94,4 +114,48 @@ class ThinkingService:
                 }
             })
             
-        return blocks
\ No newline at end of file
+        return blocks
+
+
+class ThrottledStreamWriter:
+    """
+    Streams tokens to a Chainlit message or step at a bounded update rate.
+
+    Each stream_token call is a websocket event and a UI re-render: tokens are
+    buffered and sent at most once per interval.
+    """
+    
+    def __init__(self, target, interval: float = 0.1):
+        """
+        Initialize the writer.
+        
+        Args:
+            target: The message or step to stream to (anything with an async stream_token).
+            interval: Minimum time between two updates, in seconds (0 to send every token).
+        """
+        self.target = target
+        self.interval = interval
+        self.updates = 0
+        self._pending: List[str] = []
+        self._last_update = 0.0
+        
+    async def write(self, text: str) -> None:
+        """
+        Buffer text, sending the buffer if the interval has elapsed.
+        
+        Args:
+            text: The text to stream.
+        """
+        self._pending.append(text)
+        if time.monotonic() - self._last_update >= self.interval:
+            await self.flush()
+            
+    async def flush(self) -> None:
+        """Send the buffered text."""
+        if not self._pending:
+            return
+        text = "".join(self._pending)
+        self._pending = []
+        self._last_update = time.monotonic()
+        self.updates += 1
+        await self.target.stream_token(text)
@@ -0,0 +1,304 @@
+"""
+Service for estimating token counts locally, before a request is sent.
+"""
+
+import io
+import json
+import logging
+from typing import Callable, Dict, Any, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Average characters per token of each model family (approximations)
+CHARS_PER_TOKEN = {
+    "anthropic": 3.5,
+    "amazon": 4.0,
+    "meta": 4.0,
+    "mistral": 3.7,
+    "openai": 4.0,
+    "deepseek": 3.6,
+    "qwen": 3.6,
+    "writer": 4.0,
+}
+DEFAULT_CHARS_PER_TOKEN = 4.0
+
+# Image tokens are roughly proportional to the pixel count, after the model
+# downsizes the image to its maximum resolution
+IMAGE_PIXELS_PER_TOKEN = 750
+IMAGE_MAX_TOKENS = 1600
+IMAGE_DEFAULT_TOKENS = IMAGE_MAX_TOKENS
+
+# Binary documents are converted to text by Bedrock: estimate from their size
+BINARY_DOC_BYTES_PER_TOKEN = {"pdf": 6.0, "docx": 10.0, "doc": 10.0, "xlsx": 8.0, "xls": 8.0}
+
+# Fixed overhead of each message (role, block separators)
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+def get_model_family(model_id: str) -> str:
+    """
+    Get the family of a model from its ID.
+
+    Args:
+        model_id: The Bedrock model ID or inference profile ID.
+
+    Returns:
+        The family name (e.g. "anthropic"), or "" if unknown.
+    """
+    model_id = model_id.lower()
+    for family in CHARS_PER_TOKEN:
+        if family in model_id:
+            return family
+    return ""
+
+
+class TokenEstimator:
+    """
+    Local token estimator for Converse requests.
+
+    Estimates are approximations: they are meant for pre-flight checks and cost
+    predictions, and are compared with the actual usage reported by Bedrock to
+    produce a calibration report.
+    """
+
+    def __init__(self, report_every: int = 100, reference_size: Optional[Callable[[str], Optional[int]]] = None):
+        """
+        Initialize the estimator.
+
+        Args:
+            report_every: Log the calibration report every N samples (0 to disable).
+            reference_size: Returns the size of an attachment sent by S3 URI, if known.
+        """
+        self.report_every = report_every
+        self.reference_size = reference_size
+        # Calibration samples per family: [count, sum of estimates, sum of actuals, sum of abs errors]
+        self._calibration: Dict[str, List[float]] = {}
+        self._samples = 0
+
+    def estimate_text(self, text: str, family: str) -> int:
+        """
+        Estimate the tokens of a text.
+
+        Args:
+            text: The text.
+            family: The model family.
+
+        Returns:
+            The estimated token count.
+        """
+        if not text:
+            return 0
+        return int(len(text) / CHARS_PER_TOKEN.get(family, DEFAULT_CHARS_PER_TOKEN)) + 1
+
+    def estimate_image(self, data: bytes) -> int:
+        """
+        Estimate the tokens of an image from its dimensions.
+
+        Args:
+            data: The image bytes.
+
+        Returns:
+            The estimated token count.
+        """
+        try:
+            from PIL import Image
+
+            # Opening an image only parses its header
+            with Image.open(io.BytesIO(data)) as img:
+                width, height = img.size
+            return max(1, min(IMAGE_MAX_TOKENS, (width * height) // IMAGE_PIXELS_PER_TOKEN))
+        except Exception as e:
+            logger.debug(f"Could not read image dimensions: {e}")
+            return IMAGE_DEFAULT_TOKENS
+
+    def estimate_document(self, data: bytes, doc_format: str, family: str) -> int:
+        """
+        Estimate the tokens of a document.
+
+        Args:
+            data: The document bytes.
+            doc_format: The Bedrock document format (pdf, txt, csv, ...).
+            family: The model family.
+
+        Returns:
+            The estimated token count.
+        """
+        return self.estimate_document_size(len(data), doc_format, family)
+
+    def estimate_document_size(self, size: int, doc_format: str, family: str) -> int:
+        """
+        Estimate the tokens of a document from its size.
+
+        Args:
+            size: The document size in bytes.
+            doc_format: The Bedrock document format (pdf, txt, csv, ...).
+            family: The model family.
+
+        Returns:
+            The estimated token count.
+        """
+        bytes_per_token = BINARY_DOC_BYTES_PER_TOKEN.get(doc_format)
+        if bytes_per_token:
+            return int(size / bytes_per_token) + 1
+        # Text formats: bytes are close enough to characters
+        return int(size / CHARS_PER_TOKEN.get(family, DEFAULT_CHARS_PER_TOKEN)) + 1
+
+    def estimate_block(self, block: Dict[str, Any], family: str) -> int:
+        """
+        Estimate the tokens of a content block.
+
+        Args:
+            block: A Converse content block.
+            family: The model family.
+
+        Returns:
+            The estimated token count.
+        """
+        if "text" in block:
+            return self.estimate_text(block["text"], family)
+        if "image" in block:
+            data = block["image"].get("source", {}).get("bytes")
+            return self.estimate_image(data) if data else IMAGE_DEFAULT_TOKENS
+        if "document" in block:
+            document = block["document"]
+            source = document.get("source", {})
+            if "s3Location" in source:
+                # Sent by reference: estimate from the size of the uploaded attachment
+                size = self.reference_size(source["s3Location"]["uri"]) if self.reference_size else None
+                if size is None:
+                    logger.debug(f"Unknown size of {source['s3Location']['uri']}")
+                    size = 0
+                return self.estimate_document_size(size, document.get("format", "txt"), family)
+            return self.estimate_document(source.get("bytes") or b"", document.get("format", "txt"), family)
+        if "reasoningContent" in block:
+            reasoning_text = block["reasoningContent"].get("reasoningText", {})
+            return self.estimate_text(reasoning_text.get("text", ""), family)
+        if "toolUse" in block:
+            tool_use = block["toolUse"]
+            return self.estimate_text(tool_use.get("name", "") + json.dumps(tool_use.get("input", {})), family)
+        if "toolResult" in block:
+            return sum(self.estimate_block(item, family) for item in block["toolResult"].get("content", []))
+        return 0
+
+    def estimate_message(
+        self,
+        message: Dict[str, Any],
+        family: str,
+        cache: Optional[Dict[int, Tuple[Dict[str, Any], int]]] = None,
+    ) -> int:
+        """
+        Estimate the tokens of a message, caching the result per history entry.
+
+        Args:
+            message: A Converse message.
+            family: The model family.
+            cache: Per-session cache keyed by message identity.
+
+        Returns:
+            The estimated token count.
+        """
+        if cache is not None:
+            cached = cache.get(id(message))
+            # Keep the message in the cache entry so its id cannot be reused
+            if cached is not None and cached[0] is message:
+                return cached[1]
+
+        tokens = MESSAGE_OVERHEAD_TOKENS + sum(
+            self.estimate_block(block, family) for block in message.get("content", [])
+        )
+        if cache is not None:
+            cache[id(message)] = (message, tokens)
+        return tokens
+
+    def estimate_request(
+        self,
+        api_params: Dict[str, Any],
+        cache: Optional[Dict[int, Tuple[Dict[str, Any], int]]] = None,
+    ) -> Tuple[int, List[int]]:
+        """
+        Estimate the input tokens of a Converse request.
+
+        Args:
+            api_params: The Converse API parameters.
+            cache: Per-session message estimate cache.
+
+        Returns:
+            A tuple of (total input tokens, estimate of each message).
+        """
+        family = get_model_family(api_params["modelId"])
+        message_tokens = [
+            self.estimate_message(message, family, cache) for message in api_params["messages"]
+        ]
+        total = sum(message_tokens)
+        for system_block in api_params.get("system", []):
+            total += self.estimate_text(system_block.get("text", ""), family)
+        if "toolConfig" in api_params:
+            total += self.estimate_text(json.dumps(api_params["toolConfig"]), family)
+        return total, message_tokens
+
+    @staticmethod
+    def find_trim_index(
+        messages: List[Dict[str, Any]],
+        message_tokens: List[int],
+        budget: int,
+    ) -> int:
+        """
+        Find the oldest message from which the conversation fits a token budget.
+
+        The kept conversation always starts with a user message that is not a
+        tool result, so tool use/result pairs are never split.
+
+        Args:
+            messages: The conversation messages.
+            message_tokens: The estimate of each message.
+            budget: The token budget for the messages.
+
+        Returns:
+            The index of the first message to keep (len(messages) if nothing fits).
+        """
+        total = sum(message_tokens)
+        for index, message in enumerate(messages):
+            if total <= budget and message["role"] == "user" and not any(
+                "toolResult" in block for block in message.get("content", [])
+            ):
+                return index
+            total -= message_tokens[index]
+        return len(messages)
+
+    def calibrate(self, model_id: str, estimated: int, actual: int) -> None:
+        """
+        Record an estimate and the actual input tokens reported by Bedrock.
+
+        Args:
+            model_id: The model ID.
+            estimated: The estimated input tokens.
+            actual: The input tokens reported in the response usage.
+        """
+        if not estimated or not actual:
+            return
+        family = get_model_family(model_id) or "other"
+        stats = self._calibration.setdefault(family, [0, 0.0, 0.0, 0.0])
+        stats[0] += 1
+        stats[1] += estimated
+        stats[2] += actual
+        stats[3] += abs(estimated - actual) / actual
+        self._samples += 1
+        if self.report_every and self._samples % self.report_every == 0:
+            logger.info(f"Token estimator calibration: {json.dumps(self.calibration_report())}")
+
+    def calibration_report(self) -> Dict[str, Dict[str, float]]:
+        """
+        Compare the estimates with the actual usage.
+
+        Returns:
+            For each model family: the sample count, the ratio of actual to
+            estimated tokens, and the mean absolute percentage error.
+        """
+        return {
+            family: {
+                "samples": int(count),
+                "actual_to_estimate_ratio": round(actual / estimated, 3) if estimated else 0.0,
+                "mean_abs_pct_error": round(100 * abs_errors / count, 1),
+            }
+            for family, (count, estimated, actual, abs_errors) in self._calibration.items()
+        }
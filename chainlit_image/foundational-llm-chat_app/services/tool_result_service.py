@@ -0,0 +1,301 @@
+"""
+Service for turning MCP tool results into size-bounded Converse tool result content.
+"""
+
+import io
+import re
+import base64
+import logging
+import json
+from dataclasses import dataclass
+from typing import Dict, Any, List, Optional, Tuple
+
+from utils.attachment_descriptor import FORMATS, MIME_TYPES, TEXT_FORMATS, sniff_format
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_TEXT_CHARS = 20000
+# Bedrock limits of image and document content blocks
+MAX_IMAGE_BYTES = 3_750_000
+MAX_DOCUMENT_BYTES = 4_500_000
+# Longest side of the images downscaled to fit the size limit
+MAX_IMAGE_DIMENSION = 1568
+# Share of the kept text taken from the start of an oversized result (the rest from its end)
+HEAD_SHARE = 0.8
+
+# Characters allowed in the name of a document block
+DOCUMENT_NAME_UNSAFE = re.compile(r"[^A-Za-z0-9 \-()\[\]]+")
+
+
+def truncate_text(text: str, max_chars: int) -> Tuple[str, bool]:
+    """
+    Bound a text, keeping its start and its end around a truncation marker.
+
+    Args:
+        text: The text.
+        max_chars: Maximum characters kept.
+
+    Returns:
+        A tuple of (bounded text, whether it was truncated).
+    """
+    if len(text) <= max_chars:
+        return text, False
+    head = int(max_chars * HEAD_SHARE)
+    tail = max_chars - head
+    marker = (
+        f"\n\n[... {len(text) - max_chars} of {len(text)} characters truncated. "
+        "Ask the tool for a narrower result if the missing part is needed ...]\n\n"
+    )
+    return text[:head] + marker + (text[-tail:] if tail else ""), True
+
+
+def format_size(size: int) -> str:
+    """Human readable size of a binary content."""
+    return f"{size / (1024 * 1024):.1f} MB" if size >= 1024 * 1024 else f"{size / 1024:.0f} KB"
+
+
+def downscale_image(data: bytes, image_format: str, max_bytes: int) -> Optional[bytes]:
+    """
+    Downscale an image until it fits a size limit.
+
+    Args:
+        data: The image bytes.
+        image_format: The Bedrock image format.
+        max_bytes: The size limit.
+
+    Returns:
+        The downscaled image in the same format, or None if it cannot fit.
+    """
+    try:
+        from PIL import Image
+    except ImportError:
+        return None
+    try:
+        with Image.open(io.BytesIO(data)) as img:
+            dimension = min(MAX_IMAGE_DIMENSION, max(img.size))
+            while dimension >= 256:
+                resized = img.copy()
+                resized.thumbnail((dimension, dimension))
+                if image_format == "jpeg" and resized.mode not in ("RGB", "L"):
+                    resized = resized.convert("RGB")
+                output = io.BytesIO()
+                resized.save(output, format=image_format.upper())
+                if output.tell() <= max_bytes:
+                    return output.getvalue()
+                dimension //= 2
+    except Exception as e:
+        logger.warning(f"Error downscaling tool result image: {e}")
+    return None
+
+
+@dataclass(slots=True)
+class ToolResult:
+    """A tool result ready for the conversation history."""
+
+    # Content blocks of the Converse toolResult
+    content: List[Dict[str, Any]]
+    # Text shown in the tool step
+    display: str
+    # Bytes returned by the tool and bytes sent to the model
+    original_size: int = 0
+    sent_size: int = 0
+    truncated: bool = False
+
+
+class ToolResultFormatter:
+    """
+    Converts MCP tool results to Converse tool result content.
+
+    Text is bounded per tool (start and end kept around a truncation marker);
+    images and documents become native content blocks when the model accepts
+    them, downscaled or replaced by a marker when too large. Result sizes are
+    published as metrics.
+    """
+
+    def __init__(
+        self,
+        max_text_chars: int = DEFAULT_MAX_TEXT_CHARS,
+        tool_limits: Optional[Dict[str, int]] = None,
+        max_image_bytes: int = MAX_IMAGE_BYTES,
+        max_document_bytes: int = MAX_DOCUMENT_BYTES,
+        metrics_service=None,
+    ):
+        """
+        Initialize the formatter.
+
+        Args:
+            max_text_chars: Maximum characters of text of a tool result.
+            tool_limits: Maximum characters of text of specific tools, keyed by tool name.
+            max_image_bytes: Maximum size of an image block.
+            max_document_bytes: Maximum size of a document block.
+            metrics_service: Optional MetricsService receiving the result sizes.
+        """
+        self.max_text_chars = max_text_chars
+        self.tool_limits = tool_limits or {}
+        self.max_image_bytes = max_image_bytes
+        self.max_document_bytes = max_document_bytes
+        self.metrics_service = metrics_service
+
+    def limit_for(self, tool_name: str) -> int:
+        """Maximum characters of text of a tool result."""
+        return self.tool_limits.get(tool_name, self.max_text_chars)
+
+    def format(self, tool_name: str, result: Any, vision: bool = False, documents: bool = False) -> ToolResult:
+        """
+        Convert the result of an MCP tool call.
+
+        Args:
+            tool_name: The tool name.
+            result: The MCP CallToolResult.
+            vision: Whether the model accepts image blocks.
+            documents: Whether the model accepts document blocks.
+
+        Returns:
+            The tool result.
+        """
+        texts: List[str] = []
+        # Markers of the binary content left out, kept out of the text budget
+        notes: List[str] = []
+        blocks: List[Dict[str, Any]] = []
+        formatted = ToolResult(content=[], display="")
+
+        for part in getattr(result, "content", None) or []:
+            part_type = getattr(part, "type", None)
+            if part_type == "text" or (part_type is None and hasattr(part, "text")):
+                formatted.original_size += len(part.text.encode("utf-8"))
+                texts.append(part.text)
+            elif part_type in ("image", "audio"):
+                data = self._decode(part.data)
+                formatted.original_size += len(data)
+                self._add_binary(data, part.mimeType, None, vision, documents, formatted, texts, notes, blocks)
+            elif part_type == "resource":
+                resource = part.resource
+                if getattr(resource, "text", None) is not None:
+                    formatted.original_size += len(resource.text.encode("utf-8"))
+                    texts.append(f"Resource {resource.uri}:\n{resource.text}")
+                else:
+                    data = self._decode(resource.blob)
+                    formatted.original_size += len(data)
+                    self._add_binary(
+                        data, resource.mimeType, str(resource.uri), vision, documents, formatted, texts, notes, blocks
+                    )
+            elif part_type == "resource_link":
+                texts.append(f"Resource link: {part.uri}")
+            else:
+                text = str(part)
+                formatted.original_size += len(text.encode("utf-8"))
+                texts.append(text)
+
+        if not getattr(result, "content", None) and getattr(result, "structuredContent", None) is not None:
+            texts.append(json.dumps(result.structuredContent, ensure_ascii=False))
+            formatted.original_size += len(texts[-1].encode("utf-8"))
+        if getattr(result, "isError", False):
+            texts.insert(0, "The tool reported an error:")
+
+        text, truncated = truncate_text("\n".join(texts), self.limit_for(tool_name))
+        text = "\n".join(([text] if text else []) + notes)
+        formatted.truncated = formatted.truncated or truncated
+        if not text and not blocks:
+            text = "(empty result)"
+        if text:
+            formatted.content.append({"text": text})
+        formatted.content.extend(blocks)
+        formatted.sent_size = len(text.encode("utf-8")) + sum(self._block_size(block) for block in blocks)
+        formatted.display = "\n".join(
+            ([text] if text else []) + [
+                f"[{kind} ({format_size(self._block_size(block))}) sent to the model]"
+                for block in blocks for kind in block
+            ]
+        )
+        self._publish(tool_name, formatted)
+        return formatted
+
+    def error(self, tool_name: str, message: str) -> ToolResult:
+        """
+        Build the result of a failed tool call.
+
+        Args:
+            tool_name: The tool name.
+            message: The error message.
+
+        Returns:
+            The tool result.
+        """
+        text, truncated = truncate_text(message, self.limit_for(tool_name))
+        return ToolResult(content=[{"text": text}], display=text, truncated=truncated)
+
+    @staticmethod
+    def _decode(data: Any) -> bytes:
+        """Binary MCP content is base64 encoded."""
+        if isinstance(data, (bytes, bytearray)):
+            return bytes(data)
+        try:
+            return base64.b64decode(data, validate=True)
+        except (ValueError, TypeError):
+            return str(data).encode("utf-8")
+
+    def _add_binary(
+        self,
+        data: bytes,
+        mime: Optional[str],
+        uri: Optional[str],
+        vision: bool,
+        documents: bool,
+        formatted: ToolResult,
+        texts: List[str],
+        notes: List[str],
+        blocks: List[Dict[str, Any]],
+    ) -> None:
+        """Add binary content as an image or document block, as text, or as a marker of why it was left out."""
+        doc_format = sniff_format(data[:16], MIME_TYPES.get(mime or ""))
+        if doc_format is None and MIME_TYPES.get(mime or "") in TEXT_FORMATS:
+            doc_format = MIME_TYPES[mime]
+        kind = FORMATS[doc_format][0] if doc_format else "other"
+        description = f"{mime or 'binary content'}, {format_size(len(data))}"
+
+        if kind == "document" and doc_format in TEXT_FORMATS:
+            # Text documents are sent as text, bounded with the rest of the result
+            texts.append(f"Resource {uri or ''}:\n{data.decode('utf-8', errors='replace')}")
+        elif kind == "image" and not vision:
+            notes.append(f"[Image omitted ({description}): the model does not accept images]")
+        elif kind == "image":
+            if len(data) > self.max_image_bytes:
+                downscaled = downscale_image(data, doc_format, self.max_image_bytes)
+                formatted.truncated = True
+                if downscaled is None:
+                    notes.append(f"[Image omitted ({description}): too large]")
+                    return
+                notes.append(f"[Image downscaled from {format_size(len(data))} to {format_size(len(downscaled))}]")
+                data = downscaled
+            blocks.append({"image": {"format": doc_format, "source": {"bytes": data}}})
+        elif kind == "document" and not documents:
+            notes.append(f"[Document omitted ({description}): the model does not accept documents]")
+        elif kind == "document" and len(data) > self.max_document_bytes:
+            notes.append(f"[Document omitted ({description}): too large]")
+            formatted.truncated = True
+        elif kind == "document":
+            name = DOCUMENT_NAME_UNSAFE.sub(" ", (uri or "document").rsplit("/", 1)[-1].rsplit(".", 1)[0]).strip()
+            blocks.append({"document": {"format": doc_format, "name": name or "document", "source": {"bytes": data}}})
+        else:
+            notes.append(f"[Binary content omitted ({description}): unsupported type]")
+
+    @staticmethod
+    def _block_size(block: Dict[str, Any]) -> int:
+        content = block.get("image") or block.get("document") or {}
+        return len(content.get("source", {}).get("bytes", b""))
+
+    def _publish(self, tool_name: str, formatted: ToolResult) -> None:
+        if formatted.truncated:
+            logger.info(
+                f"Tool {tool_name} result reduced from {formatted.original_size} to {formatted.sent_size} bytes"
+            )
+        if self.metrics_service:
+            self.metrics_service.put_metrics(
+                {
+                    "ToolResultSize": formatted.original_size,
+                    "ToolResultSentSize": formatted.sent_size,
+                    "ToolResultTruncated": int(formatted.truncated),
+                },
+                units={"ToolResultSize": "Bytes", "ToolResultSentSize": "Bytes", "ToolResultTruncated": "Count"},
+                properties={"Tool": tool_name},
+            )
@@ -0,0 +1,171 @@
+"""
+Service caching the Bedrock tool specifications and input validators of MCP servers.
+"""
+
+import json
+import hashlib
+import logging
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Any, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Validation errors reported to the model for one tool call
+MAX_REPORTED_ERRORS = 3
+
+
+@dataclass(frozen=True, slots=True)
+class ToolSet:
+    """The tools of an MCP server, converted once and shared by every session."""
+
+    # Bedrock tool specifications (shared: never mutate them)
+    specs: Tuple[Dict[str, Any], ...]
+    # Compiled JSON schema validator of each tool (tools without one are not validated)
+    validators: Dict[str, Any]
+
+    def validate(self, tool_name: str, tool_input: Any) -> Optional[str]:
+        """
+        Check a tool input against the input schema of the tool.
+
+        Args:
+            tool_name: The tool name.
+            tool_input: The input generated by the model.
+
+        Returns:
+            A description of the validation errors, or None if the input is valid.
+        """
+        validator = self.validators.get(tool_name)
+        if validator is None:
+            return None
+        errors = sorted(validator.iter_errors(tool_input), key=lambda error: list(error.path))
+        if not errors:
+            return None
+        details = [
+            f"{'/'.join(str(part) for part in error.path) or '(input)'}: {error.message}"
+            for error in errors[:MAX_REPORTED_ERRORS]
+        ]
+        if len(errors) > MAX_REPORTED_ERRORS:
+            details.append(f"{len(errors) - MAX_REPORTED_ERRORS} more errors")
+        return "; ".join(details)
+
+
+def server_identity(connection) -> str:
+    """
+    Identify an MCP server from its connection (without its headers, which may hold secrets).
+
+    Args:
+        connection: The Chainlit MCP connection.
+
+    Returns:
+        The server identity.
+    """
+    client_type = getattr(connection, "clientType", "")
+    if getattr(connection, "url", None):
+        return f"{client_type}:{connection.url}"
+    command = " ".join([getattr(connection, "command", "")] + list(getattr(connection, "args", None) or []))
+    return f"{client_type}:{command}"
+
+
+def schema_fingerprint(tools: List[Any]) -> str:
+    """
+    Fingerprint the tool definitions listed by an MCP server.
+
+    Args:
+        tools: The MCP tools (name, description, inputSchema).
+
+    Returns:
+        A hash of the definitions.
+    """
+    definitions = [[tool.name, tool.description, tool.inputSchema] for tool in tools]
+    return hashlib.sha256(json.dumps(definitions, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+def compile_validator(schema: Dict[str, Any], tool_name: str):
+    """
+    Compile the JSON schema validator of a tool input.
+
+    Args:
+        schema: The input schema.
+        tool_name: The tool name (for logs).
+
+    Returns:
+        The validator, or None if jsonschema is unavailable or the schema is invalid.
+    """
+    try:
+        from jsonschema.validators import validator_for
+        from jsonschema.exceptions import SchemaError
+    except ImportError:
+        return None
+    try:
+        validator_class = validator_for(schema)
+        validator_class.check_schema(schema)
+        return validator_class(schema)
+    except SchemaError as e:
+        logger.warning(f"Invalid input schema of tool {tool_name}, inputs are not validated: {e.message}")
+        return None
+
+
+class ToolSchemaCache:
+    """
+    Process-level cache of converted MCP tools, keyed by server identity and
+    schema fingerprint.
+
+    Sessions connecting to the same server with the same tool definitions share
+    the converted specifications and the compiled validators; a server whose
+    definitions change gets a new entry. Least recently used entries are evicted.
+    """
+
+    def __init__(self, max_entries: int = 256):
+        """
+        Initialize the cache.
+
+        Args:
+            max_entries: Maximum tool sets kept.
+        """
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[Tuple[str, str], ToolSet]" = OrderedDict()
+
+    def get(self, connection, tools: List[Any]) -> ToolSet:
+        """
+        Get the converted tools of an MCP server, converting them on first use.
+
+        Args:
+            connection: The Chainlit MCP connection.
+            tools: The tools listed by the server.
+
+        Returns:
+            The tool set.
+        """
+        key = (server_identity(connection), schema_fingerprint(tools))
+        tool_set = self._entries.get(key)
+        if tool_set is not None:
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return tool_set
+
+        self.misses += 1
+        tool_set = ToolSet(
+            specs=tuple(
+                {
+                    "toolSpec": {
+                        "name": tool.name,
+                        "description": tool.description,
+                        "inputSchema": {"json": tool.inputSchema},
+                    }
+                }
+                for tool in tools
+            ),
+            validators={
+                tool.name: validator
+                for tool in tools
+                if (validator := compile_validator(tool.inputSchema, tool.name)) is not None
+            },
+        )
+        self._entries[key] = tool_set
+        if len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        logger.debug(f"Converted {len(tool_set.specs)} tools of {key[0]} ({len(tool_set.validators)} validated)")
+        return tool_set
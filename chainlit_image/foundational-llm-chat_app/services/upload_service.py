@@ -0,0 +1,165 @@
+"""
+Service for tracking uploaded files on the local disk until they are removed.
+"""
+
+import os
+import time
+import shutil
+import asyncio
+import logging
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class UploadTracker:
+    """
+    Tracks the uploaded files of every session under a process-wide disk quota.
+
+    Files are removed off the event loop: when their session ends, or by a
+    background reaper once they are older than the TTL (sessions that never
+    end cleanly). Uploads of a message that would exceed the quota are refused.
+    """
+
+    def __init__(
+        self,
+        quota_mb: float = 1024,
+        ttl: float = 3600,
+        reap_interval: float = 60,
+        metrics_service=None,
+    ):
+        """
+        Initialize the tracker.
+
+        Args:
+            quota_mb: Maximum size of the tracked files of all sessions, in MB.
+            ttl: Seconds after which a tracked file is removed.
+            reap_interval: Seconds between two runs of the reaper.
+            metrics_service: Optional MetricsService receiving the disk usage.
+        """
+        self.quota_bytes = int(quota_mb * 1024 * 1024)
+        self.ttl = ttl
+        self.reap_interval = reap_interval
+        self.metrics_service = metrics_service
+        # Session ID -> path -> (size, tracking time)
+        self._sessions: Dict[str, Dict[str, Tuple[int, float]]] = {}
+        self.used_bytes = 0
+        # A directory on the upload volume, for the free space metric
+        self._disk_path: Optional[str] = None
+        self._reaper: Optional[asyncio.Task] = None
+
+    @property
+    def tracked_files(self) -> int:
+        """Number of tracked files."""
+        return sum(len(files) for files in self._sessions.values())
+
+    def track(self, session_id: str, attachments: List) -> bool:
+        """
+        Track the uploaded files of a message.
+
+        Args:
+            session_id: The session owning the files.
+            attachments: The AttachmentDescriptor of each file.
+
+        Returns:
+            False if the files would exceed the disk quota (nothing is tracked).
+        """
+        files = self._sessions.setdefault(session_id, {})
+        new = {a.path: a.size for a in attachments if a.path not in files}
+        if self.used_bytes + sum(new.values()) > self.quota_bytes:
+            logger.warning(
+                f"Upload quota exceeded: {self.used_bytes + sum(new.values())} > {self.quota_bytes} bytes"
+            )
+            return False
+        now = time.monotonic()
+        for path, size in new.items():
+            files[path] = (size, now)
+            self.used_bytes += size
+            self._disk_path = os.path.dirname(path) or "."
+        self._ensure_reaper()
+        return True
+
+    async def release(self, session_id: str, attachments: Optional[List] = None) -> None:
+        """
+        Remove uploaded files.
+
+        Args:
+            session_id: The session owning the files.
+            attachments: The AttachmentDescriptor of the files to remove
+                (all the files of the session if None).
+        """
+        files = self._sessions.get(session_id, {})
+        if attachments is None:
+            paths = list(files)
+            self._sessions.pop(session_id, None)
+        else:
+            paths = [a.path for a in attachments]
+        for path in paths:
+            entry = files.pop(path, None)
+            if entry:
+                self.used_bytes -= entry[0]
+        await self._remove(paths)
+
+    async def reap(self) -> None:
+        """Remove the files older than the TTL and publish the disk usage."""
+        deadline = time.monotonic() - self.ttl
+        expired = []
+        for session_id, files in list(self._sessions.items()):
+            for path, (size, tracked) in list(files.items()):
+                if tracked < deadline:
+                    del files[path]
+                    self.used_bytes -= size
+                    expired.append(path)
+            if not files:
+                del self._sessions[session_id]
+        if expired:
+            logger.info(f"Reaped {len(expired)} expired uploads")
+            await self._remove(expired)
+        await self.publish_metrics()
+
+    async def publish_metrics(self) -> None:
+        """Publish the size of the tracked files and the free space of the upload volume."""
+        if not self.metrics_service:
+            return
+        metrics = {"UploadDiskUsage": self.used_bytes, "TrackedUploads": self.tracked_files}
+        units = {"UploadDiskUsage": "Bytes", "UploadDiskFree": "Bytes"}
+        if self._disk_path:
+            try:
+                usage = await asyncio.to_thread(shutil.disk_usage, self._disk_path)
+                metrics["UploadDiskFree"] = usage.free
+            except OSError:
+                pass
+        self.metrics_service.put_metrics(metrics, units=units)
+
+    @staticmethod
+    async def _remove(paths: List[str]) -> None:
+        """Remove files in a worker thread (missing files are ignored)."""
+        def remove_all():
+            for path in paths:
+                try:
+                    os.remove(path)
+                    logger.debug(f"Deleted file: {path}")
+                except FileNotFoundError:
+                    pass
+                except OSError as e:
+                    logger.error(f"Error deleting file {path}: {e}")
+
+        if paths:
+            await asyncio.to_thread(remove_all)
+
+    def _ensure_reaper(self) -> None:
+        """Start the reaper task on first use."""
+        if self._reaper is None or self._reaper.done():
+            try:
+                self._reaper = asyncio.get_running_loop().create_task(self._reap_periodically())
+            except RuntimeError:
+                # No running loop (e.g. synchronous callers): reap() must be called explicitly
+                pass
+
+    async def _reap_periodically(self) -> None:
+        while True:
+            await asyncio.sleep(self.reap_interval)
+            try:
+                await self.reap()
+            except Exception as e:
+                logger.error(f"Error reaping uploads: {e}")
@@ -0,0 +1,265 @@
+"""
+Service for usage and cost accounting.
+"""
+
+import asyncio
+import json
+import logging
+from abc import ABC, abstractmethod
+from datetime import datetime, timezone
+from typing import Dict, Any, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class PriceTable:
+    """Per-token prices of a model, precomputed from its `cost` configuration."""
+
+    __slots__ = ("input", "output", "cache_read", "cache_write")
+
+    def __init__(self, model_config):
+        """
+        Initialize the price table.
+
+        Args:
+            model_config: The ModelConfig holding the 1k-token prices of the model.
+        """
+        self.input = model_config.input_1k_price / 1000
+        self.output = model_config.output_1k_price / 1000
+        self.cache_read = model_config.cache_read_1k_price / 1000
+        self.cache_write = model_config.cache_write_1k_price / 1000
+
+    def cost(self, usage: Dict[str, Any]) -> float:
+        """
+        Compute the cost of an invocation.
+
+        Args:
+            usage: Token counts of the invocation (see UsageLedger.record).
+
+        Returns:
+            The cost in USD.
+        """
+        # Reasoning tokens are billed as output tokens and already part of outputTokenCount
+        return (
+            usage.get("inputTokenCount", 0) * self.input
+            + usage.get("outputTokenCount", 0) * self.output
+            + usage.get("cacheReadInputTokenCount", 0) * self.cache_read
+            + usage.get("cacheWriteInputTokenCount", 0) * self.cache_write
+        )
+
+
+def converse_usage(usage: Dict[str, Any]) -> Dict[str, int]:
+    """
+    Convert the usage of a Converse response to the token counts of the usage accounting.
+
+    Args:
+        usage: The `usage` of a Converse response or of a ConverseStream metadata event.
+
+    Returns:
+        The token counts expected by PriceTable.cost and UsageLedger.record.
+    """
+    return {
+        "inputTokenCount": usage.get("inputTokens", 0),
+        "outputTokenCount": usage.get("outputTokens", 0),
+        "cacheReadInputTokenCount": usage.get("cacheReadInputTokens", 0),
+        "cacheWriteInputTokenCount": usage.get("cacheWriteInputTokens", 0),
+    }
+
+
+class UsageSink(ABC):
+    """Destination of aggregated usage rows."""
+
+    @abstractmethod
+    async def write(self, rows: List[Dict[str, Any]]) -> None:
+        """
+        Write aggregated usage rows.
+
+        Args:
+            rows: One row per (user, profile) with the counters accumulated since the last flush.
+        """
+
+
+class LogUsageSink(UsageSink):
+    """Usage sink writing one JSON log line per row."""
+
+    async def write(self, rows: List[Dict[str, Any]]) -> None:
+        for row in rows:
+            logger.info(f"usage {json.dumps(row)}")
+
+
+class MetricsUsageSink(UsageSink):
+    """Usage sink publishing rows as custom metrics."""
+
+    def __init__(self, metrics_service):
+        """
+        Initialize the sink.
+
+        Args:
+            metrics_service: The MetricsService used to publish the rows.
+        """
+        self.metrics_service = metrics_service
+
+    async def write(self, rows: List[Dict[str, Any]]) -> None:
+        for row in rows:
+            self.metrics_service.put_metrics(
+                {
+                    "InputTokens": row["input_tokens"],
+                    "OutputTokens": row["output_tokens"],
+                    "CacheReadInputTokens": row["cache_read_tokens"],
+                    "CacheWriteInputTokens": row["cache_write_tokens"],
+                    "Invocations": row["invocations"],
+                    "Cost": row["cost"],
+                },
+                dimensions={"Profile": row["profile"]},
+                properties={"User": row["user"], "ToolFollowUps": row["tool_follow_ups"]},
+            )
+
+
+USAGE_COUNTERS = (
+    "input_tokens",
+    "output_tokens",
+    "cache_read_tokens",
+    "cache_write_tokens",
+    "reasoning_tokens",
+    "invocations",
+    "tool_follow_ups",
+    "cost",
+)
+
+
+class UsageLedger:
+    """
+    In-memory usage ledger aggregated per user and profile.
+
+    Recording an invocation only updates counters in memory; aggregated rows are
+    written to the sink periodically by a background task. Budgets are checked
+    against the same in-memory counters, so enforcing them costs no round trip.
+
+    The counters belong to the process: with several tasks, each enforces the
+    budget on its own share of a user's spending, and a restart resets them.
+    """
+
+    def __init__(
+        self,
+        bedrock_models: Dict[str, Any],
+        sink: Optional[UsageSink] = None,
+        flush_interval: float = 60.0,
+        daily_budget: Optional[float] = None,
+    ):
+        """
+        Initialize the usage ledger.
+
+        Args:
+            bedrock_models: The ModelConfig of each profile, keyed by profile name.
+            sink: Where aggregated usage is flushed (defaults to the log).
+            flush_interval: Seconds between two flushes.
+            daily_budget: Optional per-user budget in USD for each UTC day.
+        """
+        self.price_tables = {
+            profile: PriceTable(model_config)
+            for profile, model_config in bedrock_models.items()
+        }
+        self.sink = sink or LogUsageSink()
+        self.flush_interval = flush_interval
+        self.daily_budget = daily_budget
+        # Counters waiting to be flushed, keyed by (user, profile)
+        self._pending: Dict[tuple, Dict[str, float]] = {}
+        # Spend of the current UTC day, keyed by user
+        self._daily_spend: Dict[str, float] = {}
+        self._day = self._today()
+        self._flusher: Optional[asyncio.Task] = None
+
+    @staticmethod
+    def _today() -> str:
+        return datetime.now(timezone.utc).strftime("%Y-%m-%d")
+
+    def _roll_day(self) -> None:
+        """Reset daily spend when the UTC day changes."""
+        today = self._today()
+        if today != self._day:
+            self._day = today
+            self._daily_spend.clear()
+
+    def record(
+        self,
+        user: str,
+        profile: str,
+        usage: Dict[str, Any],
+        tool_follow_up: bool = False,
+    ) -> float:
+        """
+        Record the usage of one model invocation.
+
+        Args:
+            user: The user identifier.
+            profile: The chat profile used.
+            usage: Token counts: inputTokenCount, outputTokenCount and optionally
+                cacheReadInputTokenCount, cacheWriteInputTokenCount and reasoningTokenCount.
+            tool_follow_up: Whether the invocation answered tool results.
+
+        Returns:
+            The cost of the invocation in USD.
+        """
+        price_table = self.price_tables.get(profile)
+        cost = price_table.cost(usage) if price_table else 0.0
+
+        counters = self._pending.get((user, profile))
+        if counters is None:
+            counters = self._pending[(user, profile)] = dict.fromkeys(USAGE_COUNTERS, 0)
+        counters["input_tokens"] += usage.get("inputTokenCount", 0)
+        counters["output_tokens"] += usage.get("outputTokenCount", 0)
+        counters["cache_read_tokens"] += usage.get("cacheReadInputTokenCount", 0)
+        counters["cache_write_tokens"] += usage.get("cacheWriteInputTokenCount", 0)
+        counters["reasoning_tokens"] += usage.get("reasoningTokenCount", 0)
+        counters["invocations"] += 1
+        counters["tool_follow_ups"] += int(tool_follow_up)
+        counters["cost"] += cost
+
+        self._roll_day()
+        self._daily_spend[user] = self._daily_spend.get(user, 0.0) + cost
+
+        self._ensure_flusher()
+        return cost
+
+    def is_over_budget(self, user: str) -> bool:
+        """
+        Check whether a user exhausted the daily budget.
+
+        Args:
+            user: The user identifier.
+
+        Returns:
+            True if a budget is configured and the user already spent it.
+        """
+        if not self.daily_budget:
+            return False
+        self._roll_day()
+        return self._daily_spend.get(user, 0.0) >= self.daily_budget
+
+    def _ensure_flusher(self) -> None:
+        """Start the periodic flush task on first use."""
+        if self._flusher is None or self._flusher.done():
+            try:
+                self._flusher = asyncio.get_running_loop().create_task(self._flush_periodically())
+            except RuntimeError:
+                # No running loop (e.g. synchronous callers): flush() must be called explicitly
+                pass
+
+    async def _flush_periodically(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    async def flush(self) -> None:
+        """Write the counters accumulated since the last flush to the sink."""
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, {}
+        rows = [
+            {"user": user, "profile": profile, "day": self._day, **counters}
+            for (user, profile), counters in pending.items()
+        ]
+        try:
+            await self.sink.write(rows)
+        except Exception as e:
+            logger.error(f"Error flushing usage: {e}")
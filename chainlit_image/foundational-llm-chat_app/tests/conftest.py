@@ -0,0 +1,57 @@
+"""
+Shared test setup: the application reads its configuration from the environment
+at import time, so a minimal configuration is set before any test module imports it.
+"""
+
+import os
+import json
+import asyncio
+from pathlib import Path
+
+FIXTURES_DIR = Path(__file__).parent / "fixtures"
+
+TEST_MODEL = "Claude Sonnet 4.5"
+
+os.environ.setdefault("AWS_REGION", "us-west-2")
+os.environ.setdefault("AWS_ACCESS_KEY_ID", "testing")
+os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "testing")
+os.environ.setdefault("CHAINLIT_AUTH_SECRET", "testing")
+os.environ.setdefault("OAUTH_COGNITO_CLIENT_ID", "testing")
+os.environ.setdefault("OAUTH_COGNITO_CLIENT_SECRET", "testing")
+os.environ.setdefault("OAUTH_COGNITO_DOMAIN", "auth.example.com")
+os.environ.setdefault("BEDROCK_MODELS", json.dumps({
+    TEST_MODEL: {
+        "id": "global.anthropic.claude-sonnet-4-5-20250929-v1:0",
+        "region": ["us-west-2"],
+        "cost": {"input_1k_price": 0.003, "output_1k_price": 0.015},
+        "default": True,
+        "maxTokens": 64000,
+        "vision": True,
+        "document": True,
+        "tool": True,
+        "reasoning": {"enabled": True, "hybrid": True, "budget_thinking_tokens": True, "temperature_forced": 1},
+    }
+}))
+
+
+def run_in_chat(coroutine_function, **session):
+    """
+    Run a coroutine in a Chainlit HTTP context, with the given user session values.
+
+    Args:
+        coroutine_function: Called without arguments once the context exists.
+        **session: Values set in the user session first.
+
+    Returns:
+        The coroutine result.
+    """
+    import chainlit as cl
+    from chainlit.context import init_http_context
+
+    async def run():
+        init_http_context()
+        for key, value in session.items():
+            cl.user_session.set(key, value)
+        return await coroutine_function()
+
+    return asyncio.run(run())
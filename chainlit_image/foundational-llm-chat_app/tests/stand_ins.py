@@ -0,0 +1,180 @@
+"""
+In-memory stand-ins of the DynamoDB and S3 clients, enforcing the service limits the application relies on.
+"""
+
+import re
+import threading
+from typing import Dict, Any, List, Optional
+
+from botocore.exceptions import ClientError
+
+# DynamoDB limits
+MAX_ITEM_BYTES = 400 * 1024
+MAX_BATCH_REQUESTS = 25
+
+
+def client_error(code: str, message: str, operation: str) -> ClientError:
+    return ClientError({"Error": {"Code": code, "Message": message}}, operation)
+
+
+def item_size(item: Dict[str, Any]) -> int:
+    """Approximate DynamoDB item size: attribute names and values."""
+    size = 0
+    for name, value in item.items():
+        size += len(name.encode("utf-8"))
+        for kind, data in value.items():
+            if kind == "B":
+                size += len(data)
+            elif kind in ("S", "N"):
+                size += len(str(data).encode("utf-8"))
+            else:
+                size += len(repr(data))
+    return size
+
+
+class InMemoryDynamoDB:
+    """DynamoDB client stand-in for a table keyed by PK and SK."""
+
+    def __init__(self, unprocessed_first: int = 0):
+        """
+        Initialize the stand-in.
+
+        Args:
+            unprocessed_first: Number of BatchWriteItem calls returning their requests as unprocessed.
+        """
+        self.items: Dict[tuple, Dict[str, Any]] = {}
+        self.calls: List[tuple] = []
+        self.unprocessed_first = unprocessed_first
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(item: Dict[str, Any]) -> tuple:
+        return item["PK"]["S"], item["SK"]["S"]
+
+    def _check_size(self, item: Dict[str, Any], operation: str) -> None:
+        if item_size(item) > MAX_ITEM_BYTES:
+            raise client_error(
+                "ValidationException", "Item size has exceeded the maximum allowed size", operation
+            )
+
+    def batch_write_item(self, RequestItems):
+        with self._lock:
+            self.calls.append(("batch_write_item", RequestItems))
+            for table, requests in RequestItems.items():
+                if len(requests) > MAX_BATCH_REQUESTS:
+                    raise client_error("ValidationException", "Too many items requested", "BatchWriteItem")
+                keys = [
+                    self._key(request.get("PutRequest", {}).get("Item") or request["DeleteRequest"]["Key"])
+                    for request in requests
+                ]
+                if len(set(keys)) != len(keys):
+                    raise client_error(
+                        "ValidationException", "Provided list of item keys contains duplicates", "BatchWriteItem"
+                    )
+                for request in requests:
+                    if "PutRequest" in request:
+                        self._check_size(request["PutRequest"]["Item"], "BatchWriteItem")
+            if self.unprocessed_first > 0:
+                self.unprocessed_first -= 1
+                return {"UnprocessedItems": RequestItems}
+            for requests in RequestItems.values():
+                for request in requests:
+                    if "PutRequest" in request:
+                        item = request["PutRequest"]["Item"]
+                        self.items[self._key(item)] = dict(item)
+                    else:
+                        self.items.pop(self._key(request["DeleteRequest"]["Key"]), None)
+            return {"UnprocessedItems": {}}
+
+    def put_item(self, TableName, Item, **kwargs):
+        with self._lock:
+            self.calls.append(("put_item", Item))
+            self._check_size(Item, "PutItem")
+            self.items[self._key(Item)] = dict(Item)
+            return {}
+
+    def get_item(self, TableName, Key, **kwargs):
+        with self._lock:
+            item = self.items.get(self._key(Key))
+            return {"Item": dict(item)} if item else {}
+
+    def update_item(self, TableName, Key, UpdateExpression, ExpressionAttributeNames, ExpressionAttributeValues, **kwargs):
+        with self._lock:
+            self.calls.append(("update_item", Key))
+            assert UpdateExpression.startswith("SET ")
+            item = dict(self.items.get(self._key(Key), Key))
+            for assignment in UpdateExpression[4:].split(", "):
+                name, value = re.match(r"(#\w+) = (:\w+)", assignment).groups()
+                item[ExpressionAttributeNames[name]] = ExpressionAttributeValues[value]
+            self._check_size(item, "UpdateItem")
+            self.items[self._key(Key)] = item
+            return {}
+
+    def query(self, TableName, KeyConditionExpression, ExpressionAttributeValues, ExclusiveStartKey=None, **kwargs):
+        with self._lock:
+            pk = ExpressionAttributeValues[":pk"]["S"]
+            items = [dict(item) for key, item in sorted(self.items.items()) if key[0] == pk]
+            return {"Items": items}
+
+
+class InMemoryS3:
+    """S3 client stand-in."""
+
+    def __init__(self, denied_deletes: bool = False):
+        """
+        Initialize the stand-in.
+
+        Args:
+            denied_deletes: Whether deleting objects is denied, as without s3:DeleteObject.
+        """
+        self.objects: Dict[tuple, Dict[str, Any]] = {}
+        self.denied_deletes = denied_deletes
+        self._lock = threading.Lock()
+
+    def put_object(self, Bucket, Key, Body, ContentType=None, **kwargs):
+        with self._lock:
+            self.objects[(Bucket, Key)] = {"Body": bytes(Body), "ContentType": ContentType}
+            return {}
+
+    def upload_file(self, Filename, Bucket, Key, ExtraArgs: Optional[Dict[str, Any]] = None, Config=None):
+        with open(Filename, "rb") as f:
+            self.put_object(Bucket=Bucket, Key=Key, Body=f.read(), **(ExtraArgs or {}))
+
+    def get_object(self, Bucket, Key, **kwargs):
+        with self._lock:
+            if (Bucket, Key) not in self.objects:
+                raise client_error("NoSuchKey", "The specified key does not exist.", "GetObject")
+            return {"Body": _Body(self.objects[(Bucket, Key)]["Body"])}
+
+    def head_object(self, Bucket, Key, **kwargs):
+        with self._lock:
+            if (Bucket, Key) not in self.objects:
+                raise client_error("404", "Not Found", "HeadObject")
+            return {"ContentLength": len(self.objects[(Bucket, Key)]["Body"])}
+
+    def delete_object(self, Bucket, Key, **kwargs):
+        with self._lock:
+            self.objects.pop((Bucket, Key), None)
+            return {}
+
+    def delete_objects(self, Bucket, Delete, **kwargs):
+        with self._lock:
+            if self.denied_deletes:
+                # Denied keys are reported per key, the call itself succeeds
+                return {
+                    "Errors": [
+                        {"Key": entry["Key"], "Code": "AccessDenied", "Message": "Access Denied"}
+                        for entry in Delete["Objects"]
+                    ]
+                }
+            for entry in Delete["Objects"]:
+                self.objects.pop((Bucket, entry["Key"]), None)
+            return {} if Delete.get("Quiet") else {"Deleted": Delete["Objects"]}
+
+
+class _Body:
+    def __init__(self, data: bytes):
+        self._data = data
+
+    def read(self) -> bytes:
+        return self._data
@@ -0,0 +1,155 @@
+"""
+Attachment descriptors, and attachments sent by S3 reference against an in-memory S3 stand-in.
+"""
+
+from types import SimpleNamespace
+
+import pytest
+
+from services.attachment_service import AttachmentTransport
+from services.token_service import TokenEstimator
+from services.tool_result_service import ToolResultFormatter
+from stand_ins import InMemoryS3
+from utils.attachment_descriptor import describe_attachment
+
+S3_MODEL = SimpleNamespace(s3_attachments=True)
+
+
+def create_transport(s3, **kwargs) -> AttachmentTransport:
+    return AttachmentTransport(bucket_name="bucket", s3_client=s3, threshold_mb=0, **kwargs)
+
+
+def attachment(tmp_path, name: str, data: bytes):
+    path = tmp_path / name
+    path.write_bytes(data)
+    return describe_attachment(str(path), name, "application/pdf")
+
+
+def test_same_attachment_is_uploaded_once(tmp_path):
+    s3 = InMemoryS3()
+    transport = create_transport(s3)
+    report = attachment(tmp_path, "report.pdf", b"%PDF-1.7 report")
+
+    first = transport.for_session("a").source(report, S3_MODEL)
+    second = transport.for_session("b").source(report, S3_MODEL)
+
+    assert first == second
+    assert transport.uploaded == 1
+    assert len(s3.objects) == 1
+
+
+def test_cache_is_bounded(tmp_path):
+    s3 = InMemoryS3()
+    transport = create_transport(s3, max_cached=2)
+
+    for index in range(3):
+        transport.source(attachment(tmp_path, f"{index}.pdf", b"%PDF-1.7 " + bytes([index])), S3_MODEL)
+
+    assert len(transport.locations) == 2
+    # The least recently used attachment is uploaded again
+    transport.source(attachment(tmp_path, "0.pdf", b"%PDF-1.7 \x00"), S3_MODEL)
+    assert transport.uploaded == 4
+
+
+def test_release_deletes_attachments_no_other_session_uses(tmp_path):
+    s3 = InMemoryS3()
+    transport = create_transport(s3)
+    shared = attachment(tmp_path, "shared.pdf", b"%PDF-1.7 shared")
+    own = attachment(tmp_path, "own.pdf", b"%PDF-1.7 own")
+    transport.for_session("a").source(shared, S3_MODEL)
+    transport.for_session("a").source(own, S3_MODEL)
+    transport.for_session("b").source(shared, S3_MODEL)
+
+    assert transport.release("a") == 1
+    assert [key for _, key in s3.objects] == [f"attachments/{shared.content_hash}/shared.pdf"]
+    assert transport.release("b") == 1
+    assert s3.objects == {}
+    assert transport.locations == {}
+
+
+def test_denied_deletes_are_not_reported_as_deleted(tmp_path):
+    s3 = InMemoryS3(denied_deletes=True)
+    transport = create_transport(s3)
+    transport.for_session("a").source(attachment(tmp_path, "report.pdf", b"%PDF-1.7 report"), S3_MODEL)
+
+    assert transport.release("a") == 0
+    assert (transport.deleted, transport.delete_failed) == (0, 1)
+    assert len(s3.objects) == 1
+
+
+def test_release_without_delete_keeps_attachments(tmp_path):
+    s3 = InMemoryS3()
+    transport = create_transport(s3)
+    transport.for_session("a").source(attachment(tmp_path, "report.pdf", b"%PDF-1.7 report"), S3_MODEL)
+
+    assert transport.release("a", delete=False) == 0
+    assert len(s3.objects) == 1
+
+
+def test_referenced_documents_are_estimated_from_their_size(tmp_path):
+    transport = create_transport(InMemoryS3())
+    report = attachment(tmp_path, "report.pdf", b"%PDF-1.7 " + b"x" * 6000)
+    source = transport.source(report, S3_MODEL)
+    block = {"document": {"format": "pdf", "name": "report", "source": source}}
+
+    estimator = TokenEstimator(reference_size=transport.size_of)
+
+    assert estimator.estimate_block(block, "amazon") == estimator.estimate_document_size(report.size, "pdf", "amazon")
+    assert estimator.estimate_block(block, "amazon") > 1000
+
+
+def test_unconfirmed_binary_mime_type_falls_back_to_the_extension(tmp_path):
+    path = tmp_path / "orders.csv"
+    path.write_bytes(b"id,total\n1,9.90\n")
+
+    descriptor = describe_attachment(str(path), "orders.csv", "application/vnd.ms-excel")
+
+    assert (descriptor.kind, descriptor.format, descriptor.mime) == ("document", "csv", "text/csv")
+
+
+def test_extension_tells_containers_apart_when_the_mime_type_is_wrong(tmp_path):
+    path = tmp_path / "orders.xlsx"
+    path.write_bytes(b"PK\x03\x04 workbook")
+
+    assert describe_attachment(str(path), "orders.xlsx", "application/vnd.ms-excel").format == "xlsx"
+
+
+def test_magic_bytes_win_over_the_declared_type(tmp_path):
+    path = tmp_path / "scan.jpg"
+    path.write_bytes(b"\x89PNG\r\n\x1a\n image")
+
+    descriptor = describe_attachment(str(path), "scan.jpg", "image/jpeg")
+
+    assert (descriptor.kind, descriptor.format) == ("image", "png")
+
+
+@pytest.mark.parametrize(
+    "name, mime, head",
+    [
+        ("slides.pptx", "application/vnd.openxmlformats-officedocument.presentationml.presentation", b"PK\x03\x04"),
+        ("archive.zip", "application/zip", b"PK\x03\x04"),
+        ("slides.ppt", "application/vnd.ms-powerpoint", b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1"),
+        ("orders.csv", "text/csv", b"PK\x03\x04"),
+    ],
+)
+def test_unsupported_files_in_supported_containers_are_other_files(tmp_path, name, mime, head):
+    path = tmp_path / name
+    path.write_bytes(head + b" content")
+
+    descriptor = describe_attachment(str(path), name, mime)
+
+    assert (descriptor.kind, descriptor.format) == ("other", "")
+
+
+def test_unsupported_tool_result_containers_are_not_sent_as_documents():
+    resource = SimpleNamespace(
+        uri="file:///slides.pptx",
+        mimeType="application/vnd.openxmlformats-officedocument.presentationml.presentation",
+        blob=b"PK\x03\x04 slides",
+    )
+    result = SimpleNamespace(content=[SimpleNamespace(type="resource", resource=resource)])
+
+    formatted = ToolResultFormatter().format("tool", result, documents=True)
+
+    assert formatted.content == [{"text": formatted.display}]
+    assert "unsupported type" in formatted.display
@@ -0,0 +1,76 @@
+"""
+Batch runs against a local stand-in of the Bedrock runtime client.
+"""
+
+import asyncio
+import json
+
+from conftest import TEST_MODEL
+from config.app_config import AppConfig
+from services.batch_service import BatchRunner, read_records
+from services.request_service import compile_capabilities
+
+
+class StandInBedrockClient:
+    """Bedrock runtime client stand-in answering "ok", or a malformed response to the prompt "malformed"."""
+
+    def __init__(self):
+        self.calls = 0
+
+    def converse(self, **api_params):
+        self.calls += 1
+        if api_params["messages"][0]["content"][0].get("text") == "malformed":
+            return {"output": "unexpected"}
+        return {
+            "output": {"message": {"role": "assistant", "content": [{"text": "ok"}]}},
+            "stopReason": "end_turn",
+            "usage": {"inputTokens": 10, "outputTokens": 2, "totalTokens": 12},
+        }
+
+
+def run_batch(tmp_path, records, concurrency=2):
+    bedrock_models = AppConfig.load_bedrock_models()
+    client = StandInBedrockClient()
+    runner = BatchRunner(
+        bedrock_models,
+        compile_capabilities(bedrock_models),
+        {},
+        lambda region_name: client,
+        TEST_MODEL,
+        concurrency=concurrency,
+        initial_rate=1000,
+        max_rate=1000,
+    )
+    input_path, output_path = tmp_path / "input.jsonl", tmp_path / "output.jsonl"
+    input_path.write_text("".join(json.dumps(record) + "\n" for record in records))
+
+    stats = asyncio.run(asyncio.wait_for(runner.run(read_records(str(input_path)), str(output_path)), timeout=10))
+    results = {result["id"]: result for result in map(json.loads, output_path.read_text().splitlines())}
+    return stats, results, client
+
+
+def test_invalid_records_are_reported_without_stopping_the_run(tmp_path):
+    records = [
+        {"id": "bad-settings", "prompt": "hello", "settings": "abc"},
+        {"id": "bad-messages", "messages": "hello"},
+        {"id": "malformed", "prompt": "malformed"},
+    ] + [{"id": str(index), "prompt": f"question {index}"} for index in range(10)]
+
+    stats, results, client = run_batch(tmp_path, records)
+
+    assert (stats["ok"], stats["error"]) == (10, 3)
+    assert results["bad-settings"]["error"] == "'settings' must be an object"
+    assert results["bad-messages"]["error"] == "'messages' must be a list of Converse messages"
+    assert results["malformed"]["error"].startswith("AttributeError")
+    assert all(results[str(index)]["text"] == "ok" for index in range(10))
+    assert client.calls == 11
+
+
+def test_rerun_skips_the_answered_records(tmp_path):
+    records = [{"id": str(index), "prompt": f"question {index}"} for index in range(3)]
+    run_batch(tmp_path, records)
+
+    stats, _, client = run_batch(tmp_path, records)
+
+    assert stats["skipped"] == 3
+    assert client.calls == 0
@@ -0,0 +1,108 @@
+"""
+Streamed chat completions against a local stand-in of the Bedrock runtime client.
+"""
+
+import asyncio
+import gc
+import threading
+
+import pytest
+
+from conftest import TEST_MODEL
+from config.app_config import AppConfig
+from services.compare_service import iterate_stream
+from services.openai_service import ChatCompletionError, ChatCompletionsService
+from services.output_filter_service import create_output_filter
+from services.request_service import compile_capabilities
+from services.usage_service import UsageLedger
+
+STREAM_BODY = {"model": TEST_MODEL, "messages": [{"role": "user", "content": "hello"}], "stream": True}
+
+
+class OpenStream:
+    """ConverseStream `stream` stand-in: a first text delta, then blocks on the network until closed."""
+
+    def __init__(self):
+        self.closed = threading.Event()
+        self.finished = threading.Event()
+
+    def __iter__(self):
+        try:
+            yield {"messageStart": {"role": "assistant"}}
+            yield {"contentBlockDelta": {"contentBlockIndex": 0, "delta": {"text": "Hi"}}}
+            if not self.closed.wait(timeout=10):
+                raise AssertionError("The stream was never closed")
+            raise ConnectionError("Connection closed")
+        finally:
+            self.finished.set()
+
+    def close(self):
+        self.closed.set()
+
+
+class StandInBedrockClient:
+    def __init__(self):
+        self.streams = []
+
+    def converse_stream(self, **api_params):
+        self.streams.append(OpenStream())
+        return {"stream": self.streams[-1]}
+
+
+def create_service(client, max_concurrency=1) -> ChatCompletionsService:
+    bedrock_models = AppConfig.load_bedrock_models()
+    return ChatCompletionsService(
+        bedrock_models,
+        compile_capabilities(bedrock_models),
+        client_factory=lambda region_name: client,
+        system_prompt_loader=lambda: {},
+        output_filter_factory=lambda has_tools: create_output_filter(has_tools, []),
+        usage_ledger=UsageLedger(bedrock_models),
+        max_concurrency=max_concurrency,
+    )
+
+
+def test_closing_the_iteration_stops_reading_the_stream():
+    stream = OpenStream()
+
+    async def main():
+        events = iterate_stream(stream)
+        first = await events.__anext__()
+        await events.aclose()
+        return first
+
+    assert asyncio.run(main()) == {"messageStart": {"role": "assistant"}}
+    assert stream.closed.is_set()
+    assert stream.finished.wait(timeout=5)
+
+
+def test_streams_over_the_limit_are_refused_until_one_ends():
+    client = StandInBedrockClient()
+    service = create_service(client)
+
+    async def main():
+        events = await service.stream(dict(STREAM_BODY), "user")
+        first = await events.__anext__()
+        with pytest.raises(ChatCompletionError) as refused:
+            await service.stream(dict(STREAM_BODY), "user")
+        # The client disconnects
+        await events.aclose()
+        await (await service.stream(dict(STREAM_BODY), "user")).aclose()
+        return first, refused.value
+
+    first, refused = asyncio.run(main())
+
+    assert first.startswith("data: ")
+    assert refused.status == 429
+    assert client.streams[0].finished.wait(timeout=5)
+
+
+def test_streams_never_iterated_release_their_slot():
+    service = create_service(StandInBedrockClient())
+
+    async def main():
+        await service.stream(dict(STREAM_BODY), "user")
+        gc.collect()
+        await (await service.stream(dict(STREAM_BODY), "user")).aclose()
+
+    asyncio.run(main())
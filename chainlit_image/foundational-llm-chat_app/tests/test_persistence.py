@@ -0,0 +1,147 @@
+"""
+Write-behind data layer writes, against in-memory DynamoDB and S3 stand-ins.
+"""
+
+import asyncio
+
+from services.persistence_service import WriteBehindWriter
+from stand_ins import InMemoryDynamoDB, InMemoryS3, client_error
+
+
+def item(sk: str, text: str = "") -> dict:
+    return {"PK": {"S": "THREAD#1"}, "SK": {"S": sk}, "output": {"S": text}}
+
+
+def create_writer(dynamodb=None, s3=None, bucket="bucket") -> WriteBehindWriter:
+    return WriteBehindWriter(
+        table_name="table",
+        bucket_name=bucket,
+        dynamodb_client=dynamodb or InMemoryDynamoDB(),
+        s3_client=s3,
+        flush_interval=0.01,
+    )
+
+
+def run(writer: WriteBehindWriter, *operations):
+    async def main():
+        for operation in operations:
+            await operation(writer)
+        await writer.close()
+
+    asyncio.run(main())
+
+
+def test_puts_are_batched_and_deduplicated():
+    dynamodb = InMemoryDynamoDB()
+    writer = create_writer(dynamodb)
+
+    run(
+        writer,
+        lambda w: w.put_item(item("STEP#1", "partial")),
+        lambda w: w.put_item(item("STEP#2")),
+        lambda w: w.put_item(item("STEP#1", "final")),
+    )
+
+    assert [call[0] for call in dynamodb.calls] == ["batch_write_item"]
+    assert dynamodb.items[("THREAD#1", "STEP#1")]["output"] == {"S": "final"}
+    assert writer.written == 2
+    assert writer.failed == 0
+
+
+def test_large_batches_are_split():
+    dynamodb = InMemoryDynamoDB()
+    writer = create_writer(dynamodb)
+
+    async def put_many(w):
+        for index in range(60):
+            await w.put_item(item(f"STEP#{index:02d}"))
+
+    run(writer, put_many)
+
+    assert len(dynamodb.items) == 60
+    assert all(
+        len(requests) <= 25 for name, request_items in dynamodb.calls for requests in request_items.values()
+    )
+
+
+def test_unprocessed_items_are_retried():
+    dynamodb = InMemoryDynamoDB(unprocessed_first=2)
+    writer = create_writer(dynamodb)
+
+    run(writer, lambda w: w.put_item(item("STEP#1")))
+
+    assert ("THREAD#1", "STEP#1") in dynamodb.items
+    assert len(dynamodb.calls) == 3
+    assert writer.failed == 0
+
+
+def test_throttled_calls_are_retried():
+    dynamodb = InMemoryDynamoDB()
+    batch_write_item = dynamodb.batch_write_item
+    attempts = []
+
+    def throttled(**kwargs):
+        attempts.append(kwargs)
+        if len(attempts) == 1:
+            raise client_error("ThrottlingException", "Rate exceeded", "BatchWriteItem")
+        return batch_write_item(**kwargs)
+
+    dynamodb.batch_write_item = throttled
+    writer = create_writer(dynamodb)
+
+    run(writer, lambda w: w.put_item(item("STEP#1")))
+
+    assert len(attempts) == 2
+    assert ("THREAD#1", "STEP#1") in dynamodb.items
+
+
+def test_updates_land_after_pending_puts():
+    dynamodb = InMemoryDynamoDB()
+    writer = create_writer(dynamodb)
+
+    run(
+        writer,
+        lambda w: w.put_item(item("STEP#1", "created")),
+        lambda w: w.update_item({
+            "Key": {"PK": {"S": "THREAD#1"}, "SK": {"S": "STEP#1"}},
+            "UpdateExpression": "SET #0 = :0",
+            "ExpressionAttributeNames": {"#0": "output"},
+            "ExpressionAttributeValues": {":0": {"S": "updated"}},
+        }),
+    )
+
+    assert [call[0] for call in dynamodb.calls] == ["batch_write_item", "update_item"]
+    assert dynamodb.items[("THREAD#1", "STEP#1")]["output"] == {"S": "updated"}
+
+
+def test_element_item_is_written_after_its_upload(tmp_path):
+    dynamodb, s3 = InMemoryDynamoDB(), InMemoryS3()
+    writer = create_writer(dynamodb, s3)
+    path = tmp_path / "report.pdf"
+    path.write_bytes(b"%PDF-1.7 report")
+
+    run(
+        writer,
+        lambda w: w.upload("user/1/element", "application/pdf", path=str(path), then_put=item("ELEMENT#1")),
+        lambda w: w.upload("user/1/inline", "text/plain", data=b"inline", then_put=item("ELEMENT#2")),
+    )
+
+    assert s3.objects[("bucket", "user/1/element")] == {"Body": b"%PDF-1.7 report", "ContentType": "application/pdf"}
+    assert s3.objects[("bucket", "user/1/inline")]["Body"] == b"inline"
+    assert ("THREAD#1", "ELEMENT#1") in dynamodb.items
+    assert ("THREAD#1", "ELEMENT#2") in dynamodb.items
+
+
+def test_failed_upload_skips_its_item():
+    dynamodb, s3 = InMemoryDynamoDB(), InMemoryS3()
+
+    def failing_put_object(**kwargs):
+        raise client_error("AccessDenied", "Access Denied", "PutObject")
+
+    s3.put_object = failing_put_object
+    writer = create_writer(dynamodb, s3)
+
+    run(writer, lambda w: w.upload("user/1/element", "text/plain", data=b"x", then_put=item("ELEMENT#1")))
+
+    assert dynamodb.items == {}
+    assert writer.failed == 1
@@ -0,0 +1,110 @@
+"""
+Document pre-processing: XLSX to CSV conversion and the worker pool.
+"""
+
+import asyncio
+import io
+import zipfile
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+
+from services import preprocessing_service
+from services.preprocessing_service import DocumentPreprocessor, xlsx_to_csv
+
+MAIN = "http://schemas.openxmlformats.org/spreadsheetml/2006/main"
+RELATIONSHIPS = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+
+
+def create_workbook(rows: str, date1904: bool = False) -> bytes:
+    output = io.BytesIO()
+    with zipfile.ZipFile(output, "w") as workbook:
+        workbook.writestr(
+            "xl/workbook.xml",
+            f'<workbook xmlns="{MAIN}" xmlns:r="{RELATIONSHIPS}">'
+            f'<workbookPr date1904="{int(date1904)}"/>'
+            '<sheets><sheet name="Orders" sheetId="1" r:id="rId1"/></sheets></workbook>',
+        )
+        workbook.writestr(
+            "xl/_rels/workbook.xml.rels",
+            '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+            '<Relationship Id="rId1" Target="worksheets/sheet1.xml"/></Relationships>',
+        )
+        workbook.writestr(
+            "xl/styles.xml",
+            f'<styleSheet xmlns="{MAIN}">'
+            '<numFmts><numFmt numFmtId="164" formatCode="yyyy\\-mm\\-dd&quot; at &quot;hh:mm"/>'
+            '<numFmt numFmtId="165" formatCode="[h]:mm"/></numFmts>'
+            '<cellXfs><xf numFmtId="0"/><xf numFmtId="14"/><xf numFmtId="164"/>'
+            '<xf numFmtId="20"/><xf numFmtId="165"/><xf numFmtId="2"/></cellXfs></styleSheet>',
+        )
+        workbook.writestr("xl/worksheets/sheet1.xml", f'<worksheet xmlns="{MAIN}"><sheetData>{rows}</sheetData></worksheet>')
+    return output.getvalue()
+
+
+def test_dates_and_booleans_are_resolved_from_cell_types_and_styles():
+    rows = (
+        '<row r="1"><c r="A1" t="inlineStr"><is><t>date</t></is></c><c r="B1" t="inlineStr"><is><t>paid</t></is></c>'
+        '<c r="C1" t="inlineStr"><is><t>shipped</t></is></c><c r="D1" t="inlineStr"><is><t>time</t></is></c>'
+        '<c r="E1" t="inlineStr"><is><t>duration</t></is></c><c r="F1" t="inlineStr"><is><t>amount</t></is></c></row>'
+        '<row r="2"><c r="A2" s="1"><v>45292</v></c><c r="B2" t="b"><v>1</v></c><c r="C2" s="2"><v>45292.75</v></c>'
+        '<c r="D2" s="3"><v>0.5</v></c><c r="E2" s="4"><v>1.5</v></c><c r="F2" s="5"><v>12.5</v></c></row>'
+        '<row r="3"><c r="A3" s="1"><v>45293</v></c><c r="B3" t="b"><v>0</v></c></row>'
+    )
+
+    assert xlsx_to_csv(create_workbook(rows)) == (
+        "date,paid,shipped,time,duration,amount\n"
+        "2024-01-01,TRUE,2024-01-01 18:00:00,12:00:00,1.5,12.5\n"
+        "2024-01-02,FALSE,,,,\n"
+    )
+
+
+def test_1904_date_system():
+    rows = '<row r="1"><c r="A1" s="1"><v>0</v></c></row>'
+
+    assert xlsx_to_csv(create_workbook(rows, date1904=True)) == "1904-01-01\n"
+
+
+def test_parts_over_the_decompressed_size_limit_are_not_read(monkeypatch):
+    monkeypatch.setattr(preprocessing_service, "XLSX_MAX_PART_BYTES", 1024)
+    rows = '<row r="1"><c r="A1"><v>1</v></c></row>' * 100
+
+    with pytest.raises(ValueError):
+        xlsx_to_csv(create_workbook(rows))
+    assert preprocessing_service.preprocess_document(create_workbook(rows), "xlsx") is None
+
+
+class BrokenExecutor:
+    """ProcessPoolExecutor stand-in whose worker died."""
+
+    def __init__(self):
+        self.shut_down = False
+
+    def submit(self, fn, *args):
+        future = Future()
+        future.set_exception(BrokenProcessPool("A worker died"))
+        return future
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        self.shut_down = True
+
+
+def test_broken_pool_sends_the_document_as_is_and_is_created_again():
+    preprocessor = DocumentPreprocessor(max_workers=1)
+    broken = BrokenExecutor()
+    preprocessor._executor = broken
+    data = b"id, total \n1, 9.90\n\n\n"
+
+    async def main():
+        try:
+            first = await preprocessor._preprocess(data, "csv")
+            return first, await preprocessor._preprocess(data, "csv")
+        finally:
+            preprocessor.shutdown()
+
+    first, second = asyncio.run(main())
+
+    assert first is None
+    assert broken.shut_down
+    assert second == b"id,total\n1,9.90\n"
@@ -0,0 +1,31 @@
+"""
+Bedrock client pre-warm of the chat sessions.
+"""
+
+import asyncio
+
+import chainlit as cl
+
+import app
+from conftest import TEST_MODEL, run_in_chat
+
+
+def test_client_is_created_when_the_prewarm_failed(monkeypatch):
+    clients = []
+
+    def create_bedrock_client(region_name=None, service_name="bedrock-runtime"):
+        if not clients:
+            clients.append(None)
+            raise ConnectionError("Could not connect to the endpoint URL")
+        clients.append(object())
+        return clients[-1]
+
+    monkeypatch.setattr(app, "create_bedrock_client", create_bedrock_client)
+    model_info = app.bedrock_models[TEST_MODEL]
+
+    async def chat():
+        cl.user_session.set("prewarm_task", asyncio.create_task(app.prewarm_session(model_info)))
+        await app.wait_for_prewarm(model_info)
+        return cl.user_session.get("bedrock_runtime")
+
+    assert run_in_chat(chat) is clients[-1] is not None
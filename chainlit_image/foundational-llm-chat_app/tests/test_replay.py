@@ -0,0 +1,103 @@
+"""
+Replay recorded Bedrock streams through the streaming handler of the application, without network.
+"""
+
+import chainlit as cl
+
+import app
+from conftest import FIXTURES_DIR, TEST_MODEL, run_in_chat
+from services.replay_service import ReplayBedrockClient, list_fixtures
+from utils.conversation_history import ConversationHistory
+
+REPLAY_FIXTURES = FIXTURES_DIR / "replay"
+
+
+def stream_turn(client, monkeypatch):
+    """Replay the next stream in a session with thinking enabled, capturing the tool calls."""
+    tool_calls = []
+
+    async def execute_tool_calls(calls, msg, model_info, thinking_manager=None):
+        tool_calls.append((calls, thinking_manager))
+
+    monkeypatch.setattr(app, "execute_tool_calls", execute_tool_calls)
+    model_info = app.bedrock_models[TEST_MODEL]
+
+    async def turn():
+        msg = cl.Message(content="")
+        api_usage = await app.handle_streaming_response(client.converse_stream(), msg, model_info)
+        return msg, api_usage, cl.user_session.get("message_history")
+
+    msg, api_usage, history = run_in_chat(
+        turn,
+        thinking_enabled=True,
+        capabilities=app.model_capabilities[TEST_MODEL],
+        message_history=ConversationHistory(),
+    )
+    return msg, api_usage, history, tool_calls
+
+
+def test_fixtures_replay_in_order():
+    client = ReplayBedrockClient(list_fixtures(str(REPLAY_FIXTURES)), speed=0)
+
+    first = list(client.converse_stream()["stream"])
+    second = list(client.converse_stream()["stream"])
+
+    assert first[-2] == {"messageStop": {"stopReason": "tool_use"}}
+    assert second[-2] == {"messageStop": {"stopReason": "end_turn"}}
+
+
+def test_tool_use_turn(monkeypatch):
+    client = ReplayBedrockClient(list_fixtures(str(REPLAY_FIXTURES)), speed=0)
+
+    msg, api_usage, history, tool_calls = stream_turn(client, monkeypatch)
+
+    assert msg.content == "Let me check the weather."
+    # Tool calls are stored by the tool follow-up, not by the streaming handler
+    assert len(history) == 0
+    [(calls, thinking_manager)] = tool_calls
+    assert calls == [{"toolUseId": "tooluse_1", "name": "get_weather", "input": {"city": "Paris"}}]
+    assert thinking_manager.get_api_blocks(include_signature=True) == [
+        {
+            "reasoningContent": {
+                "reasoningText": {
+                    "text": "The user asks for the weather in Paris. I should call the weather tool.",
+                    "signature": "c2lnbmF0dXJl",
+                }
+            }
+        }
+    ]
+    assert api_usage["inputTokenCount"] == 412
+    assert api_usage["outputTokenCount"] == 57
+    assert api_usage["cacheReadInputTokenCount"] == 128
+    assert api_usage["cacheWriteInputTokenCount"] == 0
+    assert api_usage["invocationLatency"] == 1834
+    assert api_usage["reasoningTokenCount"] > 0
+
+
+def test_answer_turn_is_stored_with_reasoning(monkeypatch):
+    client = ReplayBedrockClient(list_fixtures(str(REPLAY_FIXTURES)), speed=0)
+    client.converse_stream()
+
+    msg, api_usage, history, tool_calls = stream_turn(client, monkeypatch)
+
+    assert msg.content == "It is 18 °C and sunny in Paris."
+    assert tool_calls == []
+    assert history.messages() == [
+        {
+            "role": "assistant",
+            "content": [
+                {"text": "It is 18 °C and sunny in Paris."},
+                {
+                    "reasoningContent": {
+                        "reasoningText": {
+                            "text": "The tool says 18 degrees and sunny.",
+                            "signature": "c2lnbmF0dXJlMg==",
+                        }
+                    }
+                },
+            ],
+        }
+    ]
+    assert api_usage["inputTokenCount"] == 530
+    assert api_usage["cacheReadInputTokenCount"] == 0
+    assert api_usage["invocationLatency"] == 942
@@ -0,0 +1,148 @@
+"""
+Session state saves and loads, against the in-memory store and an in-memory DynamoDB stand-in.
+"""
+
+import asyncio
+import os
+
+import pytest
+
+from services.session_state_service import (
+    DynamoDBSessionStore,
+    InMemorySessionStore,
+    SessionStateError,
+    SessionStateManager,
+    state_key,
+)
+from stand_ins import InMemoryDynamoDB
+from utils.conversation_history import ConversationHistory
+
+
+def message(role: str, text: str) -> dict:
+    return {"role": role, "content": [{"text": text}]}
+
+
+def create_history(*texts: str) -> ConversationHistory:
+    history = ConversationHistory()
+    for index, text in enumerate(texts):
+        history.append(message("user" if index % 2 == 0 else "assistant", text))
+    return history
+
+
+def test_session_round_trip():
+    manager = SessionStateManager(InMemorySessionStore())
+    history = create_history("hello", "hi")
+    history.append({"role": "user", "content": [{"image": {"format": "png", "source": {"bytes": b"\x89PNG"}}}]})
+
+    async def main():
+        await manager.save("s1", history, {"chat_settings": {"temperature": 0.5}})
+        return await manager.load("s1")
+
+    loaded, fields, marker = asyncio.run(main())
+
+    assert loaded.messages() == history.messages()
+    assert fields == {"chat_settings": {"temperature": 0.5}}
+    assert marker.length == 3
+
+
+def test_turns_write_only_their_changes():
+    dynamodb = InMemoryDynamoDB()
+    manager = SessionStateManager(DynamoDBSessionStore("table", dynamodb))
+    history = create_history("hello", "hi")
+
+    async def main():
+        marker = await manager.save("s1", history, {"cost": 1})
+        history.append(message("user", "and then?"))
+        dynamodb.calls.clear()
+        return await manager.save("s1", history, {"cost": 1}, marker)
+
+    asyncio.run(main())
+
+    puts = [request for name, items in dynamodb.calls if name == "batch_write_item" for request in items["table"]]
+    assert [request["PutRequest"]["Item"]["SK"]["S"] for request in puts] == ["message#00000002"]
+
+
+def test_rewritten_history_is_written_again():
+    dynamodb = InMemoryDynamoDB()
+    manager = SessionStateManager(DynamoDBSessionStore("table", dynamodb))
+
+    async def main():
+        marker = await manager.save("s1", create_history("one", "two", "three", "four"), {})
+        # E.g. after a compaction
+        await manager.save("s1", create_history("summary"), {}, marker)
+        return await manager.load("s1")
+
+    loaded, _, _ = asyncio.run(main())
+
+    assert loaded.messages() == [message("user", "summary")]
+
+
+def test_large_attachments_are_split_into_chunk_items():
+    dynamodb = InMemoryDynamoDB()
+    manager = SessionStateManager(DynamoDBSessionStore("table", dynamodb))
+    document = os.urandom(1024 * 1024)
+    history = create_history("hello")
+    history.append({
+        "role": "user",
+        "content": [{"document": {"format": "pdf", "name": "report", "source": {"bytes": document}}}],
+    })
+
+    async def main():
+        marker = await manager.save("s1", history, {})
+        # Rewritten with a smaller record: the chunks left over are ignored
+        smaller = create_history("hello", "hi")
+        await manager.save("s1", smaller, {}, marker)
+        first = await manager.load("s1")
+        await manager.save("s1", history, {})
+        return first, await manager.load("s1")
+
+    first, second = asyncio.run(main())
+
+    assert first[0].messages() == create_history("hello", "hi").messages()
+    assert second[0].messages()[1]["content"][0]["document"]["source"]["bytes"] == document
+    assert sum(1 for key in dynamodb.items if key[1].startswith("message#00000001")) > 1
+
+
+def test_rejected_writes_raise_session_state_error():
+    manager = SessionStateManager(DynamoDBSessionStore("table", InMemoryDynamoDB()))
+
+    with pytest.raises(SessionStateError):
+        asyncio.run(manager.save("s1", create_history("hello"), {"notes": os.urandom(500 * 1024).hex()}))
+
+
+def test_unprocessed_items_are_retried():
+    dynamodb = InMemoryDynamoDB(unprocessed_first=2)
+    manager = SessionStateManager(DynamoDBSessionStore("table", dynamodb))
+
+    async def main():
+        await manager.save("s1", create_history("hello", "hi"), {})
+        dynamodb.unprocessed_first = 2
+        await manager.delete("s1")
+
+    asyncio.run(main())
+
+    assert dynamodb.items == {}
+
+
+def test_items_left_unprocessed_after_the_last_attempt_raise():
+    dynamodb = InMemoryDynamoDB(unprocessed_first=3)
+    manager = SessionStateManager(DynamoDBSessionStore("table", dynamodb, max_attempts=3))
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(manager.save("s1", create_history("hello"), {}))
+    assert len(dynamodb.calls) == 3
+    assert dynamodb.items == {}
+
+
+def test_sessions_are_only_found_by_their_user():
+    manager = SessionStateManager(InMemorySessionStore())
+
+    async def main():
+        await manager.save(state_key("alice", "s1"), create_history("hello"), {})
+        return await manager.load(state_key("mallory", "s1")), await manager.load(state_key("alice", "s1"))
+
+    other_user, same_user = asyncio.run(main())
+
+    assert other_user is None
+    assert same_user is not None
+
@@ -0,0 +1,144 @@
+"""
+Attachment descriptors, resolved once per uploaded file.
+"""
+
+import hashlib
+import os
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+# Kind, MIME type and Bedrock format of each supported extension
+EXTENSIONS: Dict[str, Tuple[str, str, str]] = {
+    ".jpg": ("image", "image/jpeg", "jpeg"),
+    ".jpeg": ("image", "image/jpeg", "jpeg"),
+    ".png": ("image", "image/png", "png"),
+    ".gif": ("image", "image/gif", "gif"),
+    ".webp": ("image", "image/webp", "webp"),
+    ".pdf": ("document", "application/pdf", "pdf"),
+    ".txt": ("document", "text/plain", "txt"),
+    ".md": ("document", "text/markdown", "md"),
+    ".html": ("document", "text/html", "html"),
+    ".htm": ("document", "text/html", "html"),
+    ".csv": ("document", "text/csv", "csv"),
+    ".doc": ("document", "application/msword", "doc"),
+    ".docx": ("document", "application/vnd.openxmlformats-officedocument.wordprocessingml.document", "docx"),
+    ".xls": ("document", "application/vnd.ms-excel", "xls"),
+    ".xlsx": ("document", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", "xlsx"),
+}
+
+# Kind, MIME type and Bedrock format of each supported format
+FORMATS: Dict[str, Tuple[str, str, str]] = {entry[2]: entry for entry in EXTENSIONS.values()}
+
+# Bedrock format of each supported MIME type
+MIME_TYPES: Dict[str, str] = {mime: doc_format for _, mime, doc_format in EXTENSIONS.values()}
+
+# Magic bytes of binary formats. OLE2 and ZIP containers are told apart by extension,
+# other files in these containers (e.g. .ppt, .pptx, .zip) are not supported
+MAGIC_BYTES = (
+    (b"\x89PNG\r\n\x1a\n", ("png",)),
+    (b"\xff\xd8\xff", ("jpeg",)),
+    (b"GIF87a", ("gif",)),
+    (b"GIF89a", ("gif",)),
+    (b"%PDF-", ("pdf",)),
+    (b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1", ("doc", "xls")),
+    (b"PK\x03\x04", ("docx", "xlsx")),
+)
+
+# Formats without magic bytes, identified by their declared type
+TEXT_FORMATS = {"txt", "md", "html", "csv"}
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+@dataclass(frozen=True, slots=True)
+class AttachmentDescriptor:
+    """An uploaded file, resolved once and shared by every later stage."""
+
+    path: str
+    name: str
+    # "image", "document" or "other"
+    kind: str
+    mime: str
+    # Bedrock image or document format ("" for other files)
+    format: str
+    size: int
+    content_hash: str
+
+
+def sniff_format(head: bytes, extension_format: Optional[str]) -> Optional[str]:
+    """
+    Identify the format of a file from its first bytes.
+
+    Args:
+        head: The first bytes of the file.
+        extension_format: The format given by the file extension or MIME type.
+
+    Returns:
+        The format, "" for a container the extension does not confirm as a
+        supported format (e.g. a .pptx), or None for files without magic bytes (e.g. text).
+    """
+    for magic, formats in MAGIC_BYTES:
+        if head.startswith(magic):
+            if extension_format in formats:
+                return extension_format
+            return formats[0] if len(formats) == 1 else ""
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "webp"
+    return None
+
+
+def describe_attachment(path: str, name: str, mime: Optional[str] = None) -> AttachmentDescriptor:
+    """
+    Resolve an uploaded file in a single pass: one stat, one read for the
+    magic bytes and the content hash.
+
+    Args:
+        path: The local file path.
+        name: The file name.
+        mime: The MIME type declared by the browser, if any.
+
+    Returns:
+        The attachment descriptor.
+
+    Raises:
+        OSError: If the file cannot be read.
+    """
+    mime_format = MIME_TYPES.get(mime or "")
+    extension = EXTENSIONS.get(os.path.splitext(name)[1].lower())
+    extension_format = extension[2] if extension else None
+    declared_format = mime_format or extension_format
+
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        head = f.read(HASH_CHUNK_SIZE)
+        digest.update(head)
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+
+    doc_format = sniff_format(head, declared_format)
+    if doc_format is not None and doc_format != declared_format and extension_format:
+        # The magic bytes contradict the MIME type: the extension tells the
+        # formats sharing a container apart (e.g. an .xlsx sent as application/vnd.ms-excel)
+        doc_format = sniff_format(head, extension_format)
+    if doc_format is None:
+        # No magic bytes: a text format, or a binary format the content does not
+        # confirm, falling back to the extension (e.g. a .csv sent as application/vnd.ms-excel)
+        doc_format = next(
+            (candidate for candidate in (mime_format, extension_format) if candidate in TEXT_FORMATS), None
+        )
+
+    if doc_format:
+        kind, canonical_mime, _ = FORMATS[doc_format]
+    else:
+        kind, canonical_mime, doc_format = "other", mime or "", ""
+
+    return AttachmentDescriptor(
+        path=path,
+        name=name,
+        kind=kind,
+        mime=canonical_mime,
+        format=doc_format,
+        size=size,
+        content_hash=digest.hexdigest(),
+    )
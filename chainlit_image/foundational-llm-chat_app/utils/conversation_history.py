@@ -0,0 +1,75 @@
+"""
+Append-only conversation history with structural sharing.
+"""
+
+from typing import Dict, Any, List, Iterator, Optional
+
+
+class ConversationHistory:
+    """
+    Append-only conversation history.
+
+    A history is a view over a shared list of messages and a length. Snapshots
+    share the same list, so taking one is O(1); appending to the most recent view
+    appends in place, and only a view that diverged from the shared list (a branch,
+    or a rollback to an earlier snapshot) copies the message references once.
+    Message dicts themselves are never copied.
+    """
+
+    __slots__ = ("_messages", "_length")
+
+    def __init__(self, messages: Optional[List[Dict[str, Any]]] = None, _length: Optional[int] = None):
+        """
+        Initialize the history.
+
+        Args:
+            messages: Initial messages. The list is owned by the history afterwards.
+        """
+        self._messages = messages if messages is not None else []
+        self._length = len(self._messages) if _length is None else _length
+
+    def append(self, message: Dict[str, Any]) -> None:
+        """
+        Append a message.
+
+        Args:
+            message: The message to append.
+        """
+        if self._length != len(self._messages):
+            # Another view appended past our end: branch off with our own list
+            self._messages = self._messages[: self._length]
+        self._messages.append(message)
+        self._length += 1
+
+    def snapshot(self) -> "ConversationHistory":
+        """
+        Take an O(1) snapshot of the history.
+
+        Returns:
+            A history sharing the current messages. Appending to either of them
+            does not affect the other.
+        """
+        return ConversationHistory(self._messages, self._length)
+
+    def messages(self) -> List[Dict[str, Any]]:
+        """
+        Get the messages to send in a request.
+
+        Returns:
+            The shared message list when this view is the most recent one
+            (no copy). Callers must not modify it.
+        """
+        if self._length == len(self._messages):
+            return self._messages
+        return self._messages[: self._length]
+
+    def __len__(self) -> int:
+        return self._length
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        messages = self._messages
+        for i in range(self._length):
+            yield messages[i]
+
+    def __getitem__(self, index):
+        return self.messages()[index]
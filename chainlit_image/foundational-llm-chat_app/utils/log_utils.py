@@ -0,0 +1,93 @@
+"""
+Structured log events for the hot path: built only when enabled, sampled and size-capped.
+"""
+
+import json
+import random
+import logging
+from typing import Dict, Any, Optional
+
+# Maximum characters of a string field
+DEFAULT_MAX_CHARS = 500
+# Maximum items of a list or dict field
+MAX_ITEMS = 20
+
+_max_chars = DEFAULT_MAX_CHARS
+# Sampling rate of each event name (events not listed are always logged)
+_sample_rates: Dict[str, float] = {}
+
+
+def configure_log_events(max_chars: int = DEFAULT_MAX_CHARS, sample_rates: Optional[Dict[str, float]] = None) -> None:
+    """
+    Configure the size cap and sampling of log events.
+
+    Args:
+        max_chars: Maximum characters of a string field.
+        sample_rates: Sampling rate of each event name, between 0 and 1.
+    """
+    global _max_chars, _sample_rates
+    _max_chars = max_chars
+    _sample_rates = dict(sample_rates or {})
+
+
+def summarize(value: Any, max_chars: int = DEFAULT_MAX_CHARS, depth: int = 0) -> Any:
+    """
+    Make a JSON-friendly summary of a value: bytes are replaced by their size,
+    strings are truncated and containers capped.
+
+    Args:
+        value: The value to summarize.
+        max_chars: Maximum characters of a string.
+        depth: Nesting depth (deeper values are elided).
+
+    Returns:
+        The summary.
+    """
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return f"<{len(value)} bytes>"
+    if isinstance(value, str):
+        return value if len(value) <= max_chars else f"{value[:max_chars]}...<{len(value)} chars>"
+    if value is None or isinstance(value, (bool, int, float)):
+        return value
+    if depth >= 6:
+        return "..."
+    if isinstance(value, dict):
+        summary = {
+            str(key): summarize(item, max_chars, depth + 1)
+            for key, item in list(value.items())[:MAX_ITEMS]
+        }
+        if len(value) > MAX_ITEMS:
+            summary["..."] = f"<{len(value) - MAX_ITEMS} more>"
+        return summary
+    if isinstance(value, (list, tuple, set)):
+        items = list(value)
+        summary = [summarize(item, max_chars, depth + 1) for item in items[:MAX_ITEMS]]
+        if len(items) > MAX_ITEMS:
+            summary.append(f"<{len(items) - MAX_ITEMS} more>")
+        return summary
+    return summarize(str(value), max_chars, depth)
+
+
+def log_event(logger: logging.Logger, level: int, event: str, **fields: Any) -> None:
+    """
+    Log a structured event, built only if the level is enabled and the event sampled.
+
+    Fields may be callables: they are called only when the event is logged, so
+    expensive values cost nothing when logging is off.
+
+    Args:
+        logger: The logger.
+        level: The log level (e.g. logging.DEBUG).
+        event: The event name (e.g. "content.image").
+        **fields: The event fields.
+    """
+    if not logger.isEnabledFor(level):
+        return
+    rate = _sample_rates.get(event)
+    if rate is not None and random.random() >= rate:
+        return
+    payload = {
+        name: summarize(value() if callable(value) else value, _max_chars)
+        for name, value in fields.items()
+    }
+    logger.log(level, "%s %s", event, json.dumps(payload, ensure_ascii=False, default=str), stacklevel=2)
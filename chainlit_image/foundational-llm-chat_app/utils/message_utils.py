@@ -6,6 +6,9 @@ from typing import Dict, Any, List, Optional
 import logging
 import re
 
+from utils.attachment_descriptor import AttachmentDescriptor
+from utils.log_utils import log_event
+
 logger = logging.getLogger(__name__)
 
 
@@ -44,12 +47,36 @@ def create_content(
     return content
 
 
-def create_image_content(images: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+def read_source(
+    attachment: AttachmentDescriptor, transport: Any = None, model_config: Any = None
+) -> Dict[str, Any]:
+    """
+    Build the source of an image or document content item.
+
+    Args:
+        attachment: The image or document descriptor.
+        transport: Optional AttachmentTransport sending large files by S3 reference.
+        model_config: The ModelConfig of the model receiving the attachment.
+
+    Returns:
+        The source: inline bytes, or an S3 location.
+    """
+    if transport:
+        return transport.source(attachment, model_config)
+    with open(attachment.path, "rb") as f:
+        return {"bytes": f.read()}
+
+
+def create_image_content(
+    images: List[AttachmentDescriptor], transport: Any = None, model_config: Any = None
+) -> List[Dict[str, Any]]:
     """
     Create image content for a message.
 
     Args:
-        images: List of images.
+        images: List of image descriptors.
+        transport: Optional AttachmentTransport sending large files by S3 reference.
+        model_config: The ModelConfig of the model receiving the images.
 
     Returns:
         A list of image content items.
@@ -58,71 +85,33 @@ def create_image_content(images: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
 
     for image in images:
         try:
-            logger.debug(f"Processing image: {image['name']} ({image['path']})")
-            with open(image["path"], "rb") as f:
-                image_data = f.read()
-
             # Format the image content according to Bedrock API requirements
             # Using the format from the original app
             image_content.append(
                 {
                     "image": {
-                        "format": get_file_extension(image["type"]),
-                        "source": {"bytes": image_data},
+                        "format": image.format,
+                        "source": read_source(image, transport, model_config),
                     }
                 }
             )
-            logger.debug(
-                f"Successfully encoded image: {image['name']} ({image['type']})"
-            )
+            log_event(logger, logging.DEBUG, "attachment.encoded", name=image.name, format=image.format)
         except Exception as e:
-            logger.error(f"Error creating image content for {image['path']}: {e}")
+            logger.error(f"Error creating image content for {image.path}: {e}")
 
     return image_content
 
 
-def get_file_extension(file_type):
-    """
-    Get the file extension from the MIME type.
-
-    Args:
-        file_type: The MIME type.
-
-    Returns:
-        The file extension.
-    """
-    if not file_type:
-        return ""
-
-    file_extension = file_type.split("/")[1] if "/" in file_type else file_type
-
-    # Map MIME types to file extensions
-    extension_map = {
-        "jpg": "jpeg",
-        "jpeg": "jpeg",
-        "png": "png",
-        "gif": "gif",
-        "webp": "webp",
-        "vnd.ms-excel": "xls",
-        "vnd.openxmlformats-officedocument.spreadsheetml.sheet": "xlsx",
-        "vnd.openxmlformats-officedocument.wordprocessingml.document": "docx",
-        "msword": "doc",
-        "plain": "txt",
-        "markdown": "md",
-        "html": "html",
-        "pdf": "pdf",
-        "csv": "csv",
-    }
-
-    return extension_map.get(file_extension, file_extension)
-
-
-def create_doc_content(docs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+def create_doc_content(
+    docs: List[AttachmentDescriptor], transport: Any = None, model_config: Any = None
+) -> List[Dict[str, Any]]:
     """
     Create document content for a message.
 
     Args:
-        docs: List of documents.
+        docs: List of document descriptors.
+        transport: Optional AttachmentTransport sending large files by S3 reference.
+        model_config: The ModelConfig of the model receiving the documents.
 
     Returns:
         A list of document content items.
@@ -131,52 +120,20 @@ def create_doc_content(docs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
 
     for doc in docs:
         try:
-            logger.debug(f"Processing document: {doc['name']} ({doc['path']})")
-
-            # Determine document format from file type or extension
-            doc_format = get_file_extension(doc["type"]) if doc["type"] else ""
-            if not doc_format:
-                # Try to infer format from file extension
-                if doc["name"].lower().endswith(".txt"):
-                    doc_format = "txt"
-                elif doc["name"].lower().endswith(".pdf"):
-                    doc_format = "pdf"
-                elif doc["name"].lower().endswith(".doc"):
-                    doc_format = "doc"
-                elif doc["name"].lower().endswith(".docx"):
-                    doc_format = "docx"
-                elif doc["name"].lower().endswith(".csv"):
-                    doc_format = "csv"
-                elif doc["name"].lower().endswith(".xls"):
-                    doc_format = "xls"
-                elif doc["name"].lower().endswith(".xlsx"):
-                    doc_format = "xlsx"
-                elif doc["name"].lower().endswith((".html", ".htm")):
-                    doc_format = "html"
-                elif doc["name"].lower().endswith(".md"):
-                    doc_format = "md"
-                else:
-                    doc_format = "txt"  # Default to txt if unknown
-
-            logger.debug(f"Document format determined as: {doc_format}")
-
             # Using the format from the original app
-            with open(doc["path"], "rb") as f:
-                doc_data = f.read()
-
             doc_content.append(
                 {
                     "document": {
-                        "name": sanitize_filename(doc["name"]),
-                        "format": doc_format,
-                        "source": {"bytes": doc_data},
+                        "name": sanitize_filename(doc.name),
+                        "format": doc.format,
+                        "source": read_source(doc, transport, model_config),
                     }
                 }
             )
-            logger.debug(f"Successfully encoded document: {doc['name']} ({doc_format})")
+            log_event(logger, logging.DEBUG, "attachment.encoded", name=doc.name, format=doc.format)
 
         except Exception as e:
-            logger.error(f"Error creating document content for {doc['path']}: {e}")
+            logger.error(f"Error creating document content for {doc.path}: {e}")
 
     return doc_content
 
@@ -0,0 +1,48 @@
+"""
+Utilities for measuring application startup time.
+"""
+
+import time
+import logging
+from contextlib import contextmanager
+from typing import Dict, Iterator
+
+logger = logging.getLogger(__name__)
+
+
+class StartupTimer:
+    """Collects the duration of each startup phase."""
+
+    def __init__(self):
+        """
+        Initialize the timer. The total duration is measured from this point.
+        """
+        self.started_at = time.perf_counter()
+        self.phases: Dict[str, float] = {}
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        """
+        Measure a startup phase.
+
+        Args:
+            name: The name of the phase.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0.0) + (time.perf_counter() - start)
+
+    def report(self) -> str:
+        """
+        Log and return the startup time breakdown.
+
+        Returns:
+            A one-line summary of the startup phases in milliseconds.
+        """
+        total_ms = (time.perf_counter() - self.started_at) * 1000
+        breakdown = ", ".join(f"{name}={duration * 1000:.1f}ms" for name, duration in self.phases.items())
+        summary = f"Startup completed in {total_ms:.1f}ms ({breakdown})"
+        logger.info(summary)
+        return summary
@@ -1,7 +1,7 @@
 import { Construct } from "constructs";
 import * as dynamodb from "aws-cdk-lib/aws-dynamodb";
 import * as s3 from "aws-cdk-lib/aws-s3";
-import { RemovalPolicy } from "aws-cdk-lib";
+import { Duration, RemovalPolicy } from "aws-cdk-lib";
 
 export interface DataLayerProps {
   readonly prefix: string; // Prefix from the configuration
@@ -48,6 +48,14 @@ export class DataLayer extends Construct {
       autoDeleteObjects: true,
       enforceSSL: true, // Enforce SSL/TLS for all requests
       encryption: s3.BucketEncryption.S3_MANAGED, // Enable server-side encryption
+      lifecycleRules: [
+        {
+          // Attachments sent by S3 reference: deleted at chat end, or expired
+          // after the saved conversations referring to them
+          prefix: "attachments/",
+          expiration: Duration.days(2),
+        },
+      ],
     });
   }
 }
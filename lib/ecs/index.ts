@@ -9,7 +9,8 @@ import * as elbv2 from "aws-cdk-lib/aws-elasticloadbalancingv2";
 import * as secretsmanager from "aws-cdk-lib/aws-secretsmanager";
 import * as ssm from "aws-cdk-lib/aws-ssm";
 import * as logs from "aws-cdk-lib/aws-logs";
-import { BedrockModels, BedrockModel } from "../../bin/config";
+import * as cloudwatch from "aws-cdk-lib/aws-cloudwatch";
+import { BedrockModels, BedrockModel, METRICS_NAMESPACE } from "../../bin/config";
 import { ModelPrompts } from "../prompts";
 
 // Interface to define the properties required for the ECS Application construct
@@ -31,6 +32,8 @@ export interface ecsApplicationProps {
   readonly prompts_manager_list: ModelPrompts;
   readonly dynamodb_dataLayer_name_parameter: ssm.StringParameter;
   readonly s3_dataLayer_name_parameter: ssm.StringParameter;
+  readonly minTasks?: number;
+  readonly maxTasks?: number;
 }
 
 export class ecsApplication extends Construct {
@@ -40,6 +43,11 @@ export class ecsApplication extends Construct {
     super(scope, id);
 
     const containerEnvRegion = props.region || "us-west-2";
+    const minTasks = props.minTasks ?? 2;
+    const maxTasks = props.maxTasks ?? 10;
+    if (minTasks < 1 || maxTasks < minTasks) {
+      throw new Error(`Invalid task counts: min_tasks ${minTasks}, max_tasks ${maxTasks}`);
+    }
 
     // Store the client secret
     const authCodeSecret = new secretsmanager.Secret(
@@ -81,6 +89,7 @@ export class ecsApplication extends Construct {
           }),
           environment: {
             AWS_REGION: containerEnvRegion,
+            METRICS_NAMESPACE: METRICS_NAMESPACE,
           },
           secrets: {
             OAUTH_COGNITO_CLIENT_SECRET: ecs.Secret.fromSecretsManager(
@@ -121,7 +130,7 @@ export class ecsApplication extends Construct {
         openListener: false,
         memoryLimitMiB: 1024,
         cpu: 512,
-        desiredCount: 2,
+        desiredCount: minTasks,
         minHealthyPercent: 50,
         runtimePlatform: {
           operatingSystemFamily: ecs.OperatingSystemFamily.LINUX,
@@ -245,7 +254,9 @@ export class ecsApplication extends Construct {
           "s3:PutObject",
           "s3:GetObject",
           "s3:ListBucket",
+          "s3:AbortMultipartUpload",
           "dynamodb:PutItem",
+          "dynamodb:BatchWriteItem",
           "dynamodb:GetItem",
           "dynamodb:Query",
           "dynamodb:Scan",
@@ -255,7 +266,46 @@ export class ecsApplication extends Construct {
       }),
     );
 
+    // Allow the ECS task to delete the attachments it sent by S3 reference
+    // (prefix of the data layer bucket lifecycle rule)
+    this.service.taskDefinition.taskRole.addToPrincipalPolicy(
+      new iam.PolicyStatement({
+        effect: iam.Effect.ALLOW,
+        resources: [
+          `arn:aws:s3:::${props.s3_dataLayer_name_parameter.stringValue}/attachments/*`,
+        ],
+        actions: ["s3:DeleteObject"],
+      }),
+    );
+
     // Enable sticky sessions for the Fargate service
     this.service.targetGroup.enableCookieStickiness(Duration.days(1));
+
+    // Health check on the liveness endpoint. The ALB has no separate readiness
+    // check: a target failing /readyz while saturated would be replaced by ECS
+    // with its streams. Saturation is handled by the LoadFactor scaling below,
+    // /readyz is left to monitoring and external load balancers
+    this.service.targetGroup.configureHealthCheck({ path: "/healthz" });
+
+    // Scale on the load reported by the tasks (streams, queued requests,
+    // event loop lag, memory), not only on CPU
+    const scaling = this.service.service.autoScaleTaskCount({
+      minCapacity: minTasks,
+      maxCapacity: maxTasks,
+    });
+    scaling.scaleOnCpuUtilization("CpuScaling", {
+      targetUtilizationPercent: 70,
+    });
+    scaling.scaleToTrackCustomMetric("LoadScaling", {
+      metric: new cloudwatch.Metric({
+        namespace: METRICS_NAMESPACE,
+        metricName: "LoadFactor",
+        statistic: "Average",
+        period: Duration.minutes(1),
+      }),
+      targetValue: 0.7,
+      scaleInCooldown: Duration.minutes(5),
+      scaleOutCooldown: Duration.minutes(1),
+    });
   }
 }
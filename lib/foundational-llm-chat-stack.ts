@@ -81,6 +81,8 @@ export class FoundationalLlmChatStack extends Stack {
       dynamodb_dataLayer_name_parameter:
         parameters.dynamodb_dataLayer_name_parameter,
       s3_dataLayer_name_parameter: parameters.s3_dataLayer_name_parameter,
+      minTasks: props.config.min_tasks, // Autoscaling task counts from the configuration
+      maxTasks: props.config.max_tasks,
       accountId: props.env?.account,
     });
   }
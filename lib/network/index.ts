@@ -134,6 +134,20 @@ export class Networking extends Construct {
           viewerProtocolPolicy:
             cloudfront.ViewerProtocolPolicy.REDIRECT_TO_HTTPS,
         },
+        // The OpenAI-compatible API is stateless and per caller: never cached, no sticky sessions
+        additionalBehaviors: {
+          "/v1/*": {
+            origin: new origins.LoadBalancerV2Origin(this.publicLoadBalancer, {
+              protocolPolicy: cloudfront.OriginProtocolPolicy.HTTP_ONLY,
+            }),
+            cachePolicy: cloudfront.CachePolicy.CACHING_DISABLED,
+            originRequestPolicy:
+              cloudfront.OriginRequestPolicy.ALL_VIEWER_EXCEPT_HOST_HEADER,
+            allowedMethods: cloudfront.AllowedMethods.ALLOW_ALL,
+            viewerProtocolPolicy:
+              cloudfront.ViewerProtocolPolicy.REDIRECT_TO_HTTPS,
+          },
+        },
         enableLogging: true,
         logBucket: logBucket,
         logFilePrefix: "CloudFrontLogs",